@@ -0,0 +1,4 @@
+"""
+Benchmarks for TextBekharBot
+Run from the project root, e.g. python -m benchmarks.bench_keyboards
+"""
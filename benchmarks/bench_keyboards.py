@@ -0,0 +1,43 @@
+"""
+Keyboard markup microbenchmark
+Compares building and serializing a keyboard on every send against the
+cached JSON served by the static keyboard registry.
+"""
+
+import argparse
+import timeit
+
+from telebot import apihelper
+
+from utils import STATIC_KEYBOARDS
+
+
+def bench_keyboard(get_keyboard, iterations: int):
+    """Return (uncached, cached) microseconds per send for one keyboard"""
+    uncached = timeit.timeit(
+        lambda: apihelper._convert_markup(get_keyboard.build()), number=iterations)
+    cached = timeit.timeit(
+        lambda: apihelper._convert_markup(get_keyboard()), number=iterations)
+    return uncached / iterations * 1e6, cached / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyboard serialization microbenchmark")
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'keyboard':<36}{'per send':>12}{'cached':>12}{'saving':>10}")
+    total_uncached = total_cached = 0.0
+    for get_keyboard in STATIC_KEYBOARDS:
+        uncached, cached = bench_keyboard(get_keyboard, args.iterations)
+        total_uncached += uncached
+        total_cached += cached
+        print(f"{get_keyboard.__name__:<36}{uncached:>10.1f}us{cached:>10.2f}us"
+              f"{uncached / max(cached, 1e-9):>9.0f}x")
+
+    print(f"{'all static keyboards':<36}{total_uncached:>10.1f}us{total_cached:>10.2f}us"
+          f"{total_uncached / max(total_cached, 1e-9):>9.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+"""
+End-to-end update benchmark
+Replays synthetic traffic (registration, catalog browsing, admin user-list
+paging and user searches) through TextBekharBot's real handlers against a
+temporary database. Bot API calls are answered in-process by
+fake_api.FakeTelegramAPI, so nothing leaves the machine.
+
+    python -m benchmarks.bench_updates --updates 5000 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_updates --updates 5000 --compare benchmarks/baseline.json
+"""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Iterator
+
+from telebot import apihelper, types
+
+import metrics
+from bot import TextBekharBot
+from config import PROVINCES, ContentCategory, UserRole
+from fake_api import FakeTelegramAPI, percentile
+from utils import RateLimiter
+
+CATEGORY_BUTTONS = ["🔥 پر بازدید ترین ترک ها", "💰 پکیج اقتصادی", "👑 پکیج مگاهیت VIP"]
+FIRST_NAMES = ['علی', 'محمد', 'زهرا', 'فاطمه', 'حسین', 'مریم', 'رضا', 'سارا', 'امیر', 'نرگس']
+LAST_NAMES = ['احمدی', 'رضایی', 'محمدی', 'حسینی', 'کریمی', 'موسوی', 'جعفری', 'صادقی']
+SEARCH_WORDS = ['عشق', 'باران', 'شب', 'دریا', 'خاطره', 'پاییز']
+
+# Fraction of flows of each kind in the generated traffic
+DEFAULT_MIX = {'registration': 0.2, 'browsing': 0.5, 'paging': 0.15, 'search': 0.15}
+
+
+class StubResponse:
+    """Just enough of requests.Response for telebot's result checks"""
+
+    def __init__(self, status_code: int, body: Dict[str, Any]):
+        self.status_code = status_code
+        self.reason = 'OK' if status_code == 200 else 'Error'
+        self.text = json.dumps(body, ensure_ascii=False)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+def install_stub_transport(api: FakeTelegramAPI):
+    """Answer every Bot API request from the in-process fake"""
+    def send(method, url, params=None, files=None, **kwargs):
+        status, body = api.call(url.rsplit('/', 1)[1], dict(params or {}))
+        return StubResponse(status, body)
+    apihelper.CUSTOM_REQUEST_SENDER = send
+
+
+class TrafficGenerator:
+    """Builds raw updates for interleaved per-user conversations"""
+
+    def __init__(self, seed: int, registered_ids: List[int], admin_ids: List[int]):
+        self.random = random.Random(seed)
+        self.registered_ids = registered_ids
+        self.admin_ids = admin_ids
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._next_new_user = max(registered_ids + admin_ids, default=0) + 1
+
+    def _user(self, user_id: int) -> Dict[str, Any]:
+        return {'id': user_id, 'is_bot': False, 'first_name': 'bench'}
+
+    def _update(self, **payload) -> Dict[str, Any]:
+        update = {'update_id': self._next_update_id, **payload}
+        self._next_update_id += 1
+        return update
+
+    def message(self, user_id: int, text: str = None, **fields) -> Dict[str, Any]:
+        message = {
+            'message_id': self._next_message_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+        }
+        self._next_message_id += 1
+        if text is not None:
+            message['text'] = text
+        message.update(fields)
+        return self._update(message=message)
+
+    def callback(self, user_id: int, data: str) -> Dict[str, Any]:
+        update_id = self._next_update_id
+        return self._update(callback_query={
+            'id': str(update_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'from': self._user(user_id),
+            'message': {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'text': 'panel',
+            },
+        })
+
+    def inline_query(self, user_id: int, query: str, offset: str = '') -> Dict[str, Any]:
+        update_id = self._next_update_id
+        return self._update(inline_query={
+            'id': str(update_id), 'query': query, 'offset': offset, 'from': self._user(user_id)})
+
+    # Conversations; each yields one user's updates in order
+    def registration(self) -> Iterator[Dict[str, Any]]:
+        user_id = self._next_new_user
+        self._next_new_user += 1
+        yield self.message(user_id, '/start', entities=[{'type': 'bot_command', 'offset': 0, 'length': 6}])
+        yield self.message(user_id, contact={
+            'phone_number': f"98912{self.random.randrange(10 ** 7):07d}", 'first_name': 'bench',
+            'user_id': user_id})
+        yield self.message(user_id, self.random.choice(FIRST_NAMES))
+        yield self.message(user_id, self.random.choice(LAST_NAMES))
+        yield self.message(user_id, self.random.choice(PROVINCES))
+
+    def browsing(self) -> Iterator[Dict[str, Any]]:
+        user_id = self.random.choice(self.registered_ids)
+        yield self.message(user_id, '/start', entities=[{'type': 'bot_command', 'offset': 0, 'length': 6}])
+        for _ in range(self.random.randint(1, 4)):
+            yield self.message(user_id, self.random.choice(CATEGORY_BUTTONS))
+        yield self.inline_query(user_id, self.random.choice(SEARCH_WORDS))
+        yield self.inline_query(user_id, self.random.choice(SEARCH_WORDS), offset='20')
+        yield self.message(user_id, self.random.choice(["🏠 صفحه اصلی", "ℹ️ درباره ما", "📞 ارتباط با ما"]))
+
+    def paging(self, admin_id: int) -> Iterator[Dict[str, Any]]:
+        yield self.message(admin_id, "👥 مدیریت کاربران")
+        yield self.message(admin_id, "📋 لیست کاربران")
+        for page in range(2, self.random.randint(3, 8)):
+            yield self.callback(admin_id, f"user_list_{page}")
+        target = self.random.choice(self.registered_ids)
+        yield self.callback(admin_id, f"user_detail_{target}")
+        yield self.callback(admin_id, f"user_stats_{target}")
+
+    def search(self, admin_id: int) -> Iterator[Dict[str, Any]]:
+        search_type, term = self.random.choice([
+            ('name', self.random.choice(FIRST_NAMES)),
+            ('phone', f"0912{self.random.randrange(100):02d}"),
+            ('province', self.random.choice(PROVINCES)),
+        ])
+        yield self.callback(admin_id, 'user_search')
+        yield self.callback(admin_id, f"search_by_{search_type}")
+        yield self.message(admin_id, term)
+
+    def generate(self, total_updates: int, mix: Dict[str, float], concurrency: int) -> List[Dict[str, Any]]:
+        """Interleave up to `concurrency` conversations until total_updates are produced"""
+        kinds = list(mix)
+        weights = [mix[kind] for kind in kinds]
+        free_admins = list(self.admin_ids)
+        active = []
+        updates = []
+
+        while len(updates) < total_updates:
+            while len(active) < concurrency:
+                kind = self.random.choices(kinds, weights)[0]
+                # Each admin runs one conversation at a time, since it lives in their session
+                if kind in ('paging', 'search'):
+                    if not free_admins:
+                        kind = 'browsing'
+                    else:
+                        admin_id = free_admins.pop()
+                        flow = getattr(self, kind)(admin_id)
+                        active.append((flow, admin_id))
+                        continue
+                active.append((getattr(self, kind)(), None))
+
+            index = self.random.randrange(len(active))
+            flow, admin_id = active[index]
+            update = next(flow, None)
+            if update is None:
+                active.pop(index)
+                if admin_id is not None:
+                    free_admins.append(admin_id)
+                continue
+            updates.append(update)
+
+        return updates
+
+
+def seed_database(bot: TextBekharBot, users: int, admins: int, contents: int, seed: int):
+    """Fill the temporary database with users and catalog entries"""
+    rng = random.Random(seed)
+    registered_ids, admin_ids = [], []
+    for index in range(users):
+        user_id = 10_000_000 + index
+        province = rng.choice(PROVINCES)
+        bot.db.create_user(
+            user_id, f"0912{index:07d}", rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+            province, province)
+        registered_ids.append(user_id)
+    for index in range(admins):
+        user_id = 1_000 + index
+        bot.db.create_user(user_id, f"0935{index:07d}", 'مدیر', 'سیستم', 'تهران', 'تهران', UserRole.ADMIN)
+        admin_ids.append(user_id)
+
+    categories = [ContentCategory.TOP_TRACKS, ContentCategory.ECONOMIC_PACKAGE, ContentCategory.VIP_PACKAGE]
+    for index in range(contents):
+        category = categories[index % len(categories)]
+        title = f"{rng.choice(SEARCH_WORDS)} {rng.choice(SEARCH_WORDS)} {index}"
+        if index % 2:
+            bot.db.add_content(category, 'music', title, title=title,
+                               file_id=f"bench-file-{index}", file_type='audio')
+        else:
+            bot.db.add_content(category, 'text', f"{title}\n{' '.join(rng.choices(SEARCH_WORDS, k=30))}",
+                               title=title)
+    return registered_ids, admin_ids
+
+
+def record_handler_timings(bot: TextBekharBot, timings: Dict[str, List[float]]):
+    """Wrap every registered handler so its wall time is appended to timings"""
+    def wrap(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timings[function.__name__].append(time.perf_counter() - started)
+        return timed
+
+    for handlers in (bot.bot.message_handlers, bot.bot.callback_query_handlers, bot.bot.inline_handlers):
+        for handler in handlers:
+            handler['function'] = wrap(handler['function'])
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+    }
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    api = FakeTelegramAPI()
+    install_stub_transport(api)
+
+    with tempfile.TemporaryDirectory() as directory:
+        bot = TextBekharBot('123456:bench', threaded=False, track_offset=False,
+                            db_path=os.path.join(directory, 'bench.db'))
+        # Synthetic users act far faster than people; keep the limiter's cost but not its drops
+        bot.rate_limiter = RateLimiter({'default': (float('inf'), 0.0)}, 0, 0)
+
+        registered_ids, admin_ids = seed_database(bot, args.users, args.admins, args.contents, args.seed)
+        generator = TrafficGenerator(args.seed, registered_ids, admin_ids)
+        raw_updates = generator.generate(args.warmup + args.updates, DEFAULT_MIX, args.concurrency)
+        updates = [types.Update.de_json(update) for update in raw_updates]
+
+        for update in updates[:args.warmup]:
+            bot.bot.process_new_updates([update])
+
+        handler_timings = defaultdict(list)
+        record_handler_timings(bot, handler_timings)
+        update_timings = []
+        queries_before = metrics.DB_QUERIES.total()
+        calls_before = sum(api.method_counts.values())
+
+        started = time.perf_counter()
+        for update in updates[args.warmup:]:
+            update_started = time.perf_counter()
+            bot.bot.process_new_updates([update])
+            update_timings.append(time.perf_counter() - update_started)
+        elapsed = time.perf_counter() - started
+
+        queries = metrics.DB_QUERIES.total() - queries_before
+        calls = sum(api.method_counts.values()) - calls_before
+        bot.shutdown()
+
+    measured = len(update_timings)
+    return {
+        'config': {
+            'updates': args.updates, 'warmup': args.warmup, 'users': args.users, 'admins': args.admins,
+            'contents': args.contents, 'concurrency': args.concurrency, 'seed': args.seed, 'mix': DEFAULT_MIX,
+        },
+        'environment': {
+            'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'machine': platform.machine(),
+        },
+        'seconds': round(elapsed, 3),
+        'updates_per_second': round(measured / elapsed, 1) if elapsed else 0.0,
+        'queries_per_update': round(queries / measured, 2) if measured else 0.0,
+        'api_calls_per_update': round(calls / measured, 2) if measured else 0.0,
+        'update_latency': summarize(update_timings),
+        'handlers': {name: summarize(samples) for name, samples in sorted(handler_timings.items())},
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """List regressions beyond tolerance (a fraction) against a saved baseline"""
+    regressions = []
+    if results['updates_per_second'] < baseline['updates_per_second'] * (1 - tolerance):
+        regressions.append(
+            f"throughput {results['updates_per_second']}/s vs baseline {baseline['updates_per_second']}/s")
+    if results['queries_per_update'] > baseline['queries_per_update'] * (1 + tolerance):
+        regressions.append(
+            f"queries/update {results['queries_per_update']} vs baseline {baseline['queries_per_update']}")
+    for name, stats in results['handlers'].items():
+        base = baseline.get('handlers', {}).get(name)
+        # Ignore handlers too rare for a stable p95, and sub-quarter-millisecond jitter
+        if not base or min(stats['count'], base['count']) < 20:
+            continue
+        if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance) and stats['p95_ms'] - base['p95_ms'] > 0.25:
+            regressions.append(f"{name} p95 {stats['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+    return regressions
+
+
+def print_report(results: Dict[str, Any]):
+    print(f"{results['config']['updates']} updates in {results['seconds']}s: "
+          f"{results['updates_per_second']} updates/s, "
+          f"{results['queries_per_update']} queries/update, "
+          f"{results['api_calls_per_update']} API calls/update")
+    latency = results['update_latency']
+    print(f"update latency p50 {latency['p50_ms']}ms  p95 {latency['p95_ms']}ms  p99 {latency['p99_ms']}ms\n")
+
+    print(f"{'handler':<36}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in sorted(results['handlers'].items(), key=lambda item: -item[1]['p95_ms']):
+        print(f"{name:<36}{stats['count']:>8}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic traffic through the bot's handlers")
+    parser.add_argument('--updates', type=int, default=5000, help="measured updates")
+    parser.add_argument('--warmup', type=int, default=200, help="unmeasured updates run first")
+    parser.add_argument('--users', type=int, default=2000, help="registered users to seed")
+    parser.add_argument('--admins', type=int, default=20, help="admin accounts to seed")
+    parser.add_argument('--contents', type=int, default=300, help="catalog entries to seed")
+    parser.add_argument('--concurrency', type=int, default=50, help="conversations interleaved at once")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save-baseline', help="write results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown as a fraction")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    print_report(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(results, baseline_file, ensure_ascii=False, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Bulk fixture generator for load testing
+Creates a database with the bot's schema and fills users,
+contents and user_sessions with realistic Persian data. Rows are written
+with batched executemany inside large transactions, and the same seed
+and --anchor date always produce the same database.
+
+    python -m benchmarks.generate_fixtures --db /tmp/load.db --users 1000000 --contents 5000
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, Tuple, List
+
+from config import PROVINCES, PROVINCE_CITIES, ContentCategory, UserRole
+from database import DatabaseManager
+
+FIRST_NAMES = [
+    'علی', 'محمد', 'حسین', 'رضا', 'مهدی', 'امیر', 'حسن', 'محمدرضا', 'سعید', 'مجید',
+    'احمد', 'عباس', 'جواد', 'مصطفی', 'امیرحسین', 'آرش', 'بهنام', 'پویا', 'سینا', 'کیان',
+    'زهرا', 'فاطمه', 'مریم', 'سارا', 'نرگس', 'مهسا', 'الهام', 'نازنین', 'سمیرا', 'لیلا',
+    'معصومه', 'زینب', 'ریحانه', 'پریسا', 'نیلوفر', 'شیما', 'هانیه', 'یاسمن', 'آیدا', 'ترانه',
+]
+LAST_NAMES = [
+    'احمدی', 'محمدی', 'رضایی', 'حسینی', 'کریمی', 'موسوی', 'جعفری', 'صادقی', 'رحیمی', 'هاشمی',
+    'قاسمی', 'ابراهیمی', 'نوری', 'کاظمی', 'اکبری', 'یوسفی', 'عباسی', 'مرادی', 'رستمی', 'شریفی',
+    'طاهری', 'سلیمانی', 'باقری', 'نجفی', 'زارعی', 'فرهادی', 'مومنی‌زاده', 'پورمحمدی', 'خسروی', 'امینی',
+]
+TITLE_WORDS = [
+    'عشق', 'باران', 'شب', 'دریا', 'خاطره', 'پاییز', 'بهار', 'دل', 'آسمان', 'رویا',
+    'جاده', 'تنهایی', 'ستاره', 'ماه', 'نگاه', 'سکوت', 'غروب', 'شهر', 'قلب', 'فردا',
+]
+MOBILE_PREFIXES = ['0912', '0913', '0915', '0916', '0917', '0919', '0935', '0936', '0937', '0939', '0901', '0902']
+
+# Realistic shares of the user base
+SUPER_ADMIN_COUNT = 2
+ADMIN_RATIO = 0.001
+INACTIVE_RATIO = 0.02
+HISTORY_DAYS = 730
+
+
+def _timestamp(moment: datetime) -> str:
+    # Same layout as SQLite's CURRENT_TIMESTAMP
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def generate_users(rng: random.Random, count: int, now: datetime) -> Iterator[Tuple]:
+    """Yield users rows; user ids and phones are unique, roles follow the usual mix"""
+    user_ids = rng.sample(range(10 ** 8, 8 * 10 ** 9), count)
+    admin_count = max(1, int(count * ADMIN_RATIO)) if count > SUPER_ADMIN_COUNT else 0
+
+    for index, user_id in enumerate(user_ids):
+        if index < min(SUPER_ADMIN_COUNT, count):
+            role = UserRole.SUPER_ADMIN
+        elif index < SUPER_ADMIN_COUNT + admin_count:
+            role = UserRole.ADMIN
+        else:
+            role = UserRole.USER
+
+        province = rng.choice(PROVINCES)
+        # Skew sign-ups towards recent months like a growing bot
+        created = now - timedelta(seconds=int(HISTORY_DAYS * 86400 * rng.random() ** 2))
+        updated = created + timedelta(seconds=rng.randrange(0, max(int((now - created).total_seconds()), 1)))
+        yield (
+            user_id,
+            f"+98{rng.choice(MOBILE_PREFIXES)[1:]}{index:07d}",
+            rng.choice(FIRST_NAMES),
+            rng.choice(LAST_NAMES),
+            province,
+            PROVINCE_CITIES.get(province, province),
+            role,
+            _timestamp(created),
+            _timestamp(updated),
+            0 if rng.random() < INACTIVE_RATIO else 1,
+        )
+
+
+def generate_contents(rng: random.Random, count: int, category_ids: List[int],
+                      admin_ids: List[int], now: datetime) -> Iterator[Tuple]:
+    """Yield contents rows: mostly audio tracks, the rest lyric texts"""
+    for index in range(count):
+        title = ' '.join(rng.sample(TITLE_WORDS, rng.randint(2, 4)))
+        created = _timestamp(now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400)))
+        created_by = rng.choice(admin_ids) if admin_ids else None
+        if rng.random() < 0.6:
+            file_type = 'audio' if rng.random() < 0.8 else 'document'
+            yield (rng.choice(category_ids), 'music', title, title, None,
+                   f"fixture-{file_type}-{index}", rng.randrange(2 * 10 ** 6, 12 * 10 ** 6),
+                   created_by, created, created, 1 if rng.random() > 0.05 else 0, file_type)
+        else:
+            lyric = '\n'.join(' '.join(rng.choices(TITLE_WORDS, k=rng.randint(4, 8)))
+                              for _ in range(rng.randint(4, 16)))
+            yield (rng.choice(category_ids), 'text', lyric, title, None, None, None,
+                   created_by, created, created, 1 if rng.random() > 0.05 else 0, None)
+
+
+def generate_sessions(rng: random.Random, user_ids: List[int], now: datetime) -> Iterator[Tuple]:
+    """Yield user_sessions rows: half-finished registrations and admin actions, some expired"""
+    for user_id in user_ids:
+        if rng.random() < 0.7:
+            data = {'step': rng.choice(['phone', 'first_name', 'last_name', 'province']),
+                    'registration_started': True,
+                    'registration_data': {'phone': f"0912{rng.randrange(10 ** 7):07d}"}}
+        else:
+            data = {'admin_action': rng.choice(['search_users', 'add_admin', 'send_message']),
+                    'step': 'input', 'category': None}
+        created = now - timedelta(hours=rng.uniform(0, 48))
+        yield (user_id, json.dumps(data), _timestamp(created), _timestamp(created + timedelta(hours=24)))
+
+
+def insert_batched(conn: sqlite3.Connection, sql: str, rows: Iterator[Tuple],
+                   batch_size: int, label: str) -> int:
+    """executemany in batches, committing every batch so the WAL stays bounded"""
+    total = 0
+    started = time.perf_counter()
+    while True:
+        batch = [row for _, row in zip(range(batch_size), rows)]
+        if not batch:
+            break
+        conn.executemany(sql, batch)
+        conn.commit()
+        total += len(batch)
+        elapsed = time.perf_counter() - started
+        print(f"\r{label}: {total:,} rows ({total / max(elapsed, 1e-9) * 60:,.0f} rows/min)",
+              end='', flush=True)
+    print()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate large fixture databases for load tests")
+    parser.add_argument('--db', required=True, help="database file to create")
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--contents', type=int, default=5_000)
+    parser.add_argument('--sessions', type=int, default=None, help="defaults to 5%% of users")
+    parser.add_argument('--batch-size', type=int, default=50_000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--anchor', default=datetime.now().strftime('%Y-%m-%d'),
+                        help="date all timestamps are relative to (YYYY-MM-DD)")
+    parser.add_argument('--overwrite', action='store_true', help="delete an existing database first")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        if not args.overwrite:
+            sys.exit(f"{args.db} already exists; pass --overwrite to replace it")
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    # Let the bot create its own schema, categories and triggers
+    DatabaseManager(args.db, profile=False).close()
+
+    rng = random.Random(args.seed)
+    now = datetime.strptime(args.anchor, '%Y-%m-%d')
+    conn = sqlite3.connect(args.db)
+    # Throwaway data: durability is not worth the fsyncs
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -200000')
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+    started = time.perf_counter()
+    users = list(generate_users(rng, args.users, now))
+    insert_batched(conn, '''
+        INSERT INTO users (user_id, phone, first_name, last_name, province, city, role,
+                           created_at, updated_at, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', iter(users), args.batch_size, 'users')
+
+    admin_ids = [row[0] for row in users if row[6] != UserRole.USER]
+    category_ids = [row[0] for row in conn.execute(
+        'SELECT id FROM content_categories WHERE name IN (?, ?, ?)',
+        (ContentCategory.TOP_TRACKS, ContentCategory.ECONOMIC_PACKAGE, ContentCategory.VIP_PACKAGE))]
+    insert_batched(conn, '''
+        INSERT INTO contents (category_id, type, content, title, description, file_id, file_size,
+                              created_by, created_at, updated_at, is_active, file_type)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', generate_contents(rng, args.contents, category_ids, admin_ids, now), args.batch_size, 'contents')
+
+    session_count = args.sessions if args.sessions is not None else args.users // 20
+    session_users = rng.sample([row[0] for row in users], min(session_count, len(users)))
+    insert_batched(conn, '''
+        INSERT INTO user_sessions (user_id, session_data, created_at, expires_at)
+        VALUES (?, ?, ?, ?)
+    ''', generate_sessions(rng, session_users, now), args.batch_size, 'user_sessions')
+
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    print(f"Done in {time.perf_counter() - started:.1f}s: {args.db}")
+
+
+if __name__ == '__main__':
+    main()
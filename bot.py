@@ -1,43 +1,296 @@
+import functools
 import logging
 import os
-from typing import Optional, Dict, Any, List
-from telebot import TeleBot, types
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Callable, Tuple
+from telebot import TeleBot, apihelper, types
 from telebot.apihelper import ApiTelegramException
 
-from config import BOT_TOKEN, Messages, ContentCategory, UserRole, PROVINCE_CITIES
+from config import (
+    BOT_TOKEN, DATABASE_PATH, TELEGRAM_API_URL, Messages, MenuButtons, ContentCategory, UserRole, PROVINCE_CITIES,
+    INLINE_RESULTS_PER_PAGE, INLINE_CACHE_TIME, INLINE_RESULT_CACHE_TTL, RESTRICTED_CATEGORIES,
+    UPDATE_BATCH_SIZE, RECENT_UPDATES_SIZE, SHUTDOWN_TIMEOUT,
+    USERS_PER_PAGE, SEARCH_RESULT_LIMIT, CALLBACK_STATE_TTL,
+    RATE_LIMITS, RATE_LIMIT_COALESCE_WINDOW, RATE_LIMIT_NOTICE_INTERVAL,
+    VIEW_FLUSH_INTERVAL, VIEW_FLUSH_BATCH, TOP_TRACKS_LIMIT, SCHEDULER_SEND_INTERVAL,
+    ACTIVITY_FLUSH_INTERVAL, ACTIVITY_FLUSH_BATCH, REPORT_DEFAULT_DAYS, IMPORT_MAX_FILE_SIZE,
+    UPLOAD_BATCH_DELAY
+)
 from database import DatabaseManager
+from views import PanelManager
+from rollups import RollupManager, install_error_rollup
+from logging_config import log_context
+import metrics
 from utils import (
     InputValidator, KeyboardManager, MessageFormatter,
-    SessionManager, ValidationError
-)
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+    SessionManager, CallbackStateStore, TTLCache, RecentIdSet, RateLimiter, StartupTimer,
+    ViewCounter, ActivityTracker, UploadBatcher, ValidationError
 )
+from validators import normalize_phone
 
 logger = logging.getLogger(__name__)
 
+if TELEGRAM_API_URL:
+    apihelper.API_URL = TELEGRAM_API_URL.rstrip('/') + '/bot{0}/{1}'
+    apihelper.FILE_URL = TELEGRAM_API_URL.rstrip('/') + '/file/bot{0}/{1}'
+
+
+class BekharTeleBot(TeleBot):
+    """TeleBot that persists its polling offset and drops redelivered updates"""
+
+    OFFSET_KEY = 'last_update_id'
+
+    def __init__(self, token: str, db: DatabaseManager, track_offset: bool = True,
+                 update_filter: Optional[Callable[[types.Update], bool]] = None, **kwargs):
+        super().__init__(token, **kwargs)
+        self.db = db
+        self.track_offset = track_offset
+        self.update_filter = update_filter
+        self.recent_updates = RecentIdSet(RECENT_UPDATES_SIZE)
+        self._stop_requested = threading.Event()
+
+        # Sharded workers leave the offset to the supervisor that polls for them
+        stored_offset = self.db.get_state(self.OFFSET_KEY) if track_offset else None
+        if stored_offset:
+            self.last_update_id = int(stored_offset)
+            logger.info(f"Resuming from update_id {self.last_update_id}")
+
+    def process_new_updates(self, updates: List[types.Update]):
+        """Commit the batch offset, then dispatch only unseen updates"""
+        if not updates:
+            return
+
+        fresh_updates = [
+            update for update in updates
+            if update.update_id > self.last_update_id
+            and self.recent_updates.add(update.update_id)
+        ]
+
+        # Commit before dispatching so a crash never replays side effects
+        batch_max_id = max(update.update_id for update in updates)
+        if batch_max_id > self.last_update_id:
+            self.last_update_id = batch_max_id
+            if self.track_offset:
+                self.db.set_state(self.OFFSET_KEY, str(batch_max_id))
+
+        skipped = len(updates) - len(fresh_updates)
+        if skipped:
+            logger.info(f"Skipped {skipped} already processed updates")
+
+        # Handlers only see the message or query, so lend it the update id for logging
+        for update in fresh_updates:
+            for payload in vars(update).values():
+                if isinstance(payload, types.JsonDeserializable):
+                    payload.update_id = update.update_id
+
+        if self.update_filter:
+            fresh_updates = [update for update in fresh_updates if self.update_filter(update)]
+
+        if fresh_updates:
+            super().process_new_updates(fresh_updates)
+
+    @property
+    def stop_requested(self) -> bool:
+        return self._stop_requested.is_set()
+
+    def stop_polling(self):
+        self._stop_requested.set()
+        super().stop_polling()
+
+    def catch_up(self, batch_size: int = UPDATE_BATCH_SIZE) -> int:
+        """Process updates queued while the bot was down, one batch at a time"""
+        total = 0
+        error_interval = 0.25
+        while not self._stop_requested.is_set():
+            try:
+                updates = self.get_updates(
+                    offset=self.last_update_id + 1, limit=batch_size, long_polling_timeout=0)
+            except Exception as e:
+                # Same backoff as the polling loop, so a network error at start-up is not fatal
+                logger.error(f"Error catching up on updates: {e}")
+                self._stop_requested.wait(error_interval)
+                error_interval = min(error_interval * 2, 60)
+                continue
+            error_interval = 0.25
+            self.process_new_updates(updates)
+            total += len(updates)
+            if len(updates) < batch_size:
+                break
+
+        if total:
+            logger.info(f"Caught up on {total} pending updates")
+        return total
+
 
 class TextBekharBot:
     """Main bot class with clean architecture"""
 
-    def __init__(self, token: str = BOT_TOKEN):
-        self.bot = TeleBot(token)
-        self.db = DatabaseManager()
+    def __init__(self, token: str = BOT_TOKEN, threaded: bool = True, track_offset: bool = True,
+                 db_path: str = DATABASE_PATH, started_at: Optional[float] = None,
+                 background: bool = True):
+        # started_at lets main.py count interpreter start-up and imports too;
+        # background=False leaves the scheduler and rollup refresh to another process
+        self.startup = StartupTimer(started_at)
+        self.startup.mark('imports')
+
+        self.db = DatabaseManager(db_path)
+        self.startup.mark('database')
+        self.bot = BekharTeleBot(
+            token, self.db, track_offset=track_offset,
+            update_filter=self._filter_update, threaded=threaded)
         self.session_manager = SessionManager(self.db)
         self.validator = InputValidator()
         self.keyboard_manager = KeyboardManager()
         self.formatter = MessageFormatter()
+        self.inline_cache = TTLCache(INLINE_RESULT_CACHE_TTL)
+        self.callback_states = CallbackStateStore(self.db, CALLBACK_STATE_TTL)
+        self.panels = PanelManager(self.bot)
+        self.rate_limiter = RateLimiter(
+            RATE_LIMITS, RATE_LIMIT_COALESCE_WINDOW, RATE_LIMIT_NOTICE_INTERVAL)
+        self.role_cache = TTLCache(60, max_size=10000)
+        self._shutdown_hooks = []
+        self._is_shut_down = False
+
+        self.view_counter = ViewCounter(
+            self.db, VIEW_FLUSH_INTERVAL, VIEW_FLUSH_BATCH, TOP_TRACKS_LIMIT)
+        self.view_counter.start()
+        self.add_shutdown_hook('view counts', self.view_counter.stop)
+
+        self.activity = ActivityTracker(self.db, ACTIVITY_FLUSH_INTERVAL, ACTIVITY_FLUSH_BATCH)
+        self.activity.start()
+        self.add_shutdown_hook('activity', self.activity.stop)
+
+        self.rollups = RollupManager(self.db, refresh=background)
+        install_error_rollup(self.rollups)
+        self.rollups.start()
+        self.add_shutdown_hook('rollups', self.rollups.stop)
+
+        # Without the timer thread, jobs scheduled here are stored and run by the process that has it
+        if background:
+            self.scheduler.start()
+            self.add_shutdown_hook('scheduler', self.scheduler.stop)
+
+        self.uploads = UploadBatcher(self._add_music_batch, UPLOAD_BATCH_DELAY)
+        self.uploads.start()
+        self.add_shutdown_hook('uploads', self.uploads.stop)
+
+        self.startup.mark('bot')
 
         self._setup_handlers()
+        self._instrument_handlers()
+        self.startup.mark('handlers')
+
+        # Keyboards build lazily anyway; prebuilding them should not delay the first poll
+        threading.Thread(
+            target=self.keyboard_manager.warm_up, name='KeyboardWarmUp', daemon=True).start()
         logger.info("Bot initialized successfully")
 
+    # Admin-only subsystems are imported on first use so they do not delay the first poll
+    @functools.cached_property
+    def segments(self):
+        from segments import SegmentManager
+        return SegmentManager(self.db)
+
+    @functools.cached_property
+    def scheduler(self):
+        from scheduler import Scheduler
+        return Scheduler(self.db, self._run_scheduled_job)
+
+    def _instrument_handlers(self):
+        """Record latency, errors and log context of every registered handler"""
+        metrics.install_error_log_counter()
+        metrics.instrument_telegram_api()
+
+        for handlers in (self.bot.message_handlers, self.bot.callback_query_handlers,
+                         self.bot.inline_handlers, self.bot.chosen_inline_handlers):
+            for handler in handlers:
+                handler['function'] = self._wrap_handler(handler['function'])
+
+        if self.bot.threaded:
+            metrics.QUEUE_DEPTH.set_function(
+                lambda: self.bot.worker_pool.tasks.qsize(), queue='worker_pool')
+
+    # Category buttons that resend a whole category of files
+    CONTENT_BUTTONS = {MenuButtons.TOP_TRACKS, MenuButtons.ECONOMIC_PACKAGE, MenuButtons.VIP_PACKAGE}
+
+    def _is_exempt_from_limits(self, user_id: int) -> bool:
+        """Admins are never rate limited"""
+        role = self.role_cache.get(user_id)
+        if role is None:
+            user = self.db.get_user(user_id)
+            role = user['role'] if user else ''
+            self.role_cache.set(user_id, role)
+        return role in [UserRole.ADMIN, UserRole.SUPER_ADMIN]
+
+    def _filter_update(self, update: types.Update) -> bool:
+        """Note the sender as active, then apply the rate limiter"""
+        payload = (update.message or update.edited_message or update.callback_query
+                   or update.inline_query or update.chosen_inline_result)
+        user = getattr(payload, 'from_user', None)
+        if user:
+            self.activity.record(user.id)
+        return self._admit_update(update)
+
+    def _admit_update(self, update: types.Update) -> bool:
+        """Anti-flood gate run before dispatch; False drops the update"""
+        try:
+            if update.callback_query:
+                call = update.callback_query
+                user_id, action, fingerprint = call.from_user.id, 'callback', call.data
+            elif update.inline_query:
+                query = update.inline_query
+                user_id, action = query.from_user.id, 'inline'
+                fingerprint = f"{query.query}\n{query.offset}"
+            elif update.message and update.message.from_user:
+                message = update.message
+                user_id, fingerprint = message.from_user.id, message.text
+                action = 'content' if message.text in self.CONTENT_BUTTONS else 'default'
+            else:
+                return True
+
+            if self._is_exempt_from_limits(user_id):
+                return True
+
+            decision = self.rate_limiter.check(user_id, action, fingerprint)
+            if decision == RateLimiter.ALLOW:
+                return True
+
+            notify = decision == RateLimiter.THROTTLED and self.rate_limiter.should_notify(user_id)
+            if update.callback_query:
+                # Always answer so the button stops spinning
+                self.bot.answer_callback_query(
+                    update.callback_query.id, Messages.RATE_LIMITED if notify else None)
+            elif notify and update.message:
+                self.bot.send_message(update.message.chat.id, Messages.RATE_LIMITED)
+
+            logger.info(f"Dropped {action} update {update.update_id} from user {user_id}: {decision}")
+            return False
+        except Exception as e:
+            logger.error(f"Error in rate limiter: {e}")
+            return True
+
+    def _wrap_handler(self, function):
+        """Time a handler and tag its log records with the update, user and handler"""
+        name = function.__name__
+        timed = metrics.timed_handler(name, function)
+
+        @functools.wraps(function)
+        def handler(update_part, *args, **kwargs):
+            user = getattr(update_part, 'from_user', None)
+            with log_context(update_id=getattr(update_part, 'update_id', None),
+                             user_id=getattr(user, 'id', None), handler=name):
+                try:
+                    return timed(update_part, *args, **kwargs)
+                finally:
+                    if not self.startup.finished:
+                        report = self.startup.finish()
+                        if report:
+                            logger.info(f"Startup timing: {report}")
+        return handler
+
     def _setup_handlers(self):
         """Setup all bot handlers"""
         # Command handlers
@@ -47,6 +300,14 @@ class TextBekharBot:
             self.handle_make_admin)
         self.bot.message_handler(commands=['myid'])(self.handle_my_id)
         self.bot.message_handler(commands=['send'])(self.handle_send_command)
+        self.bot.message_handler(commands=['sqlstats'])(self.handle_sql_stats)
+        self.bot.message_handler(commands=['segment'])(self.handle_segment_command)
+        self.bot.message_handler(commands=['segments'])(self.handle_segments_list)
+        self.bot.message_handler(commands=['schedule'])(self.handle_schedule_command)
+        self.bot.message_handler(commands=['jobs'])(self.handle_jobs_list)
+        self.bot.message_handler(commands=['unschedule'])(self.handle_unschedule_command)
+        self.bot.message_handler(commands=['report'])(self.handle_report)
+        self.bot.message_handler(commands=['bulk'])(self.handle_bulk_command)
 
         # Contact handler
         self.bot.message_handler(
@@ -63,11 +324,11 @@ class TextBekharBot:
         # Main menu handlers - Professional layout
         self.bot.message_handler(
             func=lambda m: m.text == "🏠 صفحه اصلی")(self.handle_home)
-        self.bot.message_handler(func=lambda m: m.text == "🔥 پر بازدید ترین ترک ها")(
+        self.bot.message_handler(func=lambda m: m.text == MenuButtons.TOP_TRACKS)(
             self.handle_top_tracks)
-        self.bot.message_handler(func=lambda m: m.text == "💰 پکیج اقتصادی")(
+        self.bot.message_handler(func=lambda m: m.text == MenuButtons.ECONOMIC_PACKAGE)(
             self.handle_economic_package)
-        self.bot.message_handler(func=lambda m: m.text == "👑 پکیج مگاهیت VIP")(
+        self.bot.message_handler(func=lambda m: m.text == MenuButtons.VIP_PACKAGE)(
             self.handle_vip_package)
         self.bot.message_handler(func=lambda m: m.text == "📞 ارتباط با ما")(
             self.handle_contact_us)
@@ -119,11 +380,15 @@ class TextBekharBot:
             self.handle_system_settings)
         self.bot.message_handler(func=lambda m: m.text == "🔧 ابزارها")(
             self.handle_system_tools)
+        self.bot.message_handler(func=lambda m: m.text == "📋 گزارش‌ها")(
+            self.handle_report)
 
         # Content addition handlers
         self._setup_content_handlers()
 
         # File handlers
+        self.bot.message_handler(content_types=['document'], func=self._is_admin_importing_users)(
+            self.handle_import_document)
         self.bot.message_handler(content_types=[
                                  'audio', 'document'], func=self._is_admin_adding_music)(self.handle_admin_music)
 
@@ -148,6 +413,8 @@ class TextBekharBot:
             'make_admin_'))(self.handle_make_admin_callback)
         self.bot.callback_query_handler(func=lambda call: call.data.startswith(
             'make_user_'))(self.handle_make_user_callback)
+        self.bot.callback_query_handler(func=lambda call: call.data.startswith(
+            'bulk_'))(self.handle_bulk_callback)
         self.bot.callback_query_handler(func=lambda call: call.data.startswith(
             'user_stats_'))(self.handle_user_stats_callback)
         self.bot.callback_query_handler(func=lambda call: call.data.startswith(
@@ -156,6 +423,17 @@ class TextBekharBot:
             self.handle_user_search_callback)
         self.bot.callback_query_handler(func=lambda call: call.data.startswith(
             'search_by_'))(self.handle_search_type_callback)
+        self.bot.callback_query_handler(func=lambda call: call.data in (
+            'export_users', 'export_contents'))(self.handle_export_callback)
+        self.bot.callback_query_handler(func=lambda call: call.data == 'import_users')(
+            self.handle_import_callback)
+
+        # Inline catalog search
+        self.bot.inline_handler(func=lambda query: True)(
+            self.handle_inline_query)
+        # Picks from inline search are the play signal; needs /setinlinefeedback in @BotFather
+        self.bot.chosen_inline_handler(func=lambda result: True)(
+            self.handle_chosen_inline_result)
 
         # Search input handlers
         self.bot.message_handler(func=self._is_admin_searching)(
@@ -164,6 +442,8 @@ class TextBekharBot:
         # Admin message input handler
         self.bot.message_handler(func=self._is_admin_sending_message)(
             self.handle_admin_message_input)
+        self.bot.message_handler(func=self._is_admin_scheduling_message)(
+            self.handle_scheduled_message_input)
 
         # Default handler
         self.bot.message_handler(func=lambda m: True)(self.handle_default)
@@ -210,10 +490,17 @@ class TextBekharBot:
                 session.get('step') == 'music' and
                 self.db.is_admin(message.from_user.id))
 
+    def _is_admin_importing_users(self, message):
+        """Check if admin is sending a CSV of users to import"""
+        session = self.session_manager.get_admin_session(message.from_user.id)
+        return (session.get('admin_action') == 'import_users' and
+                session.get('step') == 'file' and
+                self.db.is_admin(message.from_user.id))
+
     def _is_admin_adding_text(self, message):
-        """Check if admin is adding text"""
+        """Check if admin is adding text, or the text of a music file"""
         session = self.session_manager.get_admin_session(message.from_user.id)
-        return (session.get('admin_action') == 'add_text' and
+        return (session.get('admin_action') in ('add_text', 'add_music') and
                 session.get('step') == 'text' and
                 self.db.is_admin(message.from_user.id))
 
@@ -238,6 +525,13 @@ class TextBekharBot:
                 session.get('step') == 'message' and
                 self.db.is_admin(message.from_user.id))
 
+    def _is_admin_scheduling_message(self, message):
+        """Check if admin is writing a scheduled message"""
+        session = self.session_manager.get_admin_session(message.from_user.id)
+        return (session.get('admin_action') == 'schedule_message' and
+                session.get('step') == 'message' and
+                self.db.is_admin(message.from_user.id))
+
     # Command handlers
     def handle_start(self, message):
         """Handle /start command"""
@@ -285,6 +579,7 @@ class TextBekharBot:
         try:
             user_id = message.from_user.id
             success = self.db.update_user_role(user_id, UserRole.SUPER_ADMIN)
+            self.role_cache.delete(user_id)
 
             if success:
                 self.bot.send_message(
@@ -336,6 +631,294 @@ class TextBekharBot:
             self.bot.send_message(
                 message.chat.id, self.formatter.format_error_message())
 
+    def handle_sql_stats(self, message):
+        """Handle /sqlstats [total|max|count|rows] [reset] for admins"""
+        try:
+            if not self.db.is_admin(message.from_user.id):
+                self.bot.send_message(
+                    message.chat.id, self.formatter.format_error_message("permission_denied"))
+                return
+
+            if not self.db.profiler:
+                self.bot.send_message(
+                    message.chat.id,
+                    "📊 پروفایلر SQL غیرفعال است. برای فعال‌سازی SQL_PROFILING=1 را تنظیم کنید.")
+                return
+
+            args = message.text.split()[1:]
+            order_by = next((arg for arg in args if arg in ('total', 'max', 'count', 'rows')), 'total')
+
+            self.bot.send_message(
+                message.chat.id,
+                self.formatter.format_query_stats(self.db.profiler.report(10, order_by), order_by))
+
+            if 'reset' in args:
+                self.db.profiler.reset()
+                self.bot.send_message(message.chat.id, "✅ آمار کوئری‌ها پاک شد.")
+
+        except Exception as e:
+            logger.error(f"Error in handle_sql_stats: {e}")
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_error_message("general"))
+
+    def handle_segment_command(self, message):
+        """Handle /segment <definition>, /segment save <name> <definition> and /segment delete <name>"""
+        from segments import SegmentError
+        try:
+            if not self.db.is_admin(message.from_user.id):
+                self.bot.send_message(
+                    message.chat.id, self.formatter.format_error_message("permission_denied"))
+                return
+
+            parts = message.text.split(None, 1)
+            args = parts[1].strip() if len(parts) > 1 else ''
+            if not args:
+                self.bot.send_message(message.chat.id, Messages.SEGMENT_HELP)
+                return
+
+            action, _, rest = args.partition(' ')
+            if action == 'save':
+                name, _, definition = rest.strip().partition(' ')
+                if not name or not definition.strip():
+                    self.bot.send_message(message.chat.id, Messages.SEGMENT_HELP)
+                    return
+                member_count = self.segments.save(name, definition.strip(), message.from_user.id)
+                self.bot.send_message(
+                    message.chat.id, f"✅ بخش «{name}» با {member_count:,} کاربر ذخیره شد.")
+            elif action == 'delete':
+                name = rest.strip()
+                if self.db.delete_segment(name):
+                    self.bot.send_message(message.chat.id, f"✅ بخش «{name}» حذف شد.")
+                else:
+                    self.bot.send_message(message.chat.id, f"❌ بخشی با نام «{name}» یافت نشد.")
+            else:
+                # Preview a definition or a saved segment without saving anything
+                definition = self.segments.resolve(args)
+                self.bot.send_message(
+                    message.chat.id,
+                    f"👥 تعداد کاربران این بخش: {self.segments.count(definition):,}\n\n{definition}")
+
+        except SegmentError as e:
+            self.bot.send_message(message.chat.id, f"❌ تعریف بخش نامعتبر است: {e}")
+        except Exception as e:
+            logger.error(f"Error in handle_segment_command: {e}")
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_error_message("general"))
+
+    def handle_segments_list(self, message):
+        """Handle /segments: saved segments with their member counts"""
+        try:
+            if not self.db.is_admin(message.from_user.id):
+                self.bot.send_message(
+                    message.chat.id, self.formatter.format_error_message("permission_denied"))
+                return
+
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_segment_list(self.segments.list()))
+
+        except Exception as e:
+            logger.error(f"Error in handle_segments_list: {e}")
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_error_message("general"))
+
+    def handle_schedule_command(self, message):
+        """Handle /schedule <when> <user_id|segment>; the text is asked for next"""
+        from segments import SegmentError, compile_segment
+        from scheduler import parse_run_at
+        try:
+            if not self.db.is_admin(message.from_user.id):
+                self.bot.send_message(
+                    message.chat.id, self.formatter.format_error_message("permission_denied"))
+                return
+
+            parts = message.text.split(None, 2)
+            if len(parts) < 3:
+                self.bot.send_message(message.chat.id, Messages.SCHEDULE_HELP)
+                return
+
+            try:
+                run_at = parse_run_at(parts[1])
+            except ValueError:
+                self.bot.send_message(
+                    message.chat.id, "❌ زمان نامعتبر است.\n\n" + Messages.SCHEDULE_HELP)
+                return
+
+            target = parts[2].strip()
+            if target.isdigit():
+                target_user = self.db.get_user(int(target))
+                if not target_user:
+                    self.bot.send_message(
+                        message.chat.id, f"❌ کاربر با شناسه {target} در سیستم یافت نشد.")
+                    return
+                audience = f"{target_user.get('first_name', 'نامشخص')} {target_user.get('last_name', '')}"
+            else:
+                # Saved segments are resolved again at send time, so later sign-ups are included
+                compile_segment(self.segments.resolve(target))
+                audience = f"{self.segments.count(self.segments.resolve(target), active_only=True):,} کاربر فعلی"
+
+            self.session_manager.start_admin_action(
+                message.from_user.id, 'schedule_message')
+            self.session_manager.update_admin_session(message.from_user.id, {
+                'run_at': run_at.timestamp(),
+                'target': target,
+                'step': 'message'
+            })
+
+            self.bot.send_message(
+                message.chat.id,
+                f"⏰ پیام زمان‌بندی شده\n\n"
+                f"📅 زمان ارسال: {run_at.strftime('%Y/%m/%d %H:%M')}\n"
+                f"🎯 گیرنده: {target} ({audience})\n\n"
+                f"لطفا پیام خود را ارسال کنید:"
+            )
+
+        except SegmentError as e:
+            self.bot.send_message(message.chat.id, f"❌ تعریف بخش نامعتبر است: {e}")
+        except Exception as e:
+            logger.error(f"Error in handle_schedule_command: {e}")
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_error_message("general"))
+
+    def handle_jobs_list(self, message):
+        """Handle /jobs: upcoming and recent scheduled messages"""
+        try:
+            if not self.db.is_admin(message.from_user.id):
+                self.bot.send_message(
+                    message.chat.id, self.formatter.format_error_message("permission_denied"))
+                return
+
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_job_list(self.db.list_scheduled_jobs()))
+
+        except Exception as e:
+            logger.error(f"Error in handle_jobs_list: {e}")
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_error_message("general"))
+
+    def handle_unschedule_command(self, message):
+        """Handle /unschedule <job_id>"""
+        try:
+            if not self.db.is_admin(message.from_user.id):
+                self.bot.send_message(
+                    message.chat.id, self.formatter.format_error_message("permission_denied"))
+                return
+
+            parts = message.text.split()
+            if len(parts) < 2 or not parts[1].lstrip('#').isdigit():
+                self.bot.send_message(message.chat.id, "استفاده: /unschedule [job_id]")
+                return
+
+            job_id = int(parts[1].lstrip('#'))
+            if self.scheduler.cancel(job_id):
+                self.bot.send_message(message.chat.id, f"✅ پیام #{job_id} لغو شد.")
+            else:
+                self.bot.send_message(
+                    message.chat.id, f"❌ پیام در انتظاری با شناسه #{job_id} یافت نشد.")
+
+        except Exception as e:
+            logger.error(f"Error in handle_unschedule_command: {e}")
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_error_message("general"))
+
+    # An explicit id list such as "77126477, 5123456789" instead of a segment
+    _BULK_IDS = re.compile(r'^\d+(?:[\s,]+\d+)*$')
+
+    def handle_bulk_command(self, message):
+        """Handle /bulk <action> <segment|ids>: preview the change, then ask for confirmation"""
+        from segments import SegmentError, compile_segment
+        try:
+            if not self.db.is_admin(message.from_user.id):
+                self.bot.send_message(
+                    message.chat.id, self.formatter.format_error_message("permission_denied"))
+                return
+
+            parts = message.text.split(None, 2)
+            if len(parts) == 2 and parts[1] == 'log':
+                self.bot.send_message(
+                    message.chat.id, self.formatter.format_admin_actions(self.db.list_admin_actions()))
+                return
+            if len(parts) < 3 or parts[1] not in self.db.BULK_USER_ACTIONS:
+                self.bot.send_message(message.chat.id, Messages.BULK_HELP)
+                return
+
+            action, target = parts[1], parts[2].strip()
+            if self._BULK_IDS.match(target):
+                user_ids = re.split(r'[\s,]+', target)
+                definition = f"user_id in ({', '.join(user_ids)})"
+            else:
+                definition = self.segments.resolve(target)
+            # Relative dates are fixed now, so the confirmed action hits the previewed users
+            where, params = compile_segment(definition)
+            count, sample = self.db.preview_bulk_user_action(
+                action, where, params, message.from_user.id)
+            if not count:
+                self.bot.send_message(message.chat.id, "👥 هیچ کاربری با این عملیات تغییر نمی‌کند.")
+                return
+
+            token = self.callback_states.create({
+                'action': action, 'target': target, 'where': where, 'params': params,
+                'admin_id': message.from_user.id,
+            })
+            self.panels.show(
+                message.chat.id,
+                self.formatter.format_bulk_preview(action, target, count, sample),
+                self.keyboard_manager.get_bulk_confirm_keyboard(token))
+
+        except SegmentError as e:
+            self.bot.send_message(message.chat.id, f"❌ تعریف بخش نامعتبر است: {e}")
+        except Exception as e:
+            logger.error(f"Error in handle_bulk_command: {e}")
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_error_message("general"))
+
+    def handle_bulk_callback(self, call):
+        """Handle bulk_confirm_<token> / bulk_cancel_<token> from a /bulk preview"""
+        try:
+            if not self.db.is_admin(call.from_user.id):
+                self.bot.answer_callback_query(
+                    call.id, "شما دسترسی لازم را ندارید. ❌")
+                return
+
+            _, choice, token = call.data.split('_', 2)
+            state = self.callback_states.get(token)
+            if not state or state['admin_id'] != call.from_user.id:
+                self.bot.answer_callback_query(call.id, "⌛ این پیش‌نمایش منقضی شده است.")
+                return
+
+            # Consume the token first so a double tap cannot run the action twice
+            if not self.callback_states.consume(token):
+                self.bot.answer_callback_query(call.id, "⌛ این پیش‌نمایش منقضی شده است.")
+                return
+
+            if choice == 'cancel':
+                self.panels.show(call.message.chat.id, "❌ عملیات گروهی لغو شد.",
+                                 message_id=call.message.message_id)
+                self.bot.answer_callback_query(call.id)
+                return
+
+            action = state['action']
+            user_ids = self.db.bulk_update_users(
+                action, state['where'], state['params'], call.from_user.id, state['target'])
+            if user_ids is None:
+                self.bot.answer_callback_query(call.id, "خطا در اجرای عملیات. ❌")
+                return
+
+            for user_id in user_ids:
+                self.role_cache.delete(user_id)
+            self.rollups.record('bulk_actions', action, len(user_ids))
+            logger.info(f"Admin {call.from_user.id} ran bulk {action} on {len(user_ids)} users")
+
+            self.panels.show(
+                call.message.chat.id,
+                f"✅ {self.formatter.BULK_ACTION_LABELS[action]}: {len(user_ids):,} کاربر تغییر کرد.\n"
+                f"🎯 {state['target']}",
+                message_id=call.message.message_id)
+            self.bot.answer_callback_query(call.id)
+
+        except Exception as e:
+            logger.error(f"Error in handle_bulk_callback: {e}")
+            self.bot.answer_callback_query(call.id, "خطایی رخ داده است. ❌")
+
     def handle_send_command(self, message):
         """Handle /send command for messaging users"""
         try:
@@ -405,13 +988,23 @@ class TextBekharBot:
                 return
 
             user_id = message.from_user.id
-            phone = message.contact.phone_number
+            # Anyone can forward someone else's contact card; only the sender's own number counts
+            if message.contact.user_id != user_id:
+                self.bot.send_message(message.chat.id, Messages.PHONE_NOT_OWN)
+                return
 
-            if not self.validator.validate_phone_number(phone):
+            phone = normalize_phone(message.contact.phone_number)
+            if not phone:
                 self.bot.send_message(
                     message.chat.id, self.formatter.format_error_message("invalid_input"))
                 return
 
+            holder = self.db.get_user_by_phone(phone)
+            if holder and holder['user_id'] != user_id:
+                logger.warning(f"User {user_id} tried to register the phone of user {holder['user_id']}")
+                self.bot.send_message(message.chat.id, Messages.PHONE_TAKEN)
+                return
+
             # Update registration data
             self.session_manager.update_registration_data(
                 user_id, {'phone': phone})
@@ -578,15 +1171,20 @@ class TextBekharBot:
         try:
             users = self.db.get_all_users()
             total_users = len(users)
-            active_users = len([u for u in users if u.get('is_active', 1)])
             admins = len([u for u in users if u['role']
                          in ['admin', 'super_admin']])
 
+            # Include interactions still buffered in memory
+            self.activity.flush()
+            active = self.db.get_active_user_counts()
+
             stats_text = f"""📊 آمار کلی سیستم
 
 👥 کاربران:
 • کل کاربران: {total_users} نفر
-• کاربران فعال: {active_users} نفر
+• کاربران فعال ۲۴ ساعت اخیر: {active['day']} نفر
+• کاربران فعال ۷ روز اخیر: {active['week']} نفر
+• کاربران فعال ۳۰ روز اخیر: {active['month']} نفر
 • ادمین‌ها: {admins} نفر
 
 📁 محتوا:
@@ -677,11 +1275,152 @@ class TextBekharBot:
 
         tools_text = """🔧 ابزارهای سیستم
 
-در حال توسعه...
+📤 خروجی CSV فشرده (gzip) از کاربران یا محتوا:
 
 🔙 برای بازگشت از دکمه بازگشت استفاده کنید."""
 
-        self.bot.send_message(message.chat.id, tools_text)
+        self.bot.send_message(
+            message.chat.id, tools_text,
+            reply_markup=self.keyboard_manager.get_tools_keyboard())
+
+    def handle_export_callback(self, call):
+        """Handle export callbacks: build the CSV on disk and upload it"""
+        from exports import build_export, MAX_UPLOAD_BYTES
+        try:
+            if not self.db.is_admin(call.from_user.id):
+                self.bot.answer_callback_query(
+                    call.id, "شما دسترسی لازم را ندارید. ❌")
+                return
+
+            kind = call.data.split('_', 1)[1]
+            self.bot.answer_callback_query(call.id, "در حال آماده‌سازی فایل... ⏳")
+            self.bot.send_chat_action(call.message.chat.id, 'upload_document')
+
+            path, file_name, count = build_export(self.db, kind)
+            if not path:
+                self.bot.send_message(
+                    call.message.chat.id, self.formatter.format_error_message("file_error"))
+                return
+
+            try:
+                if os.path.getsize(path) > MAX_UPLOAD_BYTES:
+                    self.bot.send_message(
+                        call.message.chat.id,
+                        "❌ حجم فایل خروجی از محدودیت ۵۰ مگابایت تلگرام بیشتر است.")
+                    return
+                with open(path, 'rb') as document:
+                    self.bot.send_document(
+                        call.message.chat.id, document, visible_file_name=file_name,
+                        caption=f"📤 {file_name}\n📊 {count:,} ردیف")
+            finally:
+                os.remove(path)
+
+        except Exception as e:
+            logger.error(f"Error in handle_export_callback: {e}")
+            self.bot.send_message(
+                call.message.chat.id, self.formatter.format_error_message("general"))
+
+    def handle_report(self, message):
+        """Handle /report [days | start end] and the reports button"""
+        try:
+            if not self.db.is_admin(message.from_user.id):
+                self.bot.send_message(
+                    message.chat.id, self.formatter.format_error_message("permission_denied"))
+                return
+
+            args = message.text.split()[1:] if message.text.startswith('/') else []
+            try:
+                if len(args) >= 2:
+                    start = datetime.strptime(args[0], '%Y-%m-%d').date()
+                    end = datetime.strptime(args[1], '%Y-%m-%d').date()
+                else:
+                    days = int(args[0]) if args else REPORT_DEFAULT_DAYS
+                    if days < 1:
+                        raise ValueError(days)
+                    end = datetime.now().date()
+                    start = end - timedelta(days=days - 1)
+            except ValueError:
+                self.bot.send_message(
+                    message.chat.id,
+                    "استفاده: /report [تعداد روز] یا /report [YYYY-MM-DD] [YYYY-MM-DD]")
+                return
+            if start > end:
+                start, end = end, start
+
+            totals = self.rollups.report(start.isoformat(), end.isoformat())
+            category_names = {
+                category: self.db.get_category_display_name(category) or category
+                for category in (ContentCategory.TOP_TRACKS, ContentCategory.ECONOMIC_PACKAGE,
+                                 ContentCategory.VIP_PACKAGE)
+            }
+            self.bot.send_message(
+                message.chat.id,
+                self.formatter.format_rollup_report(
+                    totals, start.isoformat(), end.isoformat(), category_names),
+                reply_markup=self.keyboard_manager.get_tools_keyboard())
+
+        except Exception as e:
+            logger.error(f"Error in handle_report: {e}")
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_error_message("general"))
+
+    def handle_import_callback(self, call):
+        """Handle import callback: wait for the admin's CSV document"""
+        try:
+            if not self.db.is_admin(call.from_user.id):
+                self.bot.answer_callback_query(
+                    call.id, "شما دسترسی لازم را ندارید. ❌")
+                return
+
+            self.session_manager.start_admin_action(call.from_user.id, 'import_users')
+            self.session_manager.update_admin_session(call.from_user.id, {'step': 'file'})
+            self.bot.answer_callback_query(call.id)
+            self.bot.send_message(call.message.chat.id, Messages.IMPORT_HELP)
+
+        except Exception as e:
+            logger.error(f"Error in handle_import_callback: {e}")
+            self.bot.answer_callback_query(call.id, "خطایی رخ داده است. ❌")
+
+    def handle_import_document(self, message):
+        """Download an admin's CSV and import it in chunks"""
+        import tempfile
+        from imports import UserImporter
+        path = None
+        report = None
+        try:
+            document = message.document
+            if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+                self.bot.send_message(
+                    message.chat.id, "❌ حجم فایل بیشتر از ۲۰ مگابایت است. لطفا آن را تقسیم کنید.")
+                return
+
+            self.session_manager.clear_admin_session(message.from_user.id)
+            self.bot.send_chat_action(message.chat.id, 'typing')
+            file_info = self.bot.get_file(document.file_id)
+            handle, path = tempfile.mkstemp(suffix='.csv', prefix='import-')
+            with os.fdopen(handle, 'wb') as target:
+                target.write(self.bot.download_file(file_info.file_path))
+
+            report = UserImporter(self.db).run(path)
+            if report['earliest_created_at']:
+                # Imported sign-up dates fall before the rollup watermark
+                self.rollups.rewind(report['earliest_created_at'][:10])
+            self.bot.send_message(message.chat.id, self.formatter.format_import_report(report))
+
+            if report['error_path']:
+                with open(report['error_path'], 'rb') as errors:
+                    self.bot.send_document(
+                        message.chat.id, errors, visible_file_name='import-errors.csv',
+                        caption="❌ فهرست کامل خطاها")
+
+        except Exception as e:
+            logger.error(f"Error in handle_import_document: {e}")
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_error_message("file_error"))
+        finally:
+            for leftover in (path, report and report['error_path']):
+                if leftover and os.path.exists(leftover):
+                    os.remove(leftover)
 
     # Main menu handlers
     def handle_top_tracks(self, message):
@@ -703,7 +1442,11 @@ class TextBekharBot:
     def _handle_content_request(self, message, category: str):
         """Handle content request for any category"""
         try:
-            contents = self.db.get_content_by_category(category)
+            if not self.db.get_user(message.from_user.id):
+                self.bot.send_message(message.chat.id, Messages.REGISTRATION_REQUIRED)
+                return
+
+            contents, ranked = self._get_category_contents(category)
             category_display = self.db.get_category_display_name(category)
 
             if not category_display:
@@ -715,6 +1458,8 @@ class TextBekharBot:
             text_content = self.formatter.format_content_list(
                 contents, category_display)
             self.bot.send_message(message.chat.id, text_content)
+            for content in contents.get('text', []):
+                self.view_counter.record(content)
 
             # Send music files
             for music_content in contents.get('music', []):
@@ -722,6 +1467,8 @@ class TextBekharBot:
                     try:
                         self.bot.send_document(
                             message.chat.id, music_content['file_id'])
+                        # Tracks served from the ranking itself are views only, or the list would feed itself
+                        self.view_counter.record(music_content, played=not ranked)
                     except ApiTelegramException as e:
                         logger.error(f"Error sending music file: {e}")
                         continue
@@ -731,6 +1478,20 @@ class TextBekharBot:
             self.bot.send_message(
                 message.chat.id, self.formatter.format_error_message())
 
+    def _get_category_contents(self, category: str) -> Tuple[Dict[str, List[Dict[str, Any]]], bool]:
+        """Contents of a category, and whether its tracks came from the most-played ranking"""
+        contents = self.db.get_content_by_category(category)
+        if category == ContentCategory.TOP_TRACKS:
+            # Live promotions are not category-checked, so filter restricted tracks here
+            ranked_tracks = self.db.get_contents_by_ids(
+                self.view_counter.top(TOP_TRACKS_LIMIT * 2),
+                exclude_categories=RESTRICTED_CATEGORIES)[:TOP_TRACKS_LIMIT]
+            if ranked_tracks:
+                # Curated text items stay; only the track list follows the ranking
+                contents['music'] = ranked_tracks
+                return contents, True
+        return contents, False
+
     # Admin panel handlers
     def handle_admin_panel(self, message):
         """Handle admin panel request"""
@@ -856,26 +1617,43 @@ class TextBekharBot:
             return
 
         try:
-            # Get first page of users
-            result = self.db.get_users_paginated(page=1, per_page=10)
-            users = result['users']
-            total_users = result['total']
-            total_pages = result['total_pages']
+            message_text, keyboard = self._build_user_list_page(1)
 
-            # Format message and keyboard
-            message_text = self.formatter.format_professional_user_list(
-                users, 1, total_pages, total_users)
-            keyboard = self.keyboard_manager.get_user_list_keyboard(
-                users, 1, total_pages)
-
-            self.bot.send_message(
-                message.chat.id, message_text, reply_markup=keyboard, parse_mode='Markdown')
+            self.panels.show(
+                message.chat.id, message_text, keyboard, parse_mode='Markdown')
 
         except Exception as e:
             logger.error(f"Error in handle_list_users: {e}")
             self.bot.send_message(
                 message.chat.id, self.formatter.format_error_message())
 
+    def _build_user_list_page(self, page: int, state_token: str = None):
+        """Build the user list text and keyboard for one page"""
+        state = self.callback_states.get(state_token)
+
+        if state:
+            # Page through the cached search results instead of searching again
+            user_ids = state['user_ids']
+            total_users = len(user_ids)
+            total_pages = (total_users + USERS_PER_PAGE - 1) // USERS_PER_PAGE
+            page = min(max(page, 1), max(total_pages, 1))
+            start = (page - 1) * USERS_PER_PAGE
+            users = self.db.get_users_by_ids(user_ids[start:start + USERS_PER_PAGE])
+            search = state.get('search')
+        else:
+            result = self.db.get_users_paginated(page=page, per_page=USERS_PER_PAGE)
+            users = result['users']
+            total_users = result['total']
+            total_pages = result['total_pages']
+            search = None
+            state_token = None
+
+        message_text = self.formatter.format_professional_user_list(
+            users, page, total_pages, total_users, search)
+        keyboard = self.keyboard_manager.get_user_list_keyboard(
+            users, page, total_pages, state_token)
+        return message_text, keyboard
+
     def handle_add_admin_prompt(self, message):
         """Handle add admin prompt"""
         if not self.db.is_admin(message.from_user.id):
@@ -929,6 +1707,7 @@ class TextBekharBot:
 
             # Update user role to admin
             success = self.db.update_user_role(admin_id, UserRole.ADMIN)
+            self.role_cache.delete(admin_id)
 
             if success:
                 user_name = f"{existing_user.get('first_name', 'نامشخص')} {existing_user.get('last_name', 'نامشخص')}"
@@ -957,6 +1736,7 @@ class TextBekharBot:
 
         self.session_manager.start_admin_action(
             message.from_user.id, f'add_{content_type}', category)
+        self.session_manager.update_admin_session(message.from_user.id, {'step': content_type})
 
         if content_type == 'music':
             self.bot.send_message(
@@ -966,7 +1746,7 @@ class TextBekharBot:
                 message.chat.id, "لطفا متن اولیه را وارد کنید. 📝")
 
     def handle_admin_music(self, message):
-        """Handle admin music upload"""
+        """Collect admin music uploads; files sent together are added as one batch"""
         try:
             user_id = message.from_user.id
             session = self.session_manager.get_admin_session(user_id)
@@ -974,32 +1754,85 @@ class TextBekharBot:
             if not session or session.get('admin_action') != 'add_music':
                 return
 
-            # Get file info
-            if message.audio:
-                file_id = message.audio.file_id
-                file_size = message.audio.file_size
-            elif message.document:
-                file_id = message.document.file_id
-                file_size = message.document.file_size
-            else:
+            item = self._music_item(message)
+            if item is None:
                 self.bot.send_message(
                     message.chat.id, "لطفا فایل موزیک ارسال کنید.")
                 return
 
-            # Update session
+            # Album parts share a media_group_id but arrive as separate updates
+            self.uploads.add((message.chat.id, user_id), item)
+
+        except Exception as e:
+            logger.error(f"Error in handle_admin_music: {e}")
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_error_message())
+
+    @staticmethod
+    def _music_item(message) -> Optional[Dict[str, Any]]:
+        """File details of a music message, titled from its audio metadata or file name"""
+        if message.audio:
+            media, file_type = message.audio, 'audio'
+            title = ' - '.join(part for part in (media.performer, media.title) if part)
+        elif message.document:
+            media, file_type = message.document, 'document'
+            title = ''
+        else:
+            return None
+        title = title or os.path.splitext(media.file_name or '')[0]
+        return {
+            'file_id': media.file_id,
+            'file_size': media.file_size,
+            'file_type': file_type,
+            'title': title or None,
+            'caption': message.caption,
+            'message_id': message.message_id,
+            'media_group_id': message.media_group_id,
+        }
+
+    def _add_music_batch(self, key, items: List[Dict[str, Any]]):
+        """Add a batch of music files in one transaction and confirm it with one reply"""
+        chat_id, user_id = key
+        session = self.session_manager.get_admin_session(user_id)
+        if session.get('admin_action') != 'add_music':
+            return
+
+        # Updates of one album may be handled out of order by the worker pool
+        items.sort(key=lambda item: item['message_id'])
+        for item in items:
+            caption = self.validator.sanitize_text(item['caption'])
+            item['content'] = caption if self.validator.validate_content_text(caption) else None
+
+        if len(items) == 1 and not items[0]['content']:
+            # A lone file without a caption still asks for its text
+            item = items[0]
             self.session_manager.update_admin_session(user_id, {
-                'file_id': file_id,
-                'file_size': file_size,
+                'file_id': item['file_id'],
+                'file_size': item['file_size'],
+                'file_type': item['file_type'],
+                'title': item['title'],
                 'step': 'text'
             })
-
             self.bot.send_message(
-                message.chat.id, "موزیک دریافت شد. حالا لطفا متن اولیه را وارد کنید. 📝")
+                chat_id, "موزیک دریافت شد. حالا لطفا متن اولیه را وارد کنید. 📝")
+            return
 
-        except Exception as e:
-            logger.error(f"Error in handle_admin_music: {e}")
+        for item in items:
+            item['content'] = item['content'] or item['title'] or "بدون عنوان"
+        category = session.get('category', '')
+        if self.db.add_contents(category, 'music', items, user_id) is None:
             self.bot.send_message(
-                message.chat.id, self.formatter.format_error_message())
+                chat_id, self.formatter.format_error_message("database_error"))
+            return
+
+        self.inline_cache.clear()
+        self.session_manager.clear_admin_session(user_id)
+        groups = len({item['media_group_id'] for item in items if item['media_group_id']})
+        logger.info(f"Admin {user_id} added {len(items)} files to {category} ({groups} albums)")
+        self.bot.send_message(
+            chat_id, self.formatter.format_upload_summary(
+                self.db.get_category_display_name(category) or category,
+                [item['title'] or item['content'] for item in items]))
 
     def handle_admin_text(self, message):
         """Handle admin text input"""
@@ -1022,12 +1855,15 @@ class TextBekharBot:
                 category_name=session.get('category', ''),
                 content_type=session.get('admin_action').replace('add_', ''),
                 content=text,
+                title=session.get('title'),
                 file_id=session.get('file_id'),
                 file_size=session.get('file_size'),
-                created_by=user_id
+                created_by=user_id,
+                file_type=session.get('file_type')
             )
 
             if success:
+                self.inline_cache.clear()
                 self.bot.send_message(
                     message.chat.id, self.formatter.format_success_message("content_added"))
             else:
@@ -1055,34 +1891,29 @@ class TextBekharBot:
                     call.id, "شما دسترسی لازم را ندارید. ❌")
                 return
 
-            data_parts = call.data.split('_')
-            if len(data_parts) >= 3:
-                page = int(data_parts[2])
-                search = data_parts[3] if len(
-                    data_parts) > 3 and data_parts[3] else None
-            else:
-                page = 1
-                search = None
+            # user_list_<page>_<state token>
+            data_parts = call.data.split('_', 3)
+            if len(data_parts) < 3 or not data_parts[2].isdigit():
+                self.bot.answer_callback_query(call.id)
+                return
 
-            result = self.db.get_users_paginated(
-                page=page, per_page=10, search=search)
-            users = result['users']
-            total_users = result['total']
-            total_pages = result['total_pages']
+            page = int(data_parts[2])
+            state_token = data_parts[3] if len(data_parts) > 3 else None
 
-            message_text = self.formatter.format_professional_user_list(
-                users, page, total_pages, total_users, search)
-            keyboard = self.keyboard_manager.get_user_list_keyboard(
-                users, page, total_pages, search)
+            notice = None
+            if state_token and self.callback_states.get(state_token) is None:
+                notice = "⌛ نتایج جستجو منقضی شده است."
 
-            self.bot.edit_message_text(
-                message_text,
+            message_text, keyboard = self._build_user_list_page(page, state_token)
+
+            self.panels.show(
                 call.message.chat.id,
-                call.message.message_id,
-                reply_markup=keyboard,
-                parse_mode='Markdown'
+                message_text,
+                keyboard,
+                parse_mode='Markdown',
+                message_id=call.message.message_id
             )
-            self.bot.answer_callback_query(call.id)
+            self.bot.answer_callback_query(call.id, notice)
 
         except Exception as e:
             logger.error(f"Error in handle_user_list_callback: {e}")
@@ -1110,12 +1941,12 @@ class TextBekharBot:
                 not user.get('is_active', 1)
             )
 
-            self.bot.edit_message_text(
-                message_text,
+            self.panels.show(
                 call.message.chat.id,
-                call.message.message_id,
-                reply_markup=keyboard,
-                parse_mode='Markdown'
+                message_text,
+                keyboard,
+                parse_mode='Markdown',
+                message_id=call.message.message_id
             )
             self.bot.answer_callback_query(call.id)
 
@@ -1179,6 +2010,7 @@ class TextBekharBot:
 
             user_id = int(call.data.split('_')[2])
             success = self.db.update_user_role(user_id, UserRole.ADMIN)
+            self.role_cache.delete(user_id)
 
             if success:
                 self.bot.answer_callback_query(
@@ -1203,6 +2035,7 @@ class TextBekharBot:
 
             user_id = int(call.data.split('_')[2])
             success = self.db.update_user_role(user_id, UserRole.USER)
+            self.role_cache.delete(user_id)
 
             if success:
                 self.bot.answer_callback_query(
@@ -1239,12 +2072,12 @@ class TextBekharBot:
                 not user.get('is_active', 1)
             )
 
-            self.bot.edit_message_text(
-                message_text,
+            self.panels.show(
                 call.message.chat.id,
-                call.message.message_id,
-                reply_markup=keyboard,
-                parse_mode='Markdown'
+                message_text,
+                keyboard,
+                parse_mode='Markdown',
+                message_id=call.message.message_id
             )
             self.bot.answer_callback_query(call.id)
 
@@ -1277,14 +2110,14 @@ class TextBekharBot:
 
             target_name = f"{target_user.get('first_name', 'نامشخص')} {target_user.get('last_name', 'نامشخص')}"
 
-            self.bot.edit_message_text(
+            self.panels.show(
+                call.message.chat.id,
                 f"💬 ارسال پیام به کاربر\n\n"
                 f"👤 گیرنده: {target_name}\n"
                 f"🆔 شناسه: {user_id}\n"
                 f"📞 شماره: {target_user.get('phone', 'نامشخص')}\n\n"
                 f"لطفا پیام خود را ارسال کنید:",
-                call.message.chat.id,
-                call.message.message_id
+                message_id=call.message.message_id
             )
             self.bot.answer_callback_query(
                 call.id, "حالا پیام خود را ارسال کنید")
@@ -1303,11 +2136,11 @@ class TextBekharBot:
 
             keyboard = self.keyboard_manager.get_user_search_keyboard()
 
-            self.bot.edit_message_text(
-                "🔍 جستجوی کاربران\n\nلطفا نوع جستجو را انتخاب کنید:",
+            self.panels.show(
                 call.message.chat.id,
-                call.message.message_id,
-                reply_markup=keyboard
+                "🔍 جستجوی کاربران\n\nلطفا نوع جستجو را انتخاب کنید:",
+                keyboard,
+                message_id=call.message.message_id
             )
             self.bot.answer_callback_query(call.id)
 
@@ -1344,10 +2177,10 @@ class TextBekharBot:
             prompt = search_prompts.get(
                 search_type, 'لطفا عبارت جستجو را وارد کنید:')
 
-            self.bot.edit_message_text(
-                f"🔍 جستجوی کاربران\n\n{prompt}",
+            self.panels.show(
                 call.message.chat.id,
-                call.message.message_id
+                f"🔍 جستجوی کاربران\n\n{prompt}",
+                message_id=call.message.message_id
             )
             self.bot.answer_callback_query(call.id)
 
@@ -1367,38 +2200,26 @@ class TextBekharBot:
             search_term = message.text.strip()
             search_type = session.get('search_type', 'name')
 
-            # Perform search based on type
-            if search_type == 'role':
-                # For role search, we need to modify the database query
-                result = self.db.get_users_paginated(
-                    page=1, per_page=50, search=None)
-                # Filter by role
-                filtered_users = [
-                    user for user in result['users'] if user['role'] == search_term]
-                result['users'] = filtered_users
-                result['total'] = len(filtered_users)
-            else:
-                result = self.db.get_users_paginated(
-                    page=1, per_page=50, search=search_term)
-
-            users = result['users']
-            total_users = result['total']
-            total_pages = result['total_pages']
+            user_ids = self.db.search_user_ids(
+                search_term, search_type, limit=SEARCH_RESULT_LIMIT)
 
-            if not users:
-                self.bot.send_message(
+            if not user_ids:
+                self.panels.show(
                     message.chat.id,
                     f"🔍 هیچ کاربری با '{search_term}' یافت نشد.",
-                    reply_markup=self.keyboard_manager.get_user_search_keyboard()
+                    self.keyboard_manager.get_user_search_keyboard()
                 )
             else:
-                message_text = self.formatter.format_professional_user_list(
-                    users, 1, total_pages, total_users, search_term)
-                keyboard = self.keyboard_manager.get_user_list_keyboard(
-                    users, 1, total_pages, search_term)
+                # Keep the result set server-side; buttons only carry a short token
+                state_token = self.callback_states.create({
+                    'search': search_term,
+                    'search_type': search_type,
+                    'user_ids': user_ids
+                })
+                message_text, keyboard = self._build_user_list_page(1, state_token)
 
-                self.bot.send_message(
-                    message.chat.id, message_text, reply_markup=keyboard, parse_mode='Markdown')
+                self.panels.show(
+                    message.chat.id, message_text, keyboard, parse_mode='Markdown')
 
             # Clear search session
             self.session_manager.clear_admin_session(user_id)
@@ -1408,6 +2229,59 @@ class TextBekharBot:
             self.bot.send_message(
                 message.chat.id, self.formatter.format_error_message())
 
+    def handle_inline_query(self, inline_query):
+        """Handle inline catalog search (@bot query)"""
+        try:
+            # Same gate as the menu: only registered, active users see the catalog
+            if not self.db.get_user(inline_query.from_user.id):
+                self.bot.answer_inline_query(
+                    inline_query.id, [], cache_time=INLINE_CACHE_TIME, is_personal=True,
+                    button=types.InlineQueryResultsButton(
+                        Messages.INLINE_REGISTER_BUTTON, start_parameter='register'))
+                return
+
+            query = self.validator.sanitize_text(inline_query.query)
+            try:
+                offset = max(int(inline_query.offset or 0), 0)
+            except ValueError:
+                offset = 0
+
+            cache_key = (query, offset)
+            contents = self.inline_cache.get(cache_key)
+            if contents is None:
+                # Fetch one extra row to know whether another page exists
+                contents = self.db.search_contents(
+                    query, limit=INLINE_RESULTS_PER_PAGE + 1, offset=offset,
+                    exclude_categories=RESTRICTED_CATEGORIES)
+                self.inline_cache.set(cache_key, contents)
+
+            page = contents[:INLINE_RESULTS_PER_PAGE]
+            has_more = len(contents) > INLINE_RESULTS_PER_PAGE
+            next_offset = str(offset + len(page)) if has_more else ''
+
+            self.bot.answer_inline_query(
+                inline_query.id,
+                self.keyboard_manager.get_inline_search_results(page),
+                cache_time=INLINE_CACHE_TIME,
+                is_personal=True,
+                next_offset=next_offset
+            )
+
+        except Exception as e:
+            logger.error(f"Error in handle_inline_query: {e}")
+
+    def handle_chosen_inline_result(self, result):
+        """Count a track a user picked from inline search as a play"""
+        try:
+            if not result.result_id.isdigit():
+                return
+            contents = self.db.get_contents_by_ids([int(result.result_id)])
+            if contents and contents[0].get('file_id'):
+                self.view_counter.record(contents[0], played=True)
+
+        except Exception as e:
+            logger.error(f"Error in handle_chosen_inline_result: {e}")
+
     def handle_admin_message_input(self, message):
         """Handle admin message input to send to user"""
         try:
@@ -1425,20 +2299,12 @@ class TextBekharBot:
                     message.chat.id, "❌ پیام نمی‌تواند خالی باشد.")
                 return
 
-            # Get admin info
-            admin_user = self.db.get_user(user_id)
-            admin_name = f"{admin_user.get('first_name', 'ادمین')} {admin_user.get('last_name', '')}"
-
-            # Format message for target user
-            formatted_message = f"📨 پیام از ادمین\n\n"
-            formatted_message += f"👤 فرستنده: {admin_name}\n"
-            formatted_message += f"📅 تاریخ: {self._get_current_time()}\n\n"
-            formatted_message += f"💬 پیام:\n{message_text}\n\n"
-            formatted_message += f"📞 برای پاسخ، با ادمین تماس بگیرید."
+            formatted_message = self._format_admin_message(user_id, message_text)
 
             try:
                 # Send message to target user
                 self.bot.send_message(target_user_id, formatted_message)
+                self.rollups.record('admin_messages', 'direct')
 
                 # Confirm to admin
                 target_user = self.db.get_user(target_user_id)
@@ -1470,20 +2336,174 @@ class TextBekharBot:
             self.bot.send_message(
                 message.chat.id, self.formatter.format_error_message())
 
+    def _format_admin_message(self, admin_id: int, message_text: str) -> str:
+        """Wrap an admin's text the way users receive it"""
+        admin_user = self.db.get_user(admin_id) or {}
+        admin_name = f"{admin_user.get('first_name', 'ادمین')} {admin_user.get('last_name', '')}"
+
+        formatted_message = f"📨 پیام از ادمین\n\n"
+        formatted_message += f"👤 فرستنده: {admin_name}\n"
+        formatted_message += f"📅 تاریخ: {self._get_current_time()}\n\n"
+        formatted_message += f"💬 پیام:\n{message_text}\n\n"
+        formatted_message += f"📞 برای پاسخ، با ادمین تماس بگیرید."
+        return formatted_message
+
+    def handle_scheduled_message_input(self, message):
+        """Store the text of a message scheduled with /schedule"""
+        try:
+            user_id = message.from_user.id
+            session = self.session_manager.get_admin_session(user_id)
+            message_text = (message.text or '').strip()
+
+            if not message_text:
+                self.bot.send_message(
+                    message.chat.id, "❌ پیام نمی‌تواند خالی باشد.")
+                return
+
+            job_id = self.scheduler.schedule(
+                session['run_at'], session['target'], message_text, user_id)
+            self.session_manager.clear_admin_session(user_id)
+            if job_id is None:
+                self.bot.send_message(
+                    message.chat.id, self.formatter.format_error_message("database_error"))
+                return
+
+            run_at = datetime.fromtimestamp(session['run_at']).strftime('%Y/%m/%d %H:%M')
+            self.bot.send_message(
+                message.chat.id,
+                f"⏰ پیام #{job_id} برای {run_at} زمان‌بندی شد.\n\n"
+                f"🎯 گیرنده: {session['target']}\n"
+                f"برای لغو: /unschedule {job_id}"
+            )
+
+        except Exception as e:
+            logger.error(f"Error in handle_scheduled_message_input: {e}")
+            self.bot.send_message(
+                message.chat.id, self.formatter.format_error_message())
+
+    def _run_scheduled_job(self, job: Dict[str, Any]) -> bool:
+        """Deliver a scheduled message; False if shutdown interrupted a campaign"""
+        formatted_message = self._format_admin_message(job['created_by'], job['message'])
+        target = job['target']
+        sent, failed = job['sent_count'] or 0, job['failed_count'] or 0
+        last_user_id = job['last_user_id']
+
+        if target.isdigit():
+            # The user may have been banned since the job was scheduled
+            recipients = iter([int(target)] if self.db.get_user(int(target)) else [])
+        else:
+            # Ascending user ids let a restarted campaign resume after the last recipient
+            recipients = self.segments.iter_user_ids(target, after_id=job['last_user_id'])
+
+        for index, recipient in enumerate(recipients, 1):
+            if self.scheduler.stopping:
+                self.scheduler.extend_lease(job['id'], last_user_id, sent, failed)
+                return False
+            if self._deliver_scheduled_message(recipient, formatted_message):
+                sent += 1
+            else:
+                failed += 1
+            last_user_id = recipient
+            if index % 100 == 0:
+                self.scheduler.extend_lease(job['id'], last_user_id, sent, failed)
+            time.sleep(SCHEDULER_SEND_INTERVAL)
+
+        self.db.update_scheduled_job_progress(job['id'], last_user_id, sent, failed, None)
+        logger.info(f"Scheduled job {job['id']} delivered to {sent} users, {failed} failed")
+        self.rollups.record('admin_messages', 'scheduled', sent - (job['sent_count'] or 0))
+        try:
+            self.bot.send_message(
+                job['created_by'],
+                f"✅ پیام زمان‌بندی شده #{job['id']} ارسال شد.\n\n"
+                f"📤 موفق: {sent:,}\n"
+                f"❌ ناموفق: {failed:,}"
+            )
+        except Exception as e:
+            logger.error(f"Error reporting scheduled job {job['id']}: {e}")
+        return True
+
+    def _deliver_scheduled_message(self, user_id: int, text: str) -> bool:
+        """Send one scheduled message, waiting out a single flood-control response"""
+        for attempt in range(2):
+            try:
+                self.bot.send_message(user_id, text)
+                return True
+            except ApiTelegramException as e:
+                if e.error_code == 429 and attempt == 0:
+                    retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                    time.sleep(retry_after)
+                    continue
+                logger.info(f"Scheduled message to {user_id} failed: {e.description}")
+                return False
+            except Exception as e:
+                logger.error(f"Error sending scheduled message to {user_id}: {e}")
+                return False
+        return False
+
     def _get_current_time(self):
         """Get current time in Persian format"""
         try:
-            from datetime import datetime
             now = datetime.now()
             return now.strftime('%Y/%m/%d %H:%M')
         except:
             return "نامشخص"
 
+    def add_shutdown_hook(self, name: str, hook):
+        """Register a flush callback to run during shutdown"""
+        self._shutdown_hooks.append((name, hook))
+
+    def stop(self):
+        """Stop receiving updates; safe to call from a signal handler"""
+        self.bot.stop_polling()
+
+    def _drain_worker_pool(self, deadline: float):
+        """Let queued updates finish, then stop the worker threads"""
+        pool = self.bot.worker_pool
+        while not pool.tasks.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        dropped = pool.tasks.qsize()
+        if dropped:
+            logger.warning(f"Shutdown deadline reached, dropping {dropped} queued updates")
+
+        for worker in pool.workers:
+            worker.stop()
+        for worker in pool.workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                logger.warning(f"{worker.name} still busy at shutdown deadline")
+
+    def shutdown(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """Drain in-flight updates, flush buffers and close the database"""
+        if self._is_shut_down:
+            return
+        self._is_shut_down = True
+
+        logger.info("Shutting down bot...")
+        deadline = time.monotonic() + timeout
+        self.stop()
+
+        if self.bot.threaded and self.bot.worker_pool:
+            self._drain_worker_pool(deadline)
+
+        for name, hook in self._shutdown_hooks:
+            try:
+                hook()
+            except Exception as e:
+                logger.error(f"Error in shutdown hook {name}: {e}")
+
+        self.db.close()
+        logger.info("Bot shut down cleanly")
+
     def run(self):
         """Start the bot"""
         try:
             logger.info("Starting bot...")
-            self.bot.polling(none_stop=True)
+            self.startup.mark('ready')
+            logger.info(f"Ready to poll: {self.startup.report()}")
+            self.bot.catch_up()
+            if not self.bot.stop_requested:
+                self.bot.polling(none_stop=True)
         except Exception as e:
             logger.error(f"Error running bot: {e}")
             raise
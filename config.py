@@ -4,6 +4,86 @@ from typing import Dict, List
 # Bot Configuration
 BOT_TOKEN = os.getenv('BOT_TOKEN', '8110388329:AAGOt7it4v07i1uJp8yBRcDdD3YVz7VH6dM')
 DATABASE_PATH = os.getenv('DATABASE_PATH', '/db/data.db')
+# Point at a local Bot API stand-in (see fake_api.py) instead of api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# Logging Configuration; LOG_ROTATE_WHEN (e.g. 'midnight') switches from size- to time-based rotation
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '7'))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')
+LOG_COMPRESS = os.getenv('LOG_COMPRESS', 'true').lower() in ('1', 'true', 'yes')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# Update Processing Configuration
+UPDATE_BATCH_SIZE = 100
+RECENT_UPDATES_SIZE = 1000
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '10'))
+POLLING_TIMEOUT = 20
+
+# Anti-flood Configuration: action class -> (burst size, tokens refilled per second)
+RATE_LIMITS = {
+    'default': (20, 1.0),
+    'content': (3, 0.1),
+    'callback': (15, 2.0),
+    'inline': (30, 3.0),
+}
+RATE_LIMIT_COALESCE_WINDOW = 2.0
+RATE_LIMIT_NOTICE_INTERVAL = 10.0
+
+# SQL profiling: per-statement timings plus a slow-query log with query plans
+SQL_PROFILING = os.getenv('SQL_PROFILING', '').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+
+# Metrics Configuration; 0 disables the endpoint. Supervisor workers use the following ports
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# View Counting Configuration
+VIEW_FLUSH_INTERVAL = float(os.getenv('VIEW_FLUSH_INTERVAL', '30'))
+VIEW_FLUSH_BATCH = 500
+TOP_TRACKS_LIMIT = 10
+
+# Audience Segment Configuration; cached member counts are refreshed after the TTL
+SEGMENT_COUNT_TTL = float(os.getenv('SEGMENT_COUNT_TTL', '600'))
+SEGMENT_BATCH_SIZE = 1000
+
+# Scheduler Configuration; jobs overdue by more than the grace period are skipped (0 always sends)
+SCHEDULER_MISFIRE_GRACE = float(os.getenv('SCHEDULER_MISFIRE_GRACE', '86400'))
+SCHEDULER_LEASE = 300
+# How often the scheduler looks for jobs stored by other processes or left by a dead one
+SCHEDULER_RESCAN_INTERVAL = float(os.getenv('SCHEDULER_RESCAN_INTERVAL', '30'))
+SCHEDULER_SEND_INTERVAL = 0.05
+
+# Activity Tracking Configuration; last_seen is written at most once per interval per user
+ACTIVITY_FLUSH_INTERVAL = float(os.getenv('ACTIVITY_FLUSH_INTERVAL', '60'))
+ACTIVITY_FLUSH_BATCH = 5000
+
+# Rollup Configuration; derived daily aggregates are refreshed every interval
+ROLLUP_INTERVAL = float(os.getenv('ROLLUP_INTERVAL', '900'))
+REPORT_DEFAULT_DAYS = 7
+
+# Export Configuration
+EXPORT_BATCH_SIZE = 2000
+
+# Import Configuration; files are downloaded through the Bot API, which caps them at 20 MB
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024
+
+# Upload Configuration; files an admin sends this close together are added as one batch
+UPLOAD_BATCH_DELAY = float(os.getenv('UPLOAD_BATCH_DELAY', '2'))
+
+# User List Configuration
+USERS_PER_PAGE = 10
+SEARCH_RESULT_LIMIT = 1000
+CALLBACK_STATE_TTL = int(os.getenv('CALLBACK_STATE_TTL', str(6 * 3600)))
+
+# Inline Search Configuration
+INLINE_RESULTS_PER_PAGE = 20
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '30'))
+INLINE_RESULT_CACHE_TTL = int(os.getenv('INLINE_RESULT_CACHE_TTL', '15'))
 
 # User Roles
 class UserRole:
@@ -17,6 +97,16 @@ class ContentCategory:
     ECONOMIC_PACKAGE = 'economic_package'
     VIP_PACKAGE = 'vip_package'
 
+# Reply keyboard labels of the content categories
+class MenuButtons:
+    TOP_TRACKS = "🔥 پر بازدید ترین ترک ها"
+    ECONOMIC_PACKAGE = "💰 پکیج اقتصادی"
+    VIP_PACKAGE = "👑 پکیج مگاهیت VIP"
+
+# Paid packages stay behind their menu button: never in inline results (which can be
+# posted into any chat) or in the public top tracks ranking
+RESTRICTED_CATEGORIES = (ContentCategory.VIP_PACKAGE,)
+
 # Content Types
 class ContentType:
     TEXT = 'text'
@@ -73,9 +163,13 @@ class Messages:
     
     PHONE_REQUEST = "لطفا شماره تلفن خود را ارسال کنید. 📱"
     PHONE_RECEIVED = "شماره تلفن دریافت شد! ✅ حالا لطفا نام خود را وارد کنید. 👤"
+    PHONE_NOT_OWN = "لطفا شماره تلفن خودتان را با دکمه ارسال شماره بفرستید. 📱"
+    PHONE_TAKEN = "این شماره تلفن قبلا با حساب دیگری ثبت شده است. برای پیگیری با پشتیبانی تماس بگیرید. ❌"
     FIRST_NAME_RECEIVED = "نام دریافت شد! 👍 حالا لطفا نام خانوادگی خود را وارد کنید. 👨‍👩‍👧‍👦"
     LAST_NAME_RECEIVED = "نام خانوادگی دریافت شد! 👏 حالا لطفا استان خود را انتخاب کنید. 🗺️"
     REGISTRATION_COMPLETE = "ثبت نام شما کامل شد! 🎉"
+    REGISTRATION_REQUIRED = "برای دسترسی به محتوا ابتدا با دستور /start ثبت نام کنید. 📝"
+    INLINE_REGISTER_BUTTON = "ثبت نام در تکست بخر 📝"
     
     ADMIN_PANEL_WELCOME = "به پنل ادمین خوش آمدید! لطفا گزینه مورد نظر را انتخاب کنید. 👑"
     USER_PANEL_WELCOME = "به منوی اصلی خوش آمدید! لطفا گزینه مورد نظر را انتخاب کنید. 😊"
@@ -94,3 +188,54 @@ class Messages:
     ERROR_GENERAL = "خطایی رخ داده است. لطفا دوباره تلاش کنید. ❌"
     ERROR_INVALID_INPUT = "ورودی نامعتبر است. لطفا دوباره تلاش کنید. ❌"
     ERROR_PERMISSION_DENIED = "شما دسترسی لازم برای این عملیات را ندارید. ❌"
+    RATE_LIMITED = "درخواست‌های شما زیاد است. لطفا چند لحظه صبر کنید و دوباره تلاش کنید. ⏳"
+    
+    SEGMENT_HELP = """👥 بخش‌بندی کاربران
+
+/segment <تعریف> - پیش‌نمایش تعداد کاربران
+/segment save <نام> <تعریف> - ذخیره بخش
+/segment delete <نام> - حذف بخش
+/segments - فهرست بخش‌ها
+
+فیلدها: province, city, role, joined, active, last_seen, interactions, user_id, first_name, last_name, phone
+عملگرها: = != < > <= >= in, not in, within, contains و ترکیب با and, or, not و پرانتز
+
+مثال:
+province = "خراسان رضوی" and joined within 30d
+role in (admin, super_admin) or active = no
+last_seen within 7d and interactions >= 10"""
+    
+    BULK_HELP = """⚡ عملیات گروهی روی کاربران
+
+/bulk <عملیات> <بخش یا شناسه‌ها> - پیش‌نمایش و تایید
+/bulk log - آخرین عملیات‌های گروهی
+
+عملیات: ban, unban, promote, demote
+هدف: نام بخش ذخیره شده، تعریف بخش یا فهرست شناسه‌ها
+
+مثال:
+/bulk ban first_name contains "t.me/"
+/bulk unban 77126477, 5123456789
+/bulk demote role = admin and last_seen < 2025-01-01"""
+    
+    SCHEDULE_HELP = """⏰ زمان‌بندی پیام
+
+/schedule <زمان> <شناسه کاربر یا بخش> - زمان‌بندی پیام
+/jobs - فهرست پیام‌های زمان‌بندی شده
+/unschedule <شناسه> - لغو پیام
+
+زمان: +30m، +2h، +1d، 18:30 یا 2026-03-21T09:00
+
+مثال:
+/schedule 18:30 77126477
+/schedule +1d khorasan
+/schedule 09:00 province = تهران"""
+    
+    IMPORT_HELP = """📥 ورود کاربران از CSV
+
+لطفا فایل CSV (یا CSV فشرده با gzip) را ارسال کنید.
+
+ستون‌های الزامی: user_id, phone, first_name, last_name, province
+ستون‌های اختیاری: city, created_at (YYYY-MM-DD یا YYYY-MM-DD HH:MM:SS)
+
+کاربران موجود به‌روزرسانی می‌شوند اما نقش، تاریخ عضویت و وضعیت مسدودی آن‌ها تغییر نمی‌کند."""
@@ -1,16 +1,157 @@
+import re
+import json
 import sqlite3
 import logging
-from typing import Optional, List, Dict, Any
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 from contextlib import contextmanager
-from config import DATABASE_PATH, UserRole, ContentCategory, ContentType
+from config import DATABASE_PATH, SQL_PROFILING, SLOW_QUERY_MS, UserRole, ContentCategory, ContentType
+from metrics import count_query
+from validators import normalize_phone, normalize_persian, normalize_digits
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever init_database changes, so existing databases run it again
+SCHEMA_VERSION = 9
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+class QueryProfiler:
+    """Collects per-statement timings and logs slow queries with their plan"""
+    
+    EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+    
+    def __init__(self, slow_query_ms: float):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self._stats = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(sql: str) -> str:
+        """Collapse literals and whitespace so one query shape maps to one key"""
+        sql = _STRING_LITERAL.sub('?', sql)
+        sql = _NUMBER_LITERAL.sub('?', sql)
+        sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+        return _WHITESPACE.sub(' ', sql).strip()
+    
+    def record(self, sql: str, elapsed: float, rows: int = 0, new_execution: bool = True):
+        """Add time (and rows) to a statement; fetches extend the last execution"""
+        key = self.normalize(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {'count': 0, 'total': 0.0, 'max': 0.0, 'rows': 0, 'last': 0.0}
+            if new_execution:
+                stats['count'] += 1
+                stats['last'] = 0.0
+            stats['total'] += elapsed
+            stats['rows'] += rows
+            stats['last'] += elapsed
+            stats['max'] = max(stats['max'], stats['last'])
+    
+    def log_slow_query(self, conn: sqlite3.Connection, sql: str, parameters, elapsed: float):
+        """Log a statement that crossed the threshold together with its query plan"""
+        plan = 'n/a'
+        if sql.lstrip()[:7].upper().startswith(self.EXPLAINABLE):
+            try:
+                # A plain cursor, so explaining is not profiled itself
+                plan_cursor = sqlite3.Connection.cursor(conn)
+                plan_cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+                plan = '; '.join(row[-1] for row in plan_cursor.fetchall())
+            except Exception as e:
+                plan = f"unavailable ({e})"
+        logger.warning(
+            f"Slow query ({elapsed * 1000:.1f} ms): {self.normalize(sql)} | plan: {plan}")
+    
+    def report(self, limit: int = 10, order_by: str = 'total') -> List[Dict[str, Any]]:
+        """Top statements ordered by total, max, count or rows"""
+        with self._lock:
+            rows = [dict(stats, sql=sql) for sql, stats in self._stats.items()]
+        rows.sort(key=lambda row: row[order_by], reverse=True)
+        for row in rows:
+            row.pop('last', None)
+            row['avg'] = row['total'] / row['count'] if row['count'] else 0.0
+        return rows[:limit]
+    
+    def reset(self):
+        """Forget all collected statistics"""
+        with self._lock:
+            self._stats.clear()
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Cursor that reports execute and fetch times to the connection's profiler"""
+    
+    def execute(self, sql, parameters=()):
+        self._profiled = (sql, parameters)
+        self._elapsed = 0.0
+        self._slow_logged = False
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._account(time.perf_counter() - started, 0, True)
+        return self
+    
+    def executemany(self, sql, seq_of_parameters):
+        self._profiled = None
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self.connection.profiler.record(sql, time.perf_counter() - started)
+        return self
+    
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._account(time.perf_counter() - started, 1 if row is not None else 0, False)
+        return row
+    
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._account(time.perf_counter() - started, len(rows), False)
+        return rows
+    
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._account(time.perf_counter() - started, len(rows), False)
+        return rows
+    
+    def _account(self, elapsed: float, rows: int, new_execution: bool):
+        profiled = getattr(self, '_profiled', None)
+        if not profiled:
+            return
+        sql, parameters = profiled
+        profiler = self.connection.profiler
+        profiler.record(sql, elapsed, rows, new_execution)
+        
+        # Fetches continue the execution, so the threshold applies to the sum
+        self._elapsed += elapsed
+        if not self._slow_logged and self._elapsed >= profiler.slow_query_seconds:
+            self._slow_logged = True
+            profiler.log_slow_query(self.connection, sql, parameters, self._elapsed)
+
+class ProfilingConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute) are profiled"""
+    
+    profiler: QueryProfiler = None
+    
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
 class DatabaseManager:
     """Manages database operations with proper connection handling"""
     
-    def __init__(self, db_path: str = DATABASE_PATH):
+    def __init__(self, db_path: str = DATABASE_PATH, profile: bool = SQL_PROFILING):
         self.db_path = db_path
+        self.profiler = QueryProfiler(SLOW_QUERY_MS) if profile else None
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.init_database()
     
     def init_database(self):
@@ -18,6 +159,16 @@ class DatabaseManager:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
+            # A current schema needs no DDL or seeding, which keeps restarts fast
+            cursor.execute('PRAGMA user_version')
+            if cursor.fetchone()[0] == SCHEMA_VERSION:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'contents_fts'")
+                self.fts_enabled = cursor.fetchone() is not None
+                return
+            
+            # WAL lets readers run alongside the writer and survives restarts cleanly
+            cursor.execute('PRAGMA journal_mode=WAL')
+            
             # Users table with role-based system
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -62,6 +213,7 @@ class DatabaseManager:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     is_active BOOLEAN DEFAULT 1,
+                    file_type TEXT,
                     FOREIGN KEY (category_id) REFERENCES content_categories (id),
                     FOREIGN KEY (created_by) REFERENCES users (id)
                 )
@@ -79,12 +231,271 @@ class DatabaseManager:
                 )
             ''')
             
+            # Key/value store for bot runtime state (polling offset etc.)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bot_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Server-side state behind compact inline button callback_data
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS callback_states (
+                    token TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    expires_at TIMESTAMP NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_callback_states_expires
+                ON callback_states (expires_at)
+            ''')
+            
+            self._ensure_column(cursor, 'contents', 'file_type', 'TEXT')
+            
+            # Delivery counters: views for every listed item, plays for sent tracks
+            self._ensure_column(cursor, 'contents', 'view_count', 'INTEGER DEFAULT 0')
+            self._ensure_column(cursor, 'contents', 'play_count', 'INTEGER DEFAULT 0')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_contents_plays
+                ON contents (type, is_active, play_count DESC)
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS content_views_daily (
+                    content_id INTEGER NOT NULL,
+                    day TEXT NOT NULL,
+                    views INTEGER DEFAULT 0,
+                    plays INTEGER DEFAULT 0,
+                    PRIMARY KEY (content_id, day),
+                    FOREIGN KEY (content_id) REFERENCES contents (id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_contents_category
+                ON contents (category_id, is_active, created_at)
+            ''')
+            
+            # Audience segments filter users on these columns
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_province
+                ON users (province, created_at)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_city
+                ON users (city)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_role
+                ON users (role)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_created
+                ON users (created_at)
+            ''')
+            
+            # Activity tracking, written in batches by ActivityTracker
+            self._ensure_column(cursor, 'users', 'last_seen', 'TIMESTAMP')
+            self._ensure_column(cursor, 'users', 'interaction_count', 'INTEGER DEFAULT 0')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_last_seen
+                ON users (last_seen)
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS segments (
+                    name TEXT PRIMARY KEY,
+                    definition TEXT NOT NULL,
+                    member_count INTEGER,
+                    counted_at REAL,
+                    created_by INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Messages queued for later delivery; run_at and claimed_until are Unix times
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_at REAL NOT NULL,
+                    target TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    status TEXT DEFAULT 'pending',
+                    created_by INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    claimed_until REAL,
+                    last_user_id INTEGER,
+                    sent_count INTEGER DEFAULT 0,
+                    failed_count INTEGER DEFAULT 0,
+                    finished_at REAL,
+                    error TEXT
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_scheduled_jobs_status
+                ON scheduled_jobs (status, run_at)
+            ''')
+            
+            # Daily aggregates for reports, keyed for day range scans
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS daily_rollups (
+                    day TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    dimension TEXT NOT NULL DEFAULT '',
+                    value INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, metric, dimension)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_content_views_day
+                ON content_views_daily (day)
+            ''')
+            
+            # Audit trail of bulk admin actions and the users each one changed
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS admin_actions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    admin_id INTEGER NOT NULL,
+                    action TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    affected_count INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS admin_action_users (
+                    action_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    PRIMARY KEY (action_id, user_id)
+                ) WITHOUT ROWID
+            ''')
+            
+            # Phones dropped from an account because another account already owned them
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS phone_conflicts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    phone TEXT NOT NULL,
+                    owner_id INTEGER NOT NULL,
+                    source TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Canonical phones and names, then one row per phone for exact lookups
+            self._normalize_users(conn, cursor)
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_users_phone
+                ON users (phone)
+            ''')
+            
+            # Full-text index for inline catalog search
+            self.fts_enabled = self._init_content_search(cursor)
+            
             # Insert default content categories
             self._insert_default_categories(cursor)
             
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
             conn.commit()
             logger.info("Database initialized successfully")
     
+    def _normalize_users(self, conn, cursor, batch_size: int = 5000):
+        """Backfill E.164 phones and normalized names in batches, then drop duplicate phones"""
+        last_id = 0
+        changed = 0
+        while True:
+            cursor.execute('''
+                SELECT user_id, phone, first_name, last_name FROM users
+                WHERE user_id > ? ORDER BY user_id LIMIT ?
+            ''', (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            updates = []
+            for user_id, phone, first_name, last_name in rows:
+                values = (normalize_phone(phone) or phone, normalize_persian(first_name),
+                          normalize_persian(last_name))
+                if values != (phone, first_name, last_name):
+                    updates.append(values + (user_id,))
+            cursor.executemany(
+                'UPDATE users SET phone = ?, first_name = ?, last_name = ? WHERE user_id = ?', updates)
+            conn.commit()
+            changed += len(updates)
+            last_id = rows[-1][0]
+        
+        # A phone stays with the account that registered it first
+        cursor.execute('''
+            SELECT user_id, phone, owner_id FROM (
+                SELECT user_id, phone,
+                       FIRST_VALUE(user_id) OVER phone_window AS owner_id,
+                       ROW_NUMBER() OVER phone_window AS position
+                FROM users WHERE phone IS NOT NULL
+                WINDOW phone_window AS (PARTITION BY phone ORDER BY created_at, id)
+            ) WHERE position > 1
+        ''')
+        conflicts = [tuple(row) for row in cursor.fetchall()]
+        if conflicts:
+            self._record_phone_conflicts(cursor, conflicts, 'migration')
+            cursor.executemany('UPDATE users SET phone = NULL WHERE user_id = ?',
+                               [(user_id,) for user_id, _, _ in conflicts])
+        if changed:
+            logger.info(f"Normalized {changed} users")
+    
+    def _record_phone_conflicts(self, cursor, conflicts: List[Tuple[int, str, int]], source: str):
+        """Keep (user_id, phone, owner_id) of phones about to be dropped in phone_conflicts"""
+        cursor.executemany('''
+            INSERT INTO phone_conflicts (user_id, phone, owner_id, source) VALUES (?, ?, ?, ?)
+        ''', [conflict + (source,) for conflict in conflicts])
+        logger.warning(
+            f"Dropped {len(conflicts)} phones owned by other accounts ({source}), see phone_conflicts: " +
+            ', '.join(f"{user_id} (kept by {owner_id})" for user_id, _, owner_id in conflicts[:20]))
+    
+    def _ensure_column(self, cursor, table: str, column: str, definition: str):
+        """Add a column to an existing table if it is missing"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
+    def _init_content_search(self, cursor) -> bool:
+        """Create the FTS5 index over content titles and text"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'contents_fts'")
+        exists = cursor.fetchone() is not None
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS contents_fts USING fts5(
+                    title, content, content='contents', content_rowid='id'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 not available, falling back to LIKE search: {e}")
+            return False
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS contents_fts_insert AFTER INSERT ON contents BEGIN
+                INSERT INTO contents_fts (rowid, title, content)
+                VALUES (new.id, new.title, new.content);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS contents_fts_delete AFTER DELETE ON contents BEGIN
+                INSERT INTO contents_fts (contents_fts, rowid, title, content)
+                VALUES ('delete', old.id, old.title, old.content);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS contents_fts_update AFTER UPDATE OF title, content ON contents BEGIN
+                INSERT INTO contents_fts (contents_fts, rowid, title, content)
+                VALUES ('delete', old.id, old.title, old.content);
+                INSERT INTO contents_fts (rowid, title, content)
+                VALUES (new.id, new.title, new.content);
+            END
+        ''')
+        
+        if not exists:
+            # Index rows that were added before the search table existed
+            cursor.execute("INSERT INTO contents_fts (contents_fts) VALUES ('rebuild')")
+        return True
+    
     def _insert_default_categories(self, cursor):
         """Insert default content categories"""
         categories = [
@@ -99,41 +510,151 @@ class DatabaseManager:
                 VALUES (?, ?, ?)
             ''', category)
     
+    def _get_thread_connection(self) -> sqlite3.Connection:
+        """Get this thread's pooled connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.profiler:
+                conn = sqlite3.connect(
+                    self.db_path, check_same_thread=False, factory=ProfilingConnection)
+                conn.profiler = self.profiler
+            else:
+                conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA busy_timeout = 5000')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.set_trace_callback(count_query)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._reap_connections()
+                self._connections.append((weakref.ref(threading.current_thread()), conn))
+        return conn
+    
+    def _reap_connections(self):
+        """Close connections whose thread has exited; the caller holds _connections_lock"""
+        alive = []
+        for thread_ref, conn in self._connections:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                alive.append((thread_ref, conn))
+                continue
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing database connection: {e}")
+        self._connections = alive
+    
     @contextmanager
     def get_connection(self):
         """Context manager for database connections"""
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            conn.row_factory = sqlite3.Row
+            conn = self._get_thread_connection()
             yield conn
         except Exception as e:
             if conn:
                 conn.rollback()
             logger.error(f"Database error: {e}")
             raise
-        finally:
-            if conn:
+    
+    def close(self):
+        """Checkpoint the WAL and close all pooled connections"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        
+        # Checkpoint on the last connection once no other reader is open
+        for index, (_, conn) in enumerate(reversed(connections)):
+            try:
+                if index == len(connections) - 1:
+                    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
                 conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing database connection: {e}")
+        
+        self._local = threading.local()
+        logger.info(f"Closed {len(connections)} database connections")
     
     # User operations
+    # Re-registration and imports refresh the profile but never touch role, created_at or bans
+    # Phones are unique and stay with the account that registered them first
+    USER_UPSERT = '''
+        ON CONFLICT (user_id) DO UPDATE SET
+            phone = COALESCE(excluded.phone, phone),
+            first_name = excluded.first_name,
+            last_name = excluded.last_name,
+            province = excluded.province,
+            city = excluded.city,
+            updated_at = CURRENT_TIMESTAMP
+    '''
+    
     def create_user(self, user_id: int, phone: str, first_name: str, 
                    last_name: str, province: str, city: str, role: str = UserRole.USER) -> bool:
-        """Create a new user"""
+        """Create a user, or update the profile of an existing one keeping its role and created_at;
+        fails if another account already has the phone"""
+        phone = normalize_phone(phone) or phone
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO users 
+                cursor.execute(f'''
+                    INSERT INTO users 
                     (user_id, phone, first_name, last_name, province, city, role, updated_at)
                     VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ''', (user_id, phone, first_name, last_name, province, city, role))
+                    {self.USER_UPSERT}
+                ''', (user_id, phone, normalize_persian(first_name), normalize_persian(last_name),
+                      province, city, role))
                 conn.commit()
                 return True
         except Exception as e:
             logger.error(f"Error creating user: {e}")
             return False
     
+    def import_users(self, rows: List[tuple]) -> Optional[Tuple[int, int]]:
+        """Upsert (user_id, phone, first_name, last_name, province, city, created_at) rows in
+        one transaction; returns (inserted, updated) or None if the chunk was rolled back"""
+        if not rows:
+            return 0, 0
+        rows = [
+            (user_id, normalize_phone(phone) or phone, normalize_persian(first_name),
+             normalize_persian(last_name), province, city, created_at)
+            for user_id, phone, first_name, last_name, province, city, created_at in rows
+        ]
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                user_ids = list({row[0] for row in rows})
+                cursor.execute(f'''
+                    SELECT COUNT(*) FROM users WHERE user_id IN ({', '.join('?' * len(user_ids))})
+                ''', user_ids)
+                existing = cursor.fetchone()[0]
+                
+                # Registered owners come first, then the first row of the file with the phone
+                owners = {}
+                for row in rows:
+                    if row[1]:
+                        owners.setdefault(row[1], row[0])
+                if owners:
+                    cursor.execute(f'''
+                        SELECT user_id, phone FROM users WHERE phone IN ({', '.join('?' * len(owners))})
+                    ''', list(owners))
+                    owners.update((row['phone'], row['user_id']) for row in cursor.fetchall())
+                conflicts = [(row[0], row[1], owners[row[1]]) for row in rows
+                             if row[1] and owners[row[1]] != row[0]]
+                if conflicts:
+                    self._record_phone_conflicts(cursor, conflicts, 'import')
+                    rows = [row if not row[1] or owners[row[1]] == row[0] else row[:1] + (None,) + row[2:]
+                            for row in rows]
+                cursor.executemany(f'''
+                    INSERT INTO users
+                    (user_id, phone, first_name, last_name, province, city, role, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, '{UserRole.USER}', COALESCE(?, CURRENT_TIMESTAMP), CURRENT_TIMESTAMP)
+                    {self.USER_UPSERT}
+                ''', rows)
+                conn.commit()
+                return len(user_ids) - existing, existing
+        except Exception as e:
+            logger.error(f"Error importing users: {e}")
+            return None
+    
     def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user by user_id"""
         try:
@@ -146,6 +667,21 @@ class DatabaseManager:
             logger.error(f"Error getting user: {e}")
             return None
     
+    def get_user_by_phone(self, phone: str) -> Optional[Dict[str, Any]]:
+        """Get the user, banned or not, who has a phone number in any common format"""
+        phone = normalize_phone(phone)
+        if not phone:
+            return None
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM users WHERE phone = ?', (phone,))
+                row = cursor.fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting user by phone: {e}")
+            return None
+    
     def update_user_role(self, user_id: int, role: str) -> bool:
         """Update user role"""
         try:
@@ -180,7 +716,7 @@ class DatabaseManager:
     # Content operations
     def add_content(self, category_name: str, content_type: str, content: str, 
                    title: str = None, description: str = None, file_id: str = None,
-                   file_size: int = None, created_by: int = None) -> bool:
+                   file_size: int = None, created_by: int = None, file_type: str = None) -> bool:
         """Add new content"""
         try:
             with self.get_connection() as conn:
@@ -197,9 +733,10 @@ class DatabaseManager:
                 
                 cursor.execute('''
                     INSERT INTO contents 
-                    (category_id, type, content, title, description, file_id, file_size, created_by)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (category_id, content_type, content, title, description, file_id, file_size, created_by))
+                    (category_id, type, content, title, description, file_id, file_size, created_by, file_type)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (category_id, content_type, content, title, description, file_id, file_size,
+                      created_by, file_type))
                 
                 conn.commit()
                 return True
@@ -207,6 +744,32 @@ class DatabaseManager:
             logger.error(f"Error adding content: {e}")
             return False
     
+    def add_contents(self, category_name: str, content_type: str, items: List[Dict[str, Any]],
+                     created_by: int = None) -> Optional[int]:
+        """Add several contents in one transaction; returns how many were added"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT id FROM content_categories WHERE name = ?', (category_name,))
+                category_row = cursor.fetchone()
+                if not category_row:
+                    logger.error(f"Category {category_name} not found")
+                    return None
+                
+                cursor.executemany('''
+                    INSERT INTO contents 
+                    (category_id, type, content, title, file_id, file_size, created_by, file_type)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(category_row['id'], content_type, item['content'], item.get('title'),
+                       item.get('file_id'), item.get('file_size'), created_by, item.get('file_type'))
+                      for item in items])
+                
+                conn.commit()
+                return len(items)
+        except Exception as e:
+            logger.error(f"Error adding contents: {e}")
+            return None
+    
     def get_content_by_category(self, category_name: str) -> Dict[str, List[Dict[str, Any]]]:
         """Get all content for a specific category"""
         try:
@@ -234,6 +797,161 @@ class DatabaseManager:
             logger.error(f"Error getting content by category: {e}")
             return {'text': [], 'music': [], 'audio': [], 'document': []}
     
+    def record_content_views(self, counts: Dict[int, List[int]]) -> bool:
+        """Add buffered {content_id: [views, plays]} to the counters in one transaction"""
+        if not counts:
+            return True
+        try:
+            rows = [(views, plays, content_id) for content_id, (views, plays) in counts.items()]
+            day = datetime.now().strftime('%Y-%m-%d')
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    UPDATE contents
+                    SET view_count = COALESCE(view_count, 0) + ?, play_count = COALESCE(play_count, 0) + ?
+                    WHERE id = ?
+                ''', rows)
+                cursor.executemany('''
+                    INSERT INTO content_views_daily (content_id, day, views, plays)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (content_id, day) DO UPDATE SET
+                        views = views + excluded.views, plays = plays + excluded.plays
+                ''', [(content_id, day, views, plays) for views, plays, content_id in rows])
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error recording content views: {e}")
+            return False
+    
+    def record_user_activity(self, activity: Dict[int, List[float]]) -> bool:
+        """Apply buffered {user_id: [interactions, last_seen_unix]} in one transaction"""
+        if not activity:
+            return True
+        try:
+            # Same UTC layout as CURRENT_TIMESTAMP so created_at and last_seen compare alike
+            rows = [
+                (datetime.fromtimestamp(last_seen, timezone.utc).strftime('%Y-%m-%d %H:%M:%S'), count, user_id)
+                for user_id, (count, last_seen) in activity.items()
+            ]
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    UPDATE users
+                    SET last_seen = MAX(COALESCE(last_seen, ''), ?),
+                        interaction_count = COALESCE(interaction_count, 0) + ?
+                    WHERE user_id = ?
+                ''', rows)
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error recording user activity: {e}")
+            return False
+    
+    def get_active_user_counts(self) -> Dict[str, int]:
+        """Users seen in the last day, week and 30 days, from one range scan of idx_users_last_seen"""
+        now = datetime.now(timezone.utc)
+        cutoffs = [(now - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S') for days in (1, 7, 30)]
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT COUNT(*) AS month,
+                           COALESCE(SUM(last_seen >= ?), 0) AS week,
+                           COALESCE(SUM(last_seen >= ?), 0) AS day
+                    FROM users
+                    WHERE last_seen >= ? AND is_active = 1
+                ''', (cutoffs[1], cutoffs[0], cutoffs[2]))
+                return dict(cursor.fetchone())
+        except Exception as e:
+            logger.error(f"Error counting active users: {e}")
+            return {'day': 0, 'week': 0, 'month': 0}
+    
+    def get_most_played(self, limit: int, exclude_categories: Tuple[str, ...] = ()) -> List[Dict[str, Any]]:
+        """Active tracks with the most plays, via the play_count index"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                placeholders = ','.join('?' * len(exclude_categories))
+                cursor.execute(f'''
+                    SELECT c.id, c.play_count FROM contents c
+                    JOIN content_categories cc ON c.category_id = cc.id
+                    WHERE c.type = 'music' AND c.is_active = 1 AND c.play_count > 0
+                      AND cc.name NOT IN ({placeholders})
+                    ORDER BY c.play_count DESC
+                    LIMIT ?
+                ''', tuple(exclude_categories) + (limit,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting most played contents: {e}")
+            return []
+    
+    def get_contents_by_ids(self, content_ids: List[int],
+                            exclude_categories: Tuple[str, ...] = ()) -> List[Dict[str, Any]]:
+        """Get active contents by id, keeping the order of content_ids"""
+        if not content_ids:
+            return []
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                placeholders = ','.join('?' * len(content_ids))
+                excluded = ','.join('?' * len(exclude_categories))
+                cursor.execute(f'''
+                    SELECT c.* FROM contents c
+                    JOIN content_categories cc ON c.category_id = cc.id
+                    WHERE c.is_active = 1 AND c.id IN ({placeholders})
+                      AND cc.name NOT IN ({excluded})
+                ''', tuple(content_ids) + tuple(exclude_categories))
+                by_id = {row['id']: dict(row) for row in cursor.fetchall()}
+                return [by_id[content_id] for content_id in content_ids if content_id in by_id]
+        except Exception as e:
+            logger.error(f"Error getting contents by ids: {e}")
+            return []
+    
+    def search_contents(self, query: str, limit: int = 20, offset: int = 0,
+                        exclude_categories: Tuple[str, ...] = ()) -> List[Dict[str, Any]]:
+        """Search active contents by title and text, best matches first"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                select = '''
+                    SELECT c.id, c.type, c.title, c.content, c.file_id, c.file_type,
+                           cc.display_name as category_display_name
+                '''
+                joins = '''
+                    JOIN content_categories cc ON c.category_id = cc.id
+                    WHERE c.is_active = 1 AND cc.is_active = 1
+                '''
+                if exclude_categories:
+                    joins += f"AND cc.name NOT IN ({', '.join('?' * len(exclude_categories))})\n"
+                excluded = tuple(exclude_categories)
+                
+                if not query:
+                    cursor.execute(f'''
+                        {select} FROM contents c {joins}
+                        ORDER BY c.id DESC LIMIT ? OFFSET ?
+                    ''', excluded + (limit, offset))
+                elif self.fts_enabled:
+                    # Prefix-match every word so results follow the user's typing
+                    terms = ' '.join('"{}"*'.format(word.replace('"', '""')) for word in query.split())
+                    cursor.execute(f'''
+                        {select} FROM contents_fts f
+                        JOIN contents c ON c.id = f.rowid {joins}
+                        AND contents_fts MATCH ?
+                        ORDER BY f.rank LIMIT ? OFFSET ?
+                    ''', excluded + (terms, limit, offset))
+                else:
+                    search_term = f"%{query}%"
+                    cursor.execute(f'''
+                        {select} FROM contents c {joins}
+                        AND (c.title LIKE ? OR c.content LIKE ?)
+                        ORDER BY c.id DESC LIMIT ? OFFSET ?
+                    ''', excluded + (search_term, search_term, limit, offset))
+                
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error searching contents: {e}")
+            return []
+    
     def get_category_display_name(self, category_name: str) -> Optional[str]:
         """Get display name for category"""
         try:
@@ -250,9 +968,6 @@ class DatabaseManager:
     def save_session(self, user_id: int, session_data: Dict[str, Any], expires_in_hours: int = 24) -> bool:
         """Save user session data"""
         try:
-            import json
-            from datetime import datetime, timedelta
-            
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 
@@ -275,9 +990,6 @@ class DatabaseManager:
     def get_session(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user session data"""
         try:
-            import json
-            from datetime import datetime
-            
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
@@ -305,6 +1017,92 @@ class DatabaseManager:
             logger.error(f"Error clearing session: {e}")
             return False
     
+    # Callback state operations
+    def save_callback_state(self, token: str, state: Dict[str, Any], expires_in_seconds: int) -> bool:
+        """Save the server-side state behind a callback token"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                expires_at = datetime.now() + timedelta(seconds=expires_in_seconds)
+                cursor.execute('''
+                    INSERT OR REPLACE INTO callback_states (token, state, expires_at)
+                    VALUES (?, ?, ?)
+                ''', (token, json.dumps(state), expires_at))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error saving callback state: {e}")
+            return False
+    
+    def get_callback_state(self, token: str) -> Optional[Dict[str, Any]]:
+        """Get the unexpired state behind a callback token"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT state FROM callback_states
+                    WHERE token = ? AND expires_at > ?
+                ''', (token, datetime.now()))
+                row = cursor.fetchone()
+                return json.loads(row['state']) if row else None
+        except Exception as e:
+            logger.error(f"Error getting callback state: {e}")
+            return None
+    
+    def delete_callback_state(self, token: str) -> bool:
+        """Delete the state behind a callback token; False if another caller got there first"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM callback_states WHERE token = ?', (token,))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error deleting callback state: {e}")
+            return False
+    
+    def purge_callback_states(self) -> int:
+        """Delete expired callback states"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM callback_states WHERE expires_at <= ?', (datetime.now(),))
+                conn.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error purging callback states: {e}")
+            return 0
+    
+    # Runtime state operations
+    def get_state(self, key: str) -> Optional[str]:
+        """Get a persisted runtime state value"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT value FROM bot_state WHERE key = ?', (key,))
+                row = cursor.fetchone()
+                return row['value'] if row else None
+        except Exception as e:
+            logger.error(f"Error getting state {key}: {e}")
+            return None
+    
+    def set_state(self, key: str, value: str) -> bool:
+        """Persist a runtime state value"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO bot_state (key, value, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (key) DO UPDATE SET
+                        value = excluded.value, updated_at = excluded.updated_at
+                ''', (key, value))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error setting state {key}: {e}")
+            return False
+    
     def ban_user(self, user_id: int) -> bool:
         """Ban a user"""
         try:
@@ -345,6 +1143,7 @@ class DatabaseManager:
                 search_condition = ""
                 search_params = []
                 if search:
+                    search = normalize_persian(search)
                     search_condition = "AND (first_name LIKE ? OR last_name LIKE ? OR phone LIKE ? OR province LIKE ?)"
                     search_term = f"%{search}%"
                     search_params = [search_term, search_term, search_term, search_term]
@@ -376,4 +1175,459 @@ class DatabaseManager:
                 }
         except Exception as e:
             logger.error(f"Error getting paginated users: {e}")
-            return {'users': [], 'total': 0, 'page': 1, 'per_page': 10, 'total_pages': 0}
\ No newline at end of file
+            return {'users': [], 'total': 0, 'page': 1, 'per_page': 10, 'total_pages': 0}
+    
+    def search_user_ids(self, search: str, search_type: str = 'name', limit: int = 1000) -> List[int]:
+        """Get ids of active users matching a search, newest first"""
+        conditions = {
+            'name': ('(first_name LIKE ? OR last_name LIKE ?)', 2),
+            'phone': ('phone LIKE ?', 1),
+            'province': ('province LIKE ?', 1),
+            'role': ('role = ?', 1),
+        }
+        condition, param_count = conditions.get(
+            search_type, ('(first_name LIKE ? OR last_name LIKE ? OR phone LIKE ? OR province LIKE ?)', 4))
+        search = normalize_persian(search)
+        term = search if search_type == 'role' else f"%{search}%"
+        if search_type == 'phone':
+            phone = normalize_phone(search)
+            if phone:
+                # A full number hits the unique index instead of scanning
+                condition, term = 'phone = ?', phone
+            else:
+                # Stored phones are +98..., so match partial input without its leading 0
+                term = f"%{normalize_digits(search).lstrip('0')}%"
+        
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT user_id FROM users
+                    WHERE is_active = 1 AND {condition}
+                    ORDER BY created_at DESC
+                    LIMIT ?
+                ''', [term] * param_count + [limit])
+                return [row['user_id'] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error searching users: {e}")
+            return []
+    
+    def get_users_by_ids(self, user_ids: List[int]) -> List[Dict[str, Any]]:
+        """Get active users by user_id, keeping the given order"""
+        if not user_ids:
+            return []
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                placeholders = ', '.join('?' * len(user_ids))
+                cursor.execute(f'''
+                    SELECT * FROM users
+                    WHERE is_active = 1 AND user_id IN ({placeholders})
+                ''', list(user_ids))
+                users = {row['user_id']: dict(row) for row in cursor.fetchall()}
+                return [users[user_id] for user_id in user_ids if user_id in users]
+        except Exception as e:
+            logger.error(f"Error getting users by ids: {e}")
+            return []
+    
+    # Audience segments; where clauses come from segments.compile_segment, never from user text
+    def count_users_where(self, where: str, params: List[Any]) -> int:
+        """Count users matching a compiled segment"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'SELECT COUNT(*) FROM users WHERE {where}', list(params))
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error counting segment users: {e}")
+            return 0
+    
+    def iter_users_where(self, where: str, params: List[Any], columns=('user_id',),
+                         batch_size: int = 1000, after_id: int = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield batches of matching users, paging by user_id instead of OFFSET"""
+        selected = ', '.join(dict.fromkeys(('user_id',) + tuple(columns)))
+        last_id = after_id
+        while True:
+            try:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    if last_id is None:
+                        cursor.execute(f'''
+                            SELECT {selected} FROM users WHERE {where}
+                            ORDER BY user_id LIMIT ?
+                        ''', list(params) + [batch_size])
+                    else:
+                        cursor.execute(f'''
+                            SELECT {selected} FROM users WHERE user_id > ? AND ({where})
+                            ORDER BY user_id LIMIT ?
+                        ''', [last_id] + list(params) + [batch_size])
+                    rows = [dict(row) for row in cursor.fetchall()]
+            except Exception as e:
+                logger.error(f"Error iterating segment users: {e}")
+                return
+            if not rows:
+                return
+            yield rows
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1]['user_id']
+    
+    def save_segment(self, name: str, definition: str, member_count: int, created_by: int) -> bool:
+        """Create or replace a saved segment"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO segments (name, definition, member_count, counted_at, created_by)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET
+                        definition = excluded.definition,
+                        member_count = excluded.member_count,
+                        counted_at = excluded.counted_at,
+                        created_by = excluded.created_by
+                ''', (name, definition, member_count, time.time(), created_by))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error saving segment: {e}")
+            return False
+    
+    def get_segment(self, name: str) -> Optional[Dict[str, Any]]:
+        """Get a saved segment by name"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM segments WHERE name = ?', (name,))
+                row = cursor.fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error getting segment: {e}")
+            return None
+    
+    def list_segments(self) -> List[Dict[str, Any]]:
+        """Get all saved segments by name"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT * FROM segments ORDER BY name')
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error listing segments: {e}")
+            return []
+    
+    def update_segment_count(self, name: str, member_count: int) -> bool:
+        """Store a freshly computed member count"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'UPDATE segments SET member_count = ?, counted_at = ? WHERE name = ?',
+                    (member_count, time.time(), name))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error updating segment count: {e}")
+            return False
+    
+    def delete_segment(self, name: str) -> bool:
+        """Delete a saved segment"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM segments WHERE name = ?', (name,))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error deleting segment: {e}")
+            return False
+    
+    # Scheduled jobs
+    def add_scheduled_job(self, run_at: float, target: str, message: str, created_by: int) -> Optional[int]:
+        """Store a scheduled message and return its id"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO scheduled_jobs (run_at, target, message, created_by)
+                    VALUES (?, ?, ?, ?)
+                ''', (run_at, target, message, created_by))
+                conn.commit()
+                return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Error adding scheduled job: {e}")
+            return None
+    
+    def get_runnable_jobs(self) -> List[Dict[str, Any]]:
+        """Pending jobs plus running ones whose worker stopped renewing its lease"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT * FROM scheduled_jobs
+                    WHERE status = 'pending' OR (status = 'running' AND claimed_until < ?)
+                    ORDER BY run_at
+                ''', (time.time(),))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting scheduled jobs: {e}")
+            return []
+    
+    def claim_scheduled_job(self, job_id: int, claimed_until: float) -> Optional[Dict[str, Any]]:
+        """Mark a job running if nobody else holds it; returns the job or None"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE scheduled_jobs SET status = 'running', claimed_until = ?
+                    WHERE id = ? AND (status = 'pending' OR (status = 'running' AND claimed_until < ?))
+                ''', (claimed_until, job_id, time.time()))
+                conn.commit()
+                if cursor.rowcount == 0:
+                    return None
+                cursor.execute('SELECT * FROM scheduled_jobs WHERE id = ?', (job_id,))
+                row = cursor.fetchone()
+                return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Error claiming scheduled job: {e}")
+            return None
+    
+    def update_scheduled_job_progress(self, job_id: int, last_user_id: int, sent: int,
+                                      failed: int, claimed_until: float) -> bool:
+        """Record the last recipient reached and renew the job's lease"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE scheduled_jobs
+                    SET last_user_id = ?, sent_count = ?, failed_count = ?, claimed_until = ?
+                    WHERE id = ?
+                ''', (last_user_id, sent, failed, claimed_until, job_id))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error updating scheduled job: {e}")
+            return False
+    
+    def release_scheduled_job(self, job_id: int) -> bool:
+        """Put an interrupted job back to pending"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE scheduled_jobs SET status = 'pending', claimed_until = NULL
+                    WHERE id = ? AND status = 'running'
+                ''', (job_id,))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error releasing scheduled job: {e}")
+            return False
+    
+    def finish_scheduled_job(self, job_id: int, status: str, error: str = None) -> bool:
+        """Mark a job done, failed or missed"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE scheduled_jobs
+                    SET status = ?, error = ?, finished_at = ?, claimed_until = NULL
+                    WHERE id = ?
+                ''', (status, error, time.time(), job_id))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error finishing scheduled job: {e}")
+            return False
+    
+    def cancel_scheduled_job(self, job_id: int) -> bool:
+        """Cancel a job that has not started yet"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE scheduled_jobs SET status = 'cancelled', finished_at = ?
+                    WHERE id = ? AND status = 'pending'
+                ''', (time.time(), job_id))
+                conn.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"Error cancelling scheduled job: {e}")
+            return False
+    
+    def list_scheduled_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Open jobs first by due time, then the most recently finished ones"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT * FROM scheduled_jobs
+                    ORDER BY status IN ('pending', 'running') DESC,
+                             CASE WHEN status IN ('pending', 'running') THEN run_at ELSE -finished_at END
+                    LIMIT ?
+                ''', (limit,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error listing scheduled jobs: {e}")
+            return []
+    
+    # Bulk user actions: action -> (SET clause, rows it can change)
+    BULK_USER_ACTIONS = {
+        'ban': ("is_active = 0", "is_active = 1 AND role != 'super_admin'"),
+        'unban': ("is_active = 1", "is_active = 0"),
+        'promote': ("role = 'admin'", "is_active = 1 AND role = 'user'"),
+        'demote': ("role = 'user'", "is_active = 1 AND role = 'admin'"),
+    }
+    
+    def _bulk_where(self, action: str, where: str, admin_id: int) -> str:
+        """Restrict a filter to the users an action would change, never the acting admin"""
+        return f"({where}) AND {self.BULK_USER_ACTIONS[action][1]} AND user_id != {int(admin_id)}"
+    
+    def preview_bulk_user_action(self, action: str, where: str, params: List[Any], admin_id: int,
+                                 sample_size: int = 5) -> Tuple[int, List[Dict[str, Any]]]:
+        """Dry run: how many users an action would change, plus a few of them"""
+        where = self._bulk_where(action, where, admin_id)
+        count = self.count_users_where(where, params)
+        sample = next(self.iter_users_where(
+            where, params, ('first_name', 'last_name'), batch_size=sample_size), []) if count else []
+        return count, sample
+    
+    def bulk_update_users(self, action: str, where: str, params: List[Any], admin_id: int,
+                          target: str) -> Optional[List[int]]:
+        """Apply an action to every matching user in one UPDATE and audit it; returns the changed ids"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    UPDATE users SET {self.BULK_USER_ACTIONS[action][0]}, updated_at = CURRENT_TIMESTAMP
+                    WHERE {self._bulk_where(action, where, admin_id)}
+                    RETURNING user_id
+                ''', list(params))
+                user_ids = [row[0] for row in cursor.fetchall()]
+                if user_ids:
+                    cursor.execute('''
+                        INSERT INTO admin_actions (admin_id, action, target, affected_count)
+                        VALUES (?, ?, ?, ?)
+                    ''', (admin_id, action, target, len(user_ids)))
+                    action_id = cursor.lastrowid
+                    cursor.executemany(
+                        'INSERT INTO admin_action_users (action_id, user_id) VALUES (?, ?)',
+                        [(action_id, user_id) for user_id in user_ids])
+                conn.commit()
+                return user_ids
+        except Exception as e:
+            logger.error(f"Error running bulk {action}: {e}")
+            return None
+    
+    def list_admin_actions(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Most recent bulk actions, newest first"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT * FROM admin_actions ORDER BY id DESC LIMIT ?
+                ''', (limit,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error listing admin actions: {e}")
+            return []
+    
+    # Daily rollups
+    def add_rollup_counts(self, counts: Dict[tuple, int]) -> bool:
+        """Add buffered {(day, metric, dimension): amount} event counts in one transaction"""
+        if not counts:
+            return True
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO daily_rollups (day, metric, dimension, value)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (day, metric, dimension) DO UPDATE SET
+                        value = value + excluded.value
+                ''', [(day, metric, dimension, amount)
+                      for (day, metric, dimension), amount in counts.items()])
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error adding rollup counts: {e}")
+            return False
+    
+    def materialize_rollups(self, since_day: Optional[str] = None) -> bool:
+        """Rebuild derived daily metrics for days >= since_day (all history if None)"""
+        since_day = since_day or '0000-01-01'
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    DELETE FROM daily_rollups
+                    WHERE day >= ? AND metric IN ('registrations', 'views', 'plays')
+                ''', (since_day,))
+                # Ranges on created_at and day keep these on idx_users_created and the views key.
+                # created_at is UTC; registrations are bucketed by local day like views
+                cursor.execute('''
+                    INSERT INTO daily_rollups (day, metric, dimension, value)
+                    SELECT date(created_at, 'localtime'), 'registrations', COALESCE(province, ''), COUNT(*)
+                    FROM users
+                    WHERE created_at >= datetime(?, 'utc')
+                    GROUP BY date(created_at, 'localtime'), province
+                ''', (since_day,))
+                for metric in ('views', 'plays'):
+                    cursor.execute(f'''
+                        INSERT INTO daily_rollups (day, metric, dimension, value)
+                        SELECT v.day, '{metric}', cc.name, SUM(v.{metric})
+                        FROM content_views_daily v
+                        JOIN contents c ON c.id = v.content_id
+                        JOIN content_categories cc ON cc.id = c.category_id
+                        WHERE v.day >= ?
+                        GROUP BY v.day, cc.name
+                        HAVING SUM(v.{metric}) > 0
+                    ''', (since_day,))
+                conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Error materializing rollups: {e}")
+            return False
+    
+    def get_rollup_report(self, start_day: str, end_day: str) -> List[Dict[str, Any]]:
+        """Sum rollups per metric and dimension over an inclusive day range"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT metric, dimension, SUM(value) AS value
+                    FROM daily_rollups
+                    WHERE day BETWEEN ? AND ?
+                    GROUP BY metric, dimension
+                    ORDER BY metric, value DESC
+                ''', (start_day, end_day))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error getting rollup report: {e}")
+            return []
+    
+    # Exports stream through fetchmany so no table is ever held in memory
+    EXPORT_QUERIES = {
+        'users': '''
+            SELECT user_id, phone, first_name, last_name, province, city, role, is_active,
+                   created_at, updated_at, last_seen, interaction_count
+            FROM users ORDER BY user_id
+        ''',
+        'contents': '''
+            SELECT c.id, cc.name AS category, c.type, c.title, c.file_type, c.file_size,
+                   c.view_count, c.play_count, c.is_active, c.created_by, c.created_at
+            FROM contents c LEFT JOIN content_categories cc ON cc.id = c.category_id
+            ORDER BY c.id
+        ''',
+    }
+    
+    def iter_export_rows(self, kind: str, batch_size: int = 1000) -> Iterator[Any]:
+        """Yield the column names, then batches of row tuples for an export"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.EXPORT_QUERIES[kind])
+            yield [column[0] for column in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [tuple(row) for row in rows]
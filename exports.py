@@ -0,0 +1,51 @@
+"""
+CSV exports for admins
+Rows are streamed from a database cursor straight into a gzip-compressed
+CSV on disk, so memory use does not grow with the table.
+"""
+
+import csv
+import gzip
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Optional, Tuple
+
+from config import EXPORT_BATCH_SIZE
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+# Bot API limit for documents uploaded by bots
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+
+def write_csv_export(db_manager: DatabaseManager, kind: str, path: str,
+                     batch_size: int = EXPORT_BATCH_SIZE) -> int:
+    """Write one export to a .csv.gz file and return the number of data rows"""
+    rows = db_manager.iter_export_rows(kind, batch_size)
+    count = 0
+    # utf-8-sig so spreadsheet apps detect Persian text once the file is unpacked
+    with gzip.open(path, 'wt', encoding='utf-8-sig', newline='') as output:
+        writer = csv.writer(output)
+        writer.writerow(next(rows))
+        for batch in rows:
+            writer.writerows(batch)
+            count += len(batch)
+    return count
+
+
+def build_export(db_manager: DatabaseManager, kind: str) -> Tuple[Optional[str], str, int]:
+    """Export to a temp file; returns (path, file name to show, rows), path None on failure"""
+    file_name = f"{kind}-{datetime.now().strftime('%Y%m%d-%H%M')}.csv.gz"
+    handle, path = tempfile.mkstemp(suffix='.csv.gz', prefix=f'export-{kind}-')
+    os.close(handle)
+    try:
+        count = write_csv_export(db_manager, kind, path)
+        logger.info(f"Exported {count} {kind} rows ({os.path.getsize(path)} bytes)")
+        return path, file_name, count
+    except Exception as e:
+        logger.error(f"Error exporting {kind}: {e}")
+        os.remove(path)
+        return None, file_name, 0
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Telegram Bot API
+Lets TextBekharBot run offline for load and latency testing.
+
+Usage:
+    python fake_api.py --port 8081 --latency-ms 40 --rate-limit-ratio 0.02 \
+        --replay traffic.jsonl --record calls.jsonl
+
+Then start the bot with TELEGRAM_API_URL=http://127.0.0.1:8081
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'TextBekharBot', 'username': 'textbekhar_fake_bot'}
+
+# Methods whose first response to a chat closes that chat's latency sample
+REPLY_METHODS = {'sendMessage', 'sendDocument', 'sendAudio', 'sendMediaGroup', 'editMessageText'}
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class FakeTelegramAPI:
+    """In-memory Bot API state: pending updates, sent messages and statistics"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0,
+                 rate_limit_ratio: float = 0, retry_after: int = 1,
+                 record_path: Optional[str] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+
+        self._updates = deque()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._condition = threading.Condition()
+        self._pending_replies = defaultdict(deque)
+        self._record_file = open(record_path, 'a', encoding='utf-8') if record_path else None
+        self._record_lock = threading.Lock()
+
+        self.started_at = time.monotonic()
+        self.method_counts = defaultdict(int)
+        self.rate_limited = 0
+        self.updates_pushed = 0
+        self.updates_delivered = 0
+        self.reply_latencies = []
+
+    # Update queue
+    def push_update(self, update: Dict[str, Any]) -> int:
+        """Queue an update for getUpdates, assigning an update_id if missing"""
+        with self._condition:
+            if 'update_id' not in update:
+                update['update_id'] = self._next_update_id
+            self._next_update_id = max(self._next_update_id, update['update_id'] + 1)
+            self._updates.append(update)
+            self.updates_pushed += 1
+
+            chat_id = self._chat_id_of(update)
+            if chat_id is not None:
+                self._pending_replies[chat_id].append(time.monotonic())
+
+            self._condition.notify_all()
+            return update['update_id']
+
+    def get_updates(self, offset: int, limit: int, timeout: float) -> List[Dict[str, Any]]:
+        """Confirm updates below offset and long-poll for the next ones"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._updates and self._updates[0]['update_id'] < offset:
+                self._updates.popleft()
+
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._condition.wait(remaining)
+                while self._updates and self._updates[0]['update_id'] < offset:
+                    self._updates.popleft()
+
+            batch = list(self._updates)[:limit]
+            self.updates_delivered += len(batch)
+            return batch
+
+    @staticmethod
+    def _chat_id_of(update: Dict[str, Any]) -> Optional[int]:
+        """Find the chat (or user) an update expects an answer in"""
+        for payload in update.values():
+            if not isinstance(payload, dict):
+                continue
+            if isinstance(payload.get('chat'), dict):
+                return payload['chat']['id']
+            if isinstance(payload.get('message'), dict):
+                return payload['message']['chat']['id']
+            if isinstance(payload.get('from'), dict):
+                return payload['from']['id']
+        return None
+
+    # Outgoing calls
+    def _new_message(self, chat_id, **fields) -> Dict[str, Any]:
+        with self._condition:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'from': BOT_USER
+        }
+        message.update(fields)
+        return message
+
+    def _record_reply(self, method: str, params: Dict[str, Any]):
+        """Close the latency sample of the oldest unanswered update in the chat"""
+        chat_id = params.get('chat_id') or params.get('user_id')
+        if method not in REPLY_METHODS or chat_id is None:
+            return
+        with self._condition:
+            pending = self._pending_replies.get(int(chat_id))
+            if pending:
+                self.reply_latencies.append(time.monotonic() - pending.popleft())
+
+    def _record_call(self, method: str, params: Dict[str, Any]):
+        if not self._record_file:
+            return
+        with self._record_lock:
+            self._record_file.write(json.dumps(
+                {'time': time.time(), 'method': method, 'params': params}, ensure_ascii=False) + '\n')
+            self._record_file.flush()
+
+    def call(self, method: str, params: Dict[str, Any]):
+        """Handle one Bot API call; returns (http_status, response body)"""
+        with self._condition:
+            self.method_counts[method] += 1
+        self._record_call(method, params)
+
+        if method == 'getUpdates':
+            updates = self.get_updates(
+                int(params.get('offset', 0) or 0),
+                int(params.get('limit', 100) or 100),
+                float(params.get('timeout', 0) or 0))
+            return 200, {'ok': True, 'result': updates}
+
+        if self.latency_ms or self.jitter_ms:
+            time.sleep((self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000)
+
+        if self.rate_limit_ratio and random.random() < self.rate_limit_ratio:
+            with self._condition:
+                self.rate_limited += 1
+            return 429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after}
+            }
+
+        self._record_reply(method, params)
+        return 200, {'ok': True, 'result': self._result_for(method, params)}
+
+    def _result_for(self, method: str, params: Dict[str, Any]):
+        chat_id = params.get('chat_id', 0)
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'sendMessage':
+            return self._new_message(chat_id, text=params.get('text', ''))
+        if method in ('sendDocument', 'sendAudio'):
+            kind = 'document' if method == 'sendDocument' else 'audio'
+            file_id = params.get(kind) or f"fake-{kind}-{random.getrandbits(32)}"
+            return self._new_message(chat_id, **{kind: {'file_id': file_id, 'file_unique_id': file_id}})
+        if method == 'sendMediaGroup':
+            media = json.loads(params.get('media', '[]'))
+            return [self._new_message(chat_id, media_group_id='fake-group') for _ in media]
+        if method in ('editMessageText', 'editMessageReplyMarkup'):
+            message = self._new_message(chat_id, text=params.get('text', ''))
+            message['message_id'] = int(params.get('message_id', message['message_id']))
+            return message
+        # answerCallbackQuery, answerInlineQuery, deleteMessage and friends
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Throughput and reply latency summary since start"""
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        latencies = list(self.reply_latencies)
+        return {
+            'elapsed_seconds': round(elapsed, 3),
+            'updates_pushed': self.updates_pushed,
+            'updates_delivered': self.updates_delivered,
+            'replies': len(latencies),
+            'replies_per_second': round(len(latencies) / elapsed, 2),
+            'rate_limited': self.rate_limited,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50) * 1000, 2),
+                'p95': round(percentile(latencies, 0.95) * 1000, 2),
+                'p99': round(percentile(latencies, 0.99) * 1000, 2),
+            },
+            'methods': dict(self.method_counts),
+        }
+
+    def replay(self, path: str, speed: float = 1.0):
+        """Push recorded updates, keeping their original spacing divided by speed"""
+        previous_time = None
+        with open(path, encoding='utf-8') as replay_file:
+            for line in replay_file:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                update = entry.get('update', entry)
+                recorded_time = entry.get('time')
+
+                if speed > 0 and recorded_time is not None and previous_time is not None:
+                    time.sleep(max(recorded_time - previous_time, 0) / speed)
+                previous_time = recorded_time
+
+                update.pop('update_id', None)
+                self.push_update(update)
+        logger.info(f"Replayed updates from {path}")
+
+
+class FakeAPIRequestHandler(BaseHTTPRequestHandler):
+    """Routes /bot<token>/<method> calls and the /push and /stats helpers"""
+
+    api: FakeTelegramAPI = None
+
+    def _read_params(self) -> Dict[str, Any]:
+        parsed = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        content_type = self.headers.get('Content-Type', '')
+        if body and content_type.startswith('application/json'):
+            params.update(json.loads(body))
+        elif body and content_type.startswith('application/x-www-form-urlencoded'):
+            params.update({key: values[-1] for key, values in parse_qs(body.decode()).items()})
+        return params
+
+    def _send_json(self, status: int, payload: Any):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        path = urlparse(self.path).path
+        params = self._read_params()
+
+        if path == '/stats':
+            self._send_json(200, self.api.stats())
+        elif path == '/push':
+            self._send_json(200, {'ok': True, 'update_id': self.api.push_update(params)})
+        elif path.startswith('/bot') and path.count('/') == 2:
+            status, payload = self.api.call(path.rsplit('/', 1)[1], params)
+            self._send_json(status, payload)
+        else:
+            self._send_json(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def create_server(api: FakeTelegramAPI, host: str = '127.0.0.1', port: int = 8081) -> ThreadingHTTPServer:
+    """Build an HTTP server bound to the given fake API state"""
+    handler = type('BoundFakeAPIRequestHandler', (FakeAPIRequestHandler,), {'api': api})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0, help="delay added to every call")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="random extra delay per call")
+    parser.add_argument('--rate-limit-ratio', type=float, default=0,
+                        help="fraction of calls answered with 429 Too Many Requests")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--record', help="append every incoming call to this JSONL file")
+    parser.add_argument('--replay', help="JSONL file of updates to feed through getUpdates")
+    parser.add_argument('--replay-speed', type=float, default=0,
+                        help="replay speed multiplier; 0 pushes everything at once")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    api = FakeTelegramAPI(args.latency_ms, args.jitter_ms, args.rate_limit_ratio,
+                          args.retry_after, args.record)
+    server = create_server(api, args.host, args.port)
+
+    if args.replay:
+        threading.Thread(target=api.replay, args=(args.replay, args.replay_speed), daemon=True).start()
+
+    print(f"Fake Bot API listening on http://{args.host}:{args.port}")
+    print(f"Run the bot with TELEGRAM_API_URL=http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(api.stats(), indent=2, ensure_ascii=False))
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
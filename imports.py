@@ -0,0 +1,177 @@
+"""
+Bulk user import from CSV
+Rows are validated in one streaming pass and upserted in chunked
+transactions; a user that already exists keeps its role, created_at and
+ban state. Accepts plain or gzip-compressed CSV, including the files
+produced by exports.py.
+
+    python -m imports customers.csv [--db path/to/data.db]
+"""
+
+import argparse
+import csv
+import gzip
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
+
+from config import PROVINCE_CITIES, IMPORT_CHUNK_SIZE, DATABASE_PATH
+from database import DatabaseManager
+from rollups import RollupManager
+from utils import InputValidator
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ('user_id', 'phone', 'first_name', 'last_name', 'province')
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+ERROR_SAMPLE_SIZE = 10
+
+
+def _open_csv(path: str):
+    """Open a CSV for reading, transparently unpacking gzip"""
+    with open(path, 'rb') as probe:
+        compressed = probe.read(2) == b'\x1f\x8b'
+    if compressed:
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, 'r', encoding='utf-8-sig', newline='')
+
+
+def validate_row(row: Dict[str, str]) -> Tuple[Optional[tuple], Optional[str]]:
+    """Return (values for DatabaseManager.import_users, None) or (None, error)"""
+    values = {key: (row.get(key) or '').strip() for key in
+              REQUIRED_COLUMNS + ('city', 'created_at')}
+
+    if not InputValidator.validate_user_id(values['user_id'] or '0'):
+        return None, "شناسه کاربری نامعتبر"
+    if not InputValidator.validate_phone_number(values['phone']):
+        return None, "شماره تلفن نامعتبر"
+    if not InputValidator.validate_name(values['first_name']):
+        return None, "نام نامعتبر"
+    if not InputValidator.validate_name(values['last_name']):
+        return None, "نام خانوادگی نامعتبر"
+    if not InputValidator.validate_province(values['province']):
+        return None, "استان نامعتبر"
+
+    created_at = None
+    if values['created_at']:
+        for date_format in DATE_FORMATS:
+            try:
+                created_at = datetime.strptime(values['created_at'], date_format).strftime('%Y-%m-%d %H:%M:%S')
+                break
+            except ValueError:
+                continue
+        else:
+            return None, "تاریخ عضویت نامعتبر"
+
+    return (
+        int(values['user_id']),
+        values['phone'],
+        InputValidator.sanitize_text(values['first_name']),
+        InputValidator.sanitize_text(values['last_name']),
+        values['province'],
+        values['city'] or PROVINCE_CITIES.get(values['province'], values['province']),
+        created_at,
+    ), None
+
+
+class UserImporter:
+    """Streams a CSV into the users table and collects a row-level error report"""
+
+    def __init__(self, db_manager: DatabaseManager, chunk_size: int = IMPORT_CHUNK_SIZE):
+        self.db = db_manager
+        self.chunk_size = chunk_size
+        self._error_file = None
+        self._error_writer = None
+
+    def run(self, path: str) -> Dict[str, Any]:
+        """Import a file; the report's error_path (if any) is a CSV the caller must delete"""
+        report = {
+            'rows': 0, 'inserted': 0, 'updated': 0, 'errors': 0, 'error_samples': [],
+            'error_path': None, 'earliest_created_at': None, 'elapsed': 0.0, 'rows_per_second': 0.0,
+        }
+        started = time.perf_counter()
+        chunk = []
+        self._error_file = self._error_writer = None
+        try:
+            with _open_csv(path) as source:
+                reader = csv.DictReader(source)
+                missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+                if missing:
+                    report['fatal'] = f"ستون‌های الزامی یافت نشد: {', '.join(missing)}"
+                    return report
+
+                for line_number, row in enumerate(reader, start=2):
+                    report['rows'] += 1
+                    values, error = validate_row(row)
+                    if error:
+                        self._add_error(report, line_number, row.get('user_id'), error)
+                        continue
+                    if values[6] and (report['earliest_created_at'] is None
+                                      or values[6] < report['earliest_created_at']):
+                        report['earliest_created_at'] = values[6]
+                    chunk.append((line_number, values))
+                    if len(chunk) >= self.chunk_size:
+                        self._write_chunk(report, chunk)
+                        chunk = []
+                self._write_chunk(report, chunk)
+        except (UnicodeDecodeError, csv.Error, OSError) as e:
+            report['fatal'] = f"فایل CSV قابل خواندن نیست: {e}"
+        finally:
+            if self._error_file:
+                self._error_file.close()
+            report['elapsed'] = time.perf_counter() - started
+            report['rows_per_second'] = report['rows'] / max(report['elapsed'], 1e-9)
+        return report
+
+    def _write_chunk(self, report: Dict[str, Any], chunk: list):
+        if not chunk:
+            return
+        result = self.db.import_users([values for _, values in chunk])
+        if result is None:
+            for line_number, values in chunk:
+                self._add_error(report, line_number, values[0], "خطای پایگاه داده")
+            return
+        report['inserted'] += result[0]
+        report['updated'] += result[1]
+
+    def _add_error(self, report: Dict[str, Any], line_number: int, user_id, error: str):
+        """Count an error, keep a few for the summary and stream all of them to a CSV"""
+        report['errors'] += 1
+        if len(report['error_samples']) < ERROR_SAMPLE_SIZE:
+            report['error_samples'].append((line_number, user_id, error))
+        if self._error_writer is None:
+            handle, report['error_path'] = tempfile.mkstemp(suffix='.csv', prefix='import-errors-')
+            self._error_file = os.fdopen(handle, 'w', encoding='utf-8-sig', newline='')
+            self._error_writer = csv.writer(self._error_file)
+            self._error_writer.writerow(['line', 'user_id', 'error'])
+        self._error_writer.writerow([line_number, user_id, error])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import users from a CSV file")
+    parser.add_argument('path', help="CSV or gzip-compressed CSV file")
+    parser.add_argument('--db', default=DATABASE_PATH, help="database file")
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    db = DatabaseManager(args.db, profile=False)
+    try:
+        report = UserImporter(db, args.chunk_size).run(args.path)
+        if report['earliest_created_at']:
+            RollupManager(db).rewind(report['earliest_created_at'][:10])
+    finally:
+        db.close()
+
+    if report.get('fatal'):
+        raise SystemExit(report['fatal'])
+    print(f"{report['rows']:,} rows in {report['elapsed']:.1f}s ({report['rows_per_second']:,.0f} rows/s): "
+          f"{report['inserted']:,} inserted, {report['updated']:,} updated, {report['errors']:,} errors")
+    if report['error_path']:
+        print(f"Row errors written to {report['error_path']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Logging pipeline for TextBekharBot
+Records are handed to a queue on the calling thread and written by a
+listener thread, so slow disks never hold up update handlers.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import (
+    LOG_LEVEL, LOG_FILE, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+    LOG_ROTATE_WHEN, LOG_COMPRESS, LOG_QUEUE_SIZE
+)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+CONTEXT_FIELDS = ('update_id', 'user_id', 'handler')
+
+_context = threading.local()
+_listener: Optional[logging.handlers.QueueListener] = None
+_log_queue = None
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach fields (update_id, user_id, handler) to records logged in this block"""
+    previous = getattr(_context, 'fields', {})
+    _context.fields = {**previous, **{k: v for k, v in fields.items() if v is not None}}
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+class ContextFilter(logging.Filter):
+    """Copies the current log context onto each record before it is queued"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, getattr(_context, 'fields', {}).get(field))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _gzip_rotator(source: str, dest: str):
+    # Imported here: rotation is rare and start-up should not pay for it
+    import gzip
+    with open(source, 'rb') as source_file, gzip.open(dest, 'wb') as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
+
+
+def _build_file_handler() -> logging.Handler:
+    """Size-based rotation by default; LOG_ROTATE_WHEN switches to time-based"""
+    directory = os.path.dirname(LOG_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    if LOG_ROTATE_WHEN:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+
+    if LOG_COMPRESS:
+        handler.namer = lambda name: name + '.gz'
+        handler.rotator = _gzip_rotator
+    return handler
+
+
+def _install_queue_handler(log_queue):
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    for handler in list(root.handlers):
+        if isinstance(handler, DroppingQueueHandler):
+            root.removeHandler(handler)
+
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    root.addHandler(queue_handler)
+
+
+def setup_logging(multiprocess: bool = False):
+    """Route all logging through a queue drained by a listener thread"""
+    global _listener, _log_queue
+    if _listener:
+        return _listener
+
+    if multiprocess:
+        # Supervisor workers log into the same queue (see attach_worker_logging)
+        import multiprocessing
+        _log_queue = multiprocessing.get_context('spawn').Queue(LOG_QUEUE_SIZE)
+    else:
+        _log_queue = queue.Queue(LOG_QUEUE_SIZE)
+
+    formatter = JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+    output_handlers = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        output_handlers.append(_build_file_handler())
+    for handler in output_handlers:
+        handler.setFormatter(formatter)
+
+    _install_queue_handler(_log_queue)
+    _listener = logging.handlers.QueueListener(_log_queue, *output_handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def attach_worker_logging(log_queue):
+    """Send a worker process's records to the supervisor's listener"""
+    _install_queue_handler(log_queue)
+
+
+def get_log_queue():
+    """Queue of the running pipeline, or None if logging was not set up"""
+    return _log_queue
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
@@ -4,9 +4,16 @@ TextBekharBot Startup Script
 Professional Telegram Bot for TextBekhar Platform
 """
 
+import time
+
+# Taken before any other import so the startup report covers imports too
+STARTED_AT = time.perf_counter()
+
 import os
 import sys
+import signal
 import logging
+import argparse
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -16,11 +23,26 @@ load_dotenv()
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Run TextBekharBot")
+    parser.add_argument(
+        '--workers', type=int, default=int(os.getenv('BOT_WORKERS', '1')),
+        help="number of worker processes; more than 1 starts supervisor mode")
+    return parser.parse_args()
+
+
 def main():
     """Main entry point"""
+    args = parse_args()
+
+    from logging_config import setup_logging, stop_logging
+    setup_logging(multiprocess=args.workers > 1)
     try:
         # Import and run the bot
         from bot import TextBekharBot
+        from config import METRICS_PORT, METRICS_HOST
+        from metrics import start_metrics_server
 
         # Check if bot token is provided
         bot_token = os.getenv('BOT_TOKEN')
@@ -32,9 +54,29 @@ def main():
         print("Starting TextBekharBot...")
         print("Press Ctrl+C to stop the bot")
 
-        # Create and run bot
-        bot = TextBekharBot(bot_token)
-        bot.run()
+        # Create and run bot; supervisor mode shards updates across processes
+        if args.workers > 1:
+            # Only supervisor mode needs multiprocessing
+            from supervisor import UpdateSupervisor
+            print(f"Supervisor mode with {args.workers} worker processes")
+            bot = UpdateSupervisor(bot_token, args.workers)
+        else:
+            bot = TextBekharBot(bot_token, started_at=STARTED_AT)
+
+        if METRICS_PORT:
+            start_metrics_server(METRICS_PORT, METRICS_HOST)
+
+        def handle_stop_signal(signum, frame):
+            print(f"\nReceived {signal.Signals(signum).name}, stopping the bot...")
+            bot.stop()
+
+        signal.signal(signal.SIGINT, handle_stop_signal)
+        signal.signal(signal.SIGTERM, handle_stop_signal)
+
+        try:
+            bot.run()
+        finally:
+            bot.shutdown()
 
     except KeyboardInterrupt:
         print("\nBot stopped by user")
@@ -42,6 +84,8 @@ def main():
         logging.error(f"Fatal error: {e}")
         print(f"Fatal error: {e}")
         sys.exit(1)
+    finally:
+        stop_logging()
 
 
 if __name__ == '__main__':
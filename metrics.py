@@ -0,0 +1,289 @@
+"""
+Lightweight in-process metrics with a Prometheus text endpoint
+Counters, gauges and histograms are kept in memory and scraped from
+http://<METRICS_HOST>:<METRICS_PORT>/metrics
+"""
+
+import functools
+import logging
+import threading
+import time
+from typing import Optional, Dict, Callable, Tuple
+
+from telebot import apihelper
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = threading.local()
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metric:
+    """Base class: a named family of samples keyed by label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def samples(self):
+        """Yield (suffix, label string, value) tuples for exposition"""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield '', _format_labels(self.label_names, key), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {value}")
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self) -> float:
+        """Sum over all label values"""
+        with self._lock:
+            return sum(self._values.values())
+
+
+class Gauge(Metric):
+    """Value that goes up and down; may be read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, label_names)
+        self._functions = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """Sample the gauge by calling function on every scrape"""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def samples(self):
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                self._values[key] = function()
+            except Exception as e:
+                logger.error(f"Error sampling gauge {self.name}: {e}")
+        yield from super().samples()
+
+
+class Histogram(Metric):
+    """Bucketed distribution of observed values (seconds, usually)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), count, total)) for key, (counts, count, total) in self._values.items()]
+        for key, (counts, count, total) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield '_bucket', _format_labels(self.label_names, key, f'le="{bound}"'), bucket_count
+            yield '_bucket', _format_labels(self.label_names, key, 'le="+Inf"'), count
+            yield '_count', _format_labels(self.label_names, key), count
+            yield '_sum', _format_labels(self.label_names, key), round(total, 6)
+
+
+class MetricsRegistry:
+    """Holds every metric of this process and renders them for scraping"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+HANDLER_LATENCY = REGISTRY.register(Histogram(
+    'bot_handler_duration_seconds', "Time spent in each update handler", ('handler',)))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    'bot_handler_errors_total', "Errors raised or logged while a handler ran", ('handler',)))
+DB_QUERIES = REGISTRY.register(Counter(
+    'bot_db_queries_total', "SQL statements executed", ('statement',)))
+TELEGRAM_CALLS = REGISTRY.register(Counter(
+    'bot_telegram_calls_total', "Bot API requests by method and outcome", ('method', 'status')))
+TELEGRAM_LATENCY = REGISTRY.register(Histogram(
+    'bot_telegram_call_duration_seconds', "Bot API request latency", ('method',)))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'bot_queue_depth', "Updates waiting to be handled", ('queue',)))
+
+
+def current_handler() -> Optional[str]:
+    """Name of the handler running on this thread, if any"""
+    return getattr(_current, 'handler', None)
+
+
+def timed_handler(name: str, function: Callable) -> Callable:
+    """Wrap a handler so its latency and errors are recorded under name"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        previous = current_handler()
+        _current.handler = name
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=name)
+            _current.handler = previous
+    return wrapper
+
+
+def count_query(statement: str):
+    """sqlite3 trace callback: count statements by their leading keyword"""
+    # Statements run by triggers are reported as "-- TRIGGER name" comments
+    if statement.startswith('--'):
+        return
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'EMPTY'
+    DB_QUERIES.inc(statement=keyword)
+
+
+class ErrorLogCounter(logging.Handler):
+    """Counts ERROR records against the handler that was running when they were logged"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        # Called with the handler name, or None outside handlers, for every ERROR record
+        self.on_error: Optional[Callable[[Optional[str]], None]] = None
+
+    def emit(self, record: logging.LogRecord):
+        # Handlers catch their own exceptions and log them, so this is where errors surface
+        handler = current_handler()
+        if handler:
+            HANDLER_ERRORS.inc(handler=handler)
+        if self.on_error:
+            self.on_error(handler)
+
+
+def install_error_log_counter() -> ErrorLogCounter:
+    """Attach ErrorLogCounter to the root logger once and return it"""
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if isinstance(handler, ErrorLogCounter):
+            return handler
+    counter = ErrorLogCounter()
+    root.addHandler(counter)
+    return counter
+
+
+def instrument_telegram_api():
+    """Time and count every Bot API request made through telebot"""
+    make_request = apihelper._make_request
+    if getattr(make_request, 'instrumented', False):
+        return
+
+    @functools.wraps(make_request)
+    def timed_make_request(token, method_name, *args, **kwargs):
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            return make_request(token, method_name, *args, **kwargs)
+        except apihelper.ApiTelegramException as e:
+            status = str(e.error_code)
+            raise
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            TELEGRAM_LATENCY.observe(time.perf_counter() - started, method=method_name)
+            TELEGRAM_CALLS.inc(method=method_name, status=status)
+
+    timed_make_request.instrumented = True
+    apihelper._make_request = timed_make_request
+
+
+def start_metrics_server(port: int, host: str = '127.0.0.1'):
+    """Serve /metrics on a daemon thread; returns None if the port is unavailable"""
+    # Imported here so processes without a metrics port skip the HTTP server modules
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        """Serves the registry at /metrics"""
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    except OSError as e:
+        logger.error(f"Could not start metrics server on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='MetricsServer', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,99 @@
+"""
+Daily analytics rollups
+Aggregates live in the daily_rollups table, one row per (day, metric,
+dimension). Metrics derived from other tables are re-materialized from a
+watermark on each refresh; event metrics (admin messages, errors) are
+counted in memory and added on flush. Reports then read a few hundred
+rows by primary key instead of scanning raw tables.
+"""
+
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Tuple
+
+from config import ROLLUP_INTERVAL
+from database import DatabaseManager
+from utils import PeriodicFlusher
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_KEY = 'rollup_watermark'
+
+
+class RollupManager(PeriodicFlusher):
+    """Keeps daily_rollups current: periodic incremental refresh plus buffered event counts"""
+
+    THREAD_NAME = 'Rollups'
+    # First pass right away so a fresh database gets its history backfilled
+    FLUSH_ON_START = True
+
+    def __init__(self, db_manager: DatabaseManager, interval: float = ROLLUP_INTERVAL, refresh: bool = True):
+        # With refresh=False the thread only flushes event counts; another process refreshes
+        super().__init__(interval)
+        self.db = db_manager
+        self.refresh_in_background = refresh
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def record(self, metric: str, dimension: str = '', amount: int = 1):
+        """Count an event for today"""
+        key = (date.today().isoformat(), metric, dimension or '')
+        with self._lock:
+            self._pending[key] += amount
+
+    def flush(self) -> bool:
+        """Add buffered event counts to today's rows; keeps them buffered if the write fails"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+        if not pending:
+            return True
+        if not self.db.add_rollup_counts(pending):
+            with self._lock:
+                for key, amount in pending.items():
+                    self._pending[key] += amount
+            return False
+        return True
+
+    def refresh(self) -> bool:
+        """Re-materialize derived metrics from the watermark day onwards"""
+        with self._refresh_lock:
+            since = self.db.get_state(WATERMARK_KEY)
+            if not self.db.materialize_rollups(since):
+                return False
+            # Keep yesterday open too, for view counts still buffered across midnight
+            self.db.set_state(WATERMARK_KEY, (date.today() - timedelta(days=1)).isoformat())
+            if since is None:
+                logger.info("Rollups backfilled from full history")
+            return True
+
+    def rewind(self, since_day: str):
+        """Move the watermark back so the next refresh rebuilds days from since_day"""
+        with self._refresh_lock:
+            watermark = self.db.get_state(WATERMARK_KEY)
+            if watermark is not None and since_day < watermark:
+                self.db.set_state(WATERMARK_KEY, since_day)
+
+    def report(self, start_day: str, end_day: str) -> Dict[Tuple[str, str], int]:
+        """Totals per (metric, dimension) for an inclusive range of days"""
+        self.flush()
+        self.refresh()
+        return {
+            (row['metric'], row['dimension']): row['value']
+            for row in self.db.get_rollup_report(start_day, end_day)
+        }
+
+    def _tick(self):
+        self.flush()
+        if self.refresh_in_background:
+            self.refresh()
+
+
+def install_error_rollup(rollups: RollupManager):
+    """Count ERROR records per handler into the daily errors rollup, replacing an older rollup"""
+    # The metrics error counter already sees every ERROR record; rollups listen to it
+    metrics.install_error_log_counter().on_error = (
+        lambda handler: rollups.record('errors', handler or 'background'))
@@ -0,0 +1,184 @@
+"""
+Scheduled message delivery
+Jobs are stored in the scheduled_jobs table and mirrored in an in-memory
+heap; a single thread sleeps until the earliest job is due, so the
+database is only read at start-up, on a periodic rescan for jobs stored
+by other worker processes, and when a job runs.
+"""
+
+import heapq
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, Callable
+
+from config import SCHEDULER_MISFIRE_GRACE, SCHEDULER_LEASE, SCHEDULER_RESCAN_INTERVAL
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+_RELATIVE = re.compile(r'^\+(\d+)([mhd])$')
+_CLOCK = re.compile(r'^(\d{1,2}):(\d{2})$')
+_DATETIME = re.compile(r'^(\d{4})-(\d{2})-(\d{2})(?:[T_](\d{1,2}):(\d{2}))?$')
+RELATIVE_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+def parse_run_at(text: str, now: Optional[datetime] = None) -> datetime:
+    """Parse +30m / +2h / +1d, HH:MM (next occurrence) or YYYY-MM-DDTHH:MM in server time"""
+    now = now or datetime.now()
+    text = text.strip()
+
+    match = _RELATIVE.match(text)
+    if match:
+        return now + timedelta(**{RELATIVE_UNITS[match.group(2)]: int(match.group(1))})
+
+    match = _CLOCK.match(text)
+    if match:
+        run_at = now.replace(hour=int(match.group(1)), minute=int(match.group(2)), second=0, microsecond=0)
+        return run_at if run_at > now else run_at + timedelta(days=1)
+
+    match = _DATETIME.match(text)
+    if match:
+        year, month, day, hour, minute = (int(part or 0) for part in match.groups())
+        run_at = datetime(year, month, day, hour, minute)
+        if run_at <= now:
+            raise ValueError("time is in the past")
+        return run_at
+
+    raise ValueError(f"unrecognized time {text!r}")
+
+
+class Scheduler:
+    """Runs due jobs on one thread that wakes only for the next job in the heap"""
+
+    # Heap entry that makes the timer thread look for jobs it does not know about;
+    # job ids start at 1
+    RESCAN = 0
+
+    def __init__(self, db_manager: DatabaseManager, execute: Callable[[Dict[str, Any]], bool],
+                 misfire_grace: float = SCHEDULER_MISFIRE_GRACE, lease: float = SCHEDULER_LEASE,
+                 rescan_interval: float = SCHEDULER_RESCAN_INTERVAL):
+        # execute returns False when it stopped early; the job then runs again later
+        self.db = db_manager
+        self.execute = execute
+        self.misfire_grace = misfire_grace
+        self.lease = lease
+        self.rescan_interval = rescan_interval
+        self._heap = []
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping
+
+    def start(self):
+        """Load pending jobs, including ones missed while the bot was down, and start the timer thread"""
+        if self._thread is not None:
+            return
+        jobs = self.db.get_runnable_jobs()
+        with self._condition:
+            for job in jobs:
+                heapq.heappush(self._heap, (job['run_at'], job['id']))
+            heapq.heappush(self._heap, (time.time() + self.rescan_interval, self.RESCAN))
+        overdue = sum(1 for job in jobs if job['run_at'] <= time.time())
+        if overdue:
+            logger.info(f"Catching up on {overdue} scheduled jobs missed while offline")
+        self._thread = threading.Thread(target=self._run, name='Scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Wake the timer thread and wait for the job in progress to save its place"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def schedule(self, run_at: float, target: str, message: str, created_by: int) -> Optional[int]:
+        """Store a job and wake the timer thread if it is now the earliest"""
+        job_id = self.db.add_scheduled_job(run_at, target, message, created_by)
+        if job_id is None:
+            return None
+        with self._condition:
+            heapq.heappush(self._heap, (run_at, job_id))
+            if self._heap[0][1] == job_id:
+                self._condition.notify()
+        return job_id
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a pending job; its heap entry is skipped when it comes due"""
+        return self.db.cancel_scheduled_job(job_id)
+
+    def _next_due(self) -> Optional[int]:
+        """Block until a job is due or the scheduler stops"""
+        with self._condition:
+            while not self._stopping:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                return heapq.heappop(self._heap)[1]
+        return None
+
+    def _run(self):
+        while True:
+            job_id = self._next_due()
+            if job_id is None:
+                return
+            if job_id == self.RESCAN:
+                self._rescan()
+            else:
+                self._run_job(job_id)
+
+    def _rescan(self):
+        """Queue jobs stored by other worker processes or whose lease expired, e.g. after a crash"""
+        try:
+            jobs = self.db.get_runnable_jobs()
+        except Exception as e:
+            logger.error(f"Error rescanning scheduled jobs: {e}")
+            jobs = []
+        with self._condition:
+            known = {job_id for _, job_id in self._heap}
+            for job in jobs:
+                if job['id'] not in known:
+                    logger.info(f"Picking up scheduled job {job['id']} found on rescan")
+                    heapq.heappush(self._heap, (job['run_at'], job['id']))
+            heapq.heappush(self._heap, (time.time() + self.rescan_interval, self.RESCAN))
+
+    def _run_job(self, job_id: int):
+        # Claiming fails for cancelled jobs and ones another worker process is running
+        job = self.db.claim_scheduled_job(job_id, time.time() + self.lease)
+        if not job:
+            return
+
+        overdue = time.time() - job['run_at']
+        if job['last_user_id'] is None and self.misfire_grace and overdue > self.misfire_grace:
+            logger.warning(f"Scheduled job {job_id} missed by {overdue / 3600:.1f}h, not sending")
+            self.db.finish_scheduled_job(job_id, 'missed')
+            return
+
+        try:
+            finished = self.execute(job)
+        except Exception as e:
+            logger.error(f"Error running scheduled job {job_id}: {e}")
+            self.db.finish_scheduled_job(job_id, 'failed', str(e))
+            return
+
+        if finished:
+            self.db.finish_scheduled_job(job_id, 'done')
+        else:
+            # Interrupted by shutdown; progress is saved so the next start resumes it
+            self.db.release_scheduled_job(job_id)
+
+    def extend_lease(self, job_id: int, last_user_id: int, sent: int, failed: int) -> bool:
+        """Save delivery progress and keep other workers from taking the job over"""
+        return self.db.update_scheduled_job_progress(
+            job_id, last_user_id, sent, failed, time.time() + self.lease)
@@ -0,0 +1,268 @@
+"""
+Audience segments for admin campaigns
+A small filter language over the users table, for example:
+
+    province = "خراسان رضوی" and joined within 30d
+    role in (admin, super_admin) or (city = مشهد and not active = no)
+    last_seen within 7d and interactions >= 10
+    first_name contains "t.me/" or user_id in (77126477, 5123456789)
+
+Definitions compile to a parameterized WHERE clause over whitelisted
+columns; values never reach the SQL text.
+"""
+
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+
+from config import UserRole, SEGMENT_COUNT_TTL, SEGMENT_BATCH_SIZE
+from database import DatabaseManager
+
+
+class SegmentError(ValueError):
+    """Raised for a definition that does not parse or names an unknown field"""
+
+
+# Field name -> (column, kind); several names may map to one column
+FIELDS = {
+    'user_id': ('user_id', 'number'),
+    'first_name': ('first_name', 'text'),
+    'last_name': ('last_name', 'text'),
+    'phone': ('phone', 'text'),
+    'province': ('province', 'text'),
+    'city': ('city', 'text'),
+    'role': ('role', 'role'),
+    'joined': ('created_at', 'date'),
+    'created_at': ('created_at', 'date'),
+    'active': ('is_active', 'bool'),
+    'is_active': ('is_active', 'bool'),
+    'last_seen': ('last_seen', 'date'),
+    'seen': ('last_seen', 'date'),
+    'interactions': ('interaction_count', 'number'),
+}
+
+COMPARISONS = {'=', '!=', '>', '>=', '<', '<='}
+DURATION_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+BOOLEAN_VALUES = {'yes': 1, 'true': 1, '1': 1, 'بله': 1, 'no': 0, 'false': 0, '0': 0, 'خیر': 0}
+
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<string>"[^"]*"|'[^']*')
+      | (?P<op>!=|>=|<=|=|>|<)
+      | (?P<punct>[(),])
+      | (?P<word>[^\s()",'=!<>]+)
+    )''', re.VERBOSE)
+_DURATION = re.compile(r'^(\d+)([mhdw])$')
+_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+
+def tokenize(definition: str) -> List[Tuple[str, str]]:
+    """Split a definition into (kind, text) tokens; keywords are lower-cased words"""
+    tokens = []
+    position = 0
+    definition = definition.strip()
+    while position < len(definition):
+        match = _TOKEN.match(definition, position)
+        if not match or match.end() == position:
+            raise SegmentError(f"unexpected character at position {position}: {definition[position:position + 10]!r}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'string':
+            text = text[1:-1]
+        tokens.append((kind, text))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive descent: expr := term (or term)*, term := factor (and factor)*"""
+
+    def __init__(self, tokens: List[Tuple[str, str]], now: datetime):
+        self.tokens = tokens
+        self.position = 0
+        self.now = now
+        self.params = []
+
+    def _peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self) -> Tuple[str, str]:
+        token = self._peek()
+        if token is None:
+            raise SegmentError("definition ends too early")
+        self.position += 1
+        return token
+
+    def _keyword(self, *words: str) -> bool:
+        token = self._peek()
+        if token and token[0] == 'word' and token[1].lower() in words:
+            self.position += 1
+            return True
+        return False
+
+    def _expect(self, text: str):
+        kind, value = self._next()
+        if value != text:
+            raise SegmentError(f"expected {text!r} but found {value!r}")
+
+    def parse(self) -> str:
+        if not self.tokens:
+            raise SegmentError("empty definition")
+        sql = self._expr()
+        if self._peek() is not None:
+            raise SegmentError(f"unexpected {self._peek()[1]!r}")
+        return sql
+
+    def _expr(self) -> str:
+        parts = [self._term()]
+        while self._keyword('or'):
+            parts.append(self._term())
+        return parts[0] if len(parts) == 1 else '(' + ' OR '.join(parts) + ')'
+
+    def _term(self) -> str:
+        parts = [self._factor()]
+        while self._keyword('and'):
+            parts.append(self._factor())
+        return parts[0] if len(parts) == 1 else '(' + ' AND '.join(parts) + ')'
+
+    def _factor(self) -> str:
+        if self._keyword('not'):
+            return f"NOT {self._factor()}"
+        if self._peek() == ('punct', '('):
+            self.position += 1
+            sql = self._expr()
+            self._expect(')')
+            return sql
+        return self._condition()
+
+    def _condition(self) -> str:
+        kind, name = self._next()
+        field = FIELDS.get(name.lower()) if kind == 'word' else None
+        if not field:
+            raise SegmentError(f"unknown field {name!r}; use one of: {', '.join(sorted(FIELDS))}")
+        column, field_kind = field
+
+        negate = self._keyword('not')
+        if self._keyword('in'):
+            self._expect('(')
+            values = [self._value(field_kind)]
+            while self._peek() == ('punct', ','):
+                self.position += 1
+                values.append(self._value(field_kind))
+            self._expect(')')
+            self.params.extend(values)
+            return f"{column} {'NOT IN' if negate else 'IN'} ({', '.join('?' * len(values))})"
+        if negate:
+            raise SegmentError("'not' after a field must be followed by 'in'")
+
+        if self._keyword('contains'):
+            if field_kind != 'text':
+                raise SegmentError(f"'contains' only applies to text, not {name!r}")
+            value = re.sub(r'([\\%_])', r'\\\1', self._value(field_kind))
+            self.params.append(f"%{value}%")
+            return f"{column} LIKE ? ESCAPE '\\'"
+
+        if self._keyword('within'):
+            if field_kind != 'date':
+                raise SegmentError(f"'within' only applies to dates, not {name!r}")
+            self.params.append(self._value(field_kind))
+            return f"{column} >= ?"
+
+        op_kind, op = self._next()
+        if op_kind != 'op' or op not in COMPARISONS:
+            raise SegmentError(f"expected a comparison after {name!r} but found {op!r}")
+        if field_kind in ('bool', 'role') and op not in ('=', '!='):
+            raise SegmentError(f"{name!r} only supports = and !=")
+        self.params.append(self._value(field_kind))
+        return f"{column} {op} ?"
+
+    def _value(self, field_kind: str):
+        kind, text = self._next()
+        if kind not in ('word', 'string'):
+            raise SegmentError(f"expected a value but found {text!r}")
+
+        if field_kind == 'bool':
+            if text.lower() not in BOOLEAN_VALUES:
+                raise SegmentError(f"expected yes or no but found {text!r}")
+            return BOOLEAN_VALUES[text.lower()]
+        if field_kind == 'role':
+            roles = (UserRole.USER, UserRole.ADMIN, UserRole.SUPER_ADMIN)
+            if text not in roles:
+                raise SegmentError(f"unknown role {text!r}; use one of: {', '.join(roles)}")
+            return text
+        if field_kind == 'number':
+            if not re.match(r'^\d+$', text):
+                raise SegmentError(f"expected a number but found {text!r}")
+            return int(text)
+        if field_kind == 'date':
+            duration = _DURATION.match(text)
+            if duration:
+                # "30d" means 30 days ago, in the UTC layout of CURRENT_TIMESTAMP
+                delta = timedelta(**{DURATION_UNITS[duration.group(2)]: int(duration.group(1))})
+                return (self.now - delta).strftime('%Y-%m-%d %H:%M:%S')
+            if _DATE.match(text):
+                return text
+            raise SegmentError(f"expected a date (YYYY-MM-DD) or age like 30d but found {text!r}")
+        return text
+
+
+def compile_segment(definition: str, now: Optional[datetime] = None) -> Tuple[str, List[Any]]:
+    """Compile a definition into (where_sql, params)"""
+    parser = _Parser(tokenize(definition), now or datetime.now(timezone.utc))
+    return parser.parse(), parser.params
+
+
+class SegmentManager:
+    """Saved segments with cached member counts and streaming membership"""
+
+    def __init__(self, db_manager: DatabaseManager, count_ttl: float = SEGMENT_COUNT_TTL):
+        self.db = db_manager
+        self.count_ttl = count_ttl
+
+    def resolve(self, name_or_definition: str) -> str:
+        """A saved segment's definition, or the text itself if no segment has that name"""
+        segment = self.db.get_segment(name_or_definition.strip())
+        return segment['definition'] if segment else name_or_definition
+
+    def count(self, definition: str, active_only: bool = False) -> int:
+        where, params = compile_segment(definition)
+        if active_only:
+            where = f"({where}) AND is_active = 1"
+        return self.db.count_users_where(where, params)
+
+    def save(self, name: str, definition: str, created_by: int) -> int:
+        """Validate, count and store a segment; returns its member count"""
+        if not re.match(r'^[\w\-]{1,32}$', name):
+            raise SegmentError("segment names are up to 32 letters, digits, - or _")
+        member_count = self.count(definition)
+        self.db.save_segment(name, definition, member_count, created_by)
+        return member_count
+
+    def get_count(self, name: str) -> Optional[int]:
+        """Cached member count, recounted when older than count_ttl"""
+        segment = self.db.get_segment(name)
+        if not segment:
+            return None
+        if segment['counted_at'] is not None and time.time() - segment['counted_at'] < self.count_ttl:
+            return segment['member_count']
+        member_count = self.count(segment['definition'])
+        self.db.update_segment_count(name, member_count)
+        return member_count
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Saved segments with fresh-enough counts"""
+        segments = self.db.list_segments()
+        for segment in segments:
+            segment['member_count'] = self.get_count(segment['name'])
+        return segments
+
+    def iter_user_ids(self, name_or_definition: str, batch_size: int = SEGMENT_BATCH_SIZE,
+                      after_id: Optional[int] = None) -> Iterator[int]:
+        """Stream ids of active members in ascending order, optionally resuming after after_id"""
+        where, params = compile_segment(self.resolve(name_or_definition))
+        # Campaigns never reach banned users, whatever the definition says about them
+        where = f"({where}) AND is_active = 1"
+        for rows in self.db.iter_users_where(where, params, ('user_id',), batch_size, after_id):
+            for row in rows:
+                yield row['user_id']
@@ -0,0 +1,187 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Any, List
+
+from telebot import apihelper, types
+
+from config import (
+    BOT_TOKEN, POLLING_TIMEOUT, SHUTDOWN_TIMEOUT, UPDATE_BATCH_SIZE, RECENT_UPDATES_SIZE,
+    METRICS_PORT, METRICS_HOST
+)
+from database import DatabaseManager
+from utils import RecentIdSet
+from metrics import QUEUE_DEPTH, start_metrics_server
+from logging_config import attach_worker_logging, get_log_queue
+from bot import BekharTeleBot, TextBekharBot
+
+logger = logging.getLogger(__name__)
+
+# Same bot_state key as single-process mode, so either mode resumes the other's offset
+OFFSET_KEY = BekharTeleBot.OFFSET_KEY
+
+
+def shard_for_update(update: Dict[str, Any], num_workers: int) -> int:
+    """Pick the worker for an update so each user always lands on the same one"""
+    for payload in update.values():
+        if not isinstance(payload, dict):
+            continue
+        for field in ('from', 'user', 'chat'):
+            owner = payload.get(field)
+            if isinstance(owner, dict) and 'id' in owner:
+                return abs(owner['id']) % num_workers
+    return update.get('update_id', 0) % num_workers
+
+
+def run_worker(token: str, worker_index: int, update_queue, log_queue=None):
+    """Worker process entry point: handle every update routed to this shard"""
+    if log_queue is not None:
+        attach_worker_logging(log_queue)
+
+    # The supervisor owns signal handling and tells workers when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    # Non-threaded so updates of one user are handled strictly in order; only worker 0
+    # runs the scheduler and rollup refresh, every worker still flushes its own buffers
+    bot = TextBekharBot(token, threaded=False, track_offset=False, background=worker_index == 0)
+    if METRICS_PORT:
+        # The supervisor serves METRICS_PORT; each worker takes the next free one
+        start_metrics_server(METRICS_PORT + 1 + worker_index, METRICS_HOST)
+    parent = multiprocessing.parent_process()
+    logger.info(f"Worker {worker_index} ready")
+
+    try:
+        while True:
+            try:
+                batch = update_queue.get(timeout=1)
+            except queue.Empty:
+                if parent and not parent.is_alive():
+                    logger.warning(f"Worker {worker_index} lost its supervisor")
+                    break
+                continue
+
+            if batch is None:
+                break
+
+            # One update at a time so a failing handler cannot drop the rest of the batch
+            for update in batch:
+                try:
+                    bot.bot.process_new_updates([types.Update.de_json(update)])
+                except Exception as e:
+                    logger.error(
+                        f"Worker {worker_index} failed on update {update.get('update_id')}: {e}")
+    finally:
+        bot.shutdown()
+
+
+class UpdateSupervisor:
+    """Polls Telegram once and fans updates out to worker processes by user id"""
+
+    def __init__(self, token: str = BOT_TOKEN, num_workers: int = 2):
+        self.token = token
+        self.num_workers = num_workers
+        self.db = DatabaseManager()
+        self.recent_updates = RecentIdSet(RECENT_UPDATES_SIZE)
+        self._context = multiprocessing.get_context('spawn')
+        self._queues = [self._context.Queue() for _ in range(num_workers)]
+        self._workers = [None] * num_workers
+        self._stop_event = threading.Event()
+        self._is_shut_down = False
+
+        for index, update_queue in enumerate(self._queues):
+            QUEUE_DEPTH.set_function(update_queue.qsize, queue=f"worker{index}")
+
+        stored_offset = self.db.get_state(OFFSET_KEY)
+        self.last_update_id = int(stored_offset) if stored_offset else 0
+
+    def _start_worker(self, index: int):
+        """Start (or restart) the worker process for one shard"""
+        worker = self._context.Process(
+            target=run_worker,
+            args=(self.token, index, self._queues[index], get_log_queue()),
+            name=f"BotWorker{index}",
+            daemon=False
+        )
+        worker.start()
+        self._workers[index] = worker
+
+    def _ensure_workers_alive(self):
+        """Restart any worker process that exited unexpectedly"""
+        for index, worker in enumerate(self._workers):
+            if worker is None or not worker.is_alive():
+                if worker is not None:
+                    logger.error(f"Worker {index} exited with code {worker.exitcode}, restarting")
+                self._start_worker(index)
+
+    def dispatch(self, updates: List[Dict[str, Any]]):
+        """Commit the batch offset and route each new update to its shard"""
+        if not updates:
+            return
+
+        batches = defaultdict(list)
+        for update in updates:
+            update_id = update['update_id']
+            if update_id > self.last_update_id and self.recent_updates.add(update_id):
+                batches[shard_for_update(update, self.num_workers)].append(update)
+
+        batch_max_id = max(update['update_id'] for update in updates)
+        if batch_max_id > self.last_update_id:
+            self.last_update_id = batch_max_id
+            self.db.set_state(OFFSET_KEY, str(batch_max_id))
+
+        for index, batch in batches.items():
+            self._queues[index].put(batch)
+
+    def stop(self):
+        """Stop polling; safe to call from a signal handler"""
+        self._stop_event.set()
+
+    def run(self):
+        """Start the workers and poll until stopped"""
+        logger.info(f"Starting supervisor with {self.num_workers} workers...")
+        error_interval = 0.25
+
+        while not self._stop_event.is_set():
+            self._ensure_workers_alive()
+            try:
+                updates = apihelper.get_updates(
+                    self.token,
+                    offset=self.last_update_id + 1,
+                    limit=UPDATE_BATCH_SIZE,
+                    long_polling_timeout=POLLING_TIMEOUT
+                )
+                error_interval = 0.25
+            except Exception as e:
+                logger.error(f"Supervisor polling error: {e}")
+                self._stop_event.wait(error_interval)
+                error_interval = min(error_interval * 2, 60)
+                continue
+
+            self.dispatch(updates)
+
+    def shutdown(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """Ask every worker to finish its queue, then wait for them"""
+        if self._is_shut_down:
+            return
+        self._is_shut_down = True
+
+        deadline = time.monotonic() + timeout
+        for update_queue in self._queues:
+            update_queue.put(None)
+
+        for index, worker in enumerate(self._workers):
+            if worker is None:
+                continue
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                logger.warning(f"Worker {index} missed the shutdown deadline, terminating")
+                worker.terminate()
+                worker.join()
+
+        self.db.close()
+        logger.info("Supervisor shut down cleanly")
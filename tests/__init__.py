@@ -0,0 +1,4 @@
+"""
+Tests for TextBekharBot
+Run from the project root, e.g. python -m pytest tests
+"""
@@ -0,0 +1,56 @@
+"""
+/schedule time parsing: relative offsets, next clock time and absolute
+dates, all in server time.
+"""
+
+from datetime import datetime
+
+import pytest
+
+from scheduler import parse_run_at
+
+NOW = datetime(2026, 3, 20, 22, 15, 30)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('+30m', datetime(2026, 3, 20, 22, 45, 30)),
+    ('+2h', datetime(2026, 3, 21, 0, 15, 30)),
+    ('+1d', datetime(2026, 3, 21, 22, 15, 30)),
+    ('  +5m ', datetime(2026, 3, 20, 22, 20, 30)),
+])
+def test_relative_offsets(text, expected):
+    assert parse_run_at(text, NOW) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('23:00', datetime(2026, 3, 20, 23, 0)),
+    ('9:05', datetime(2026, 3, 21, 9, 5)),
+    ('22:15', datetime(2026, 3, 21, 22, 15)),
+    ('22:16', datetime(2026, 3, 20, 22, 16)),
+])
+def test_clock_time_is_the_next_occurrence(text, expected):
+    assert parse_run_at(text, NOW) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2026-03-21', datetime(2026, 3, 21, 0, 0)),
+    ('2026-03-21T08:30', datetime(2026, 3, 21, 8, 30)),
+    ('2026-04-01_18:00', datetime(2026, 4, 1, 18, 0)),
+])
+def test_absolute_dates(text, expected):
+    assert parse_run_at(text, NOW) == expected
+
+
+@pytest.mark.parametrize('text', ['2026-03-20T22:15', '2026-03-20', '2025-12-31T23:59'])
+def test_absolute_dates_in_the_past_are_rejected(text):
+    with pytest.raises(ValueError, match='past'):
+        parse_run_at(text, NOW)
+
+
+@pytest.mark.parametrize('text', [
+    '', 'soon', '+30', '+30s', '-1h', '30m', '24:00', '12:60', '12:5',
+    '2026-02-30', '2026-13-01T10:00', '2026/03/21', '2026-03-21 08:30',
+])
+def test_unrecognized_or_invalid_times_are_rejected(text):
+    with pytest.raises(ValueError):
+        parse_run_at(text, NOW)
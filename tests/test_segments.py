@@ -0,0 +1,127 @@
+"""
+Segment language: precedence, list operators, LIKE escaping and the
+value checks that keep admin input out of the SQL text.
+"""
+
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from segments import SegmentError, compile_segment
+
+NOW = datetime(2026, 1, 31, 12, 0, 0)
+
+
+def compile_at_now(definition: str):
+    return compile_segment(definition, NOW)
+
+
+@pytest.mark.parametrize('definition, where, params', [
+    ('city = a or city = b and active = no',
+     '(city = ? OR (city = ? AND is_active = ?))', ['a', 'b', 0]),
+    ('city = a and city = b or active = no',
+     '((city = ? AND city = ?) OR is_active = ?)', ['a', 'b', 0]),
+    ('(city = a or city = b) and active = no',
+     '((city = ? OR city = ?) AND is_active = ?)', ['a', 'b', 0]),
+    ('not city = a and active = yes',
+     '(NOT city = ? AND is_active = ?)', ['a', 1]),
+    ('not (city = a or city = b)',
+     'NOT (city = ? OR city = ?)', ['a', 'b']),
+    ('CITY = a AND NOT active = no',
+     '(city = ? AND NOT is_active = ?)', ['a', 0]),
+])
+def test_and_binds_tighter_than_or_and_not_tighter_than_and(definition, where, params):
+    assert compile_at_now(definition) == (where, params)
+
+
+def test_in_and_not_in():
+    assert compile_at_now('user_id in (1, 22,333)') == ('user_id IN (?, ?, ?)', [1, 22, 333])
+    assert compile_at_now('role not in (admin, super_admin)') == (
+        'role NOT IN (?, ?)', ['admin', 'super_admin'])
+    assert compile_at_now('province in ("خراسان رضوی")') == ('province IN (?)', ['خراسان رضوی'])
+
+
+@pytest.mark.parametrize('definition', [
+    'user_id in ()',
+    'user_id in (1, 2',
+    'user_id in 1',
+    'city not = a',
+])
+def test_malformed_lists_are_rejected(definition):
+    with pytest.raises(SegmentError):
+        compile_at_now(definition)
+
+
+def test_contains_escapes_like_wildcards():
+    where, params = compile_at_now(r'first_name contains "50%_off\"')
+    assert where == "first_name LIKE ? ESCAPE '\\'"
+    assert params == ['%50\\%\\_off\\\\%']
+
+
+def test_contains_matches_wildcards_literally():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE users (first_name TEXT)')
+    conn.executemany('INSERT INTO users VALUES (?)',
+                     [('50%_off',), ('500 off',), ('50x off',), ('spam t.me/x',)])
+
+    def matches(definition):
+        where, params = compile_at_now(definition)
+        return [row[0] for row in conn.execute(f'SELECT first_name FROM users WHERE {where}', params)]
+
+    assert matches('first_name contains "50%_"') == ['50%_off']
+    assert matches('first_name contains "_"') == ['50%_off']
+    assert matches('first_name contains "t.me/"') == ['spam t.me/x']
+
+
+def test_dates_accept_days_and_ages():
+    assert compile_at_now('joined within 30d') == ('created_at >= ?', ['2026-01-01 12:00:00'])
+    assert compile_at_now('last_seen >= 2026-01-01') == ('last_seen >= ?', ['2026-01-01'])
+    assert compile_at_now('seen within 2h') == ('last_seen >= ?', ['2026-01-31 10:00:00'])
+
+
+@pytest.mark.parametrize('definition', [
+    'nickname = bob',
+    'users = 1',
+    '"city" = a',
+])
+def test_unknown_fields_are_rejected(definition):
+    with pytest.raises(SegmentError, match='unknown field'):
+        compile_at_now(definition)
+
+
+@pytest.mark.parametrize('definition, message', [
+    ('user_id = 12a', 'expected a number'),
+    ('interactions >= -1', 'expected a number'),
+    ('active = maybe', 'expected yes or no'),
+    ('role = owner', 'unknown role'),
+    ('role > admin', 'only supports = and !='),
+    ('active < yes', 'only supports = and !='),
+    ('joined = yesterday', 'expected a date'),
+    ('joined within 30', 'expected a date'),
+    ('joined within 2026-1-1', 'expected a date'),
+    ('user_id contains 1', "'contains' only applies to text"),
+    ('city within 30d', "'within' only applies to dates"),
+])
+def test_bad_values_are_rejected_per_field_kind(definition, message):
+    with pytest.raises(SegmentError, match=message):
+        compile_at_now(definition)
+
+
+@pytest.mark.parametrize('definition', [
+    '',
+    'city =',
+    'city = a and',
+    'city = a)',
+    'city = a; DROP TABLE users',
+    'city a',
+])
+def test_incomplete_or_trailing_input_is_rejected(definition):
+    with pytest.raises(SegmentError):
+        compile_at_now(definition)
+
+
+def test_values_never_reach_the_sql_text():
+    where, params = compile_at_now('city = "x\' OR 1=1 --" or first_name contains "\'); DROP"')
+    assert where == "(city = ? OR first_name LIKE ? ESCAPE '\\')"
+    assert params == ["x' OR 1=1 --", "%'); DROP%"]
@@ -0,0 +1,49 @@
+"""
+Phone and name normalization: every common way of writing an Iranian
+mobile number must reach the same E.164 value.
+"""
+
+import pytest
+
+from validators import is_valid_phone, normalize_persian, normalize_phone
+
+
+@pytest.mark.parametrize('phone', [
+    '09121234567',
+    '9121234567',
+    '+989121234567',
+    '989121234567',
+    '00989121234567',
+    '+98 912 123 4567',
+    '0912-123-4567',
+    '(0912) 123 4567',
+    '۰۹۱۲۱۲۳۴۵۶۷',
+    '+۹۸۹۱۲۱۲۳۴۵۶۷',
+    '٠٩١٢١٢٣٤٥٦٧',
+])
+def test_mobile_forms_normalize_to_e164(phone):
+    assert normalize_phone(phone) == '+989121234567'
+    assert is_valid_phone(phone)
+
+
+@pytest.mark.parametrize('phone', [
+    None,
+    '',
+    '02112345678',
+    '0912123456',
+    '091212345678',
+    '+19121234567',
+    '0098021234567',
+    '+98 0912 123 4567',
+    'phone',
+])
+def test_other_numbers_are_rejected(phone):
+    assert normalize_phone(phone) is None
+    assert not is_valid_phone(phone)
+
+
+def test_persian_text_folds_letters_digits_and_spaces():
+    assert normalize_persian('  علي  كريمي ۱۲ ') == 'علی کریمی 12'
+    assert normalize_persian('مـحمد') == 'محمد'
+    assert normalize_persian('') == ''
+    assert normalize_persian(None) is None
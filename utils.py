@@ -1,8 +1,16 @@
+import functools
 import logging
-import re
-from typing import Optional, Dict, Any, List
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Callable
 from telebot import types
-from config import Messages, PROVINCES, PROVINCE_CITIES, ContentCategory, UserRole
+from validators import is_valid_phone, is_valid_name, sanitize_text
+from config import (
+    Messages, MenuButtons, PROVINCES, PROVINCE_CITIES, ContentCategory, UserRole, RESTRICTED_CATEGORIES
+)
 from database import DatabaseManager
 
 logger = logging.getLogger(__name__)
@@ -16,29 +24,13 @@ class InputValidator:
     
     @staticmethod
     def validate_phone_number(phone: str) -> bool:
-        """Validate phone number format"""
-        # Remove all non-digit characters
-        clean_phone = re.sub(r'\D', '', phone)
-        
-        # Handle different formats
-        if clean_phone.startswith('98'):
-            # Remove country code
-            clean_phone = clean_phone[2:]
-        elif clean_phone.startswith('+98'):
-            # Remove country code with +
-            clean_phone = clean_phone[3:]
-        
-        # Check if it's a valid Iranian phone number
-        return len(clean_phone) >= 10 and clean_phone.startswith(('09', '9'))
+        """Validate an Iranian mobile number in any common format"""
+        return is_valid_phone(phone)
     
     @staticmethod
     def validate_name(name: str) -> bool:
         """Validate name (Persian/English letters only)"""
-        if not name or len(name.strip()) < 2:
-            return False
-        # Allow Persian and English letters, spaces, and common Persian characters
-        pattern = r'^[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFFa-zA-Z\s\u200C\u200D]+$'
-        return bool(re.match(pattern, name.strip()))
+        return is_valid_name(name)
     
     @staticmethod
     def validate_province(province: str) -> bool:
@@ -56,10 +48,7 @@ class InputValidator:
     @staticmethod
     def sanitize_text(text: str) -> str:
         """Sanitize text input"""
-        if not text:
-            return ""
-        # Remove excessive whitespace and normalize
-        return re.sub(r'\s+', ' ', text.strip())
+        return sanitize_text(text)
     
     @staticmethod
     def validate_content_text(text: str) -> bool:
@@ -68,10 +57,48 @@ class InputValidator:
             return False
         return len(text.strip()) <= 1000  # Max 1000 characters
 
+class FrozenMarkup(types.JsonSerializable):
+    """Keyboard markup serialized once; telebot sends the cached JSON as is"""
+    
+    def __init__(self, markup: types.JsonSerializable):
+        self.markup = markup
+        self.json = markup.to_json()
+    
+    def to_json(self) -> str:
+        return self.json
+    
+    def __getattr__(self, name):
+        if name == 'markup':
+            raise AttributeError(name)
+        return getattr(self.markup, name)
+
+# Every static keyboard, so they can all be built up front
+STATIC_KEYBOARDS = []
+
+def static_keyboard(builder):
+    """Build a keyboard once and reuse its serialized JSON on every send"""
+    cached_builder = functools.lru_cache(maxsize=None)(lambda: FrozenMarkup(builder()))
+    
+    @functools.wraps(builder)
+    def get_keyboard() -> FrozenMarkup:
+        return cached_builder()
+    
+    get_keyboard.build = builder
+    STATIC_KEYBOARDS.append(get_keyboard)
+    return get_keyboard
+
 class KeyboardManager:
     """Manages keyboard layouts and UI components"""
     
     @staticmethod
+    def warm_up() -> int:
+        """Build and serialize every static keyboard"""
+        for get_keyboard in STATIC_KEYBOARDS:
+            get_keyboard()
+        return len(STATIC_KEYBOARDS)
+    
+    @staticmethod
+    @static_keyboard
     def get_phone_request_keyboard() -> types.ReplyKeyboardMarkup:
         """Get phone request keyboard"""
         markup = types.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
@@ -80,6 +107,7 @@ class KeyboardManager:
         return markup
     
     @staticmethod
+    @static_keyboard
     def get_province_keyboard() -> types.ReplyKeyboardMarkup:
         """Get province selection keyboard"""
         markup = types.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
@@ -95,6 +123,7 @@ class KeyboardManager:
         return markup
     
     @staticmethod
+    @static_keyboard
     def get_main_menu_keyboard() -> types.ReplyKeyboardMarkup:
         """Get professional main menu keyboard"""
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False)
@@ -104,10 +133,10 @@ class KeyboardManager:
         
         # Music content section
         markup.row(
-            types.KeyboardButton("🔥 پر بازدید ترین ترک ها"),
-            types.KeyboardButton("💰 پکیج اقتصادی")
+            types.KeyboardButton(MenuButtons.TOP_TRACKS),
+            types.KeyboardButton(MenuButtons.ECONOMIC_PACKAGE)
         )
-        markup.row(types.KeyboardButton("👑 پکیج مگاهیت VIP"))
+        markup.row(types.KeyboardButton(MenuButtons.VIP_PACKAGE))
         
         # Services section
         markup.row(
@@ -121,6 +150,7 @@ class KeyboardManager:
         return markup
     
     @staticmethod
+    @static_keyboard
     def get_admin_choice_keyboard() -> types.ReplyKeyboardMarkup:
         """Get professional admin choice keyboard"""
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False)
@@ -140,6 +170,7 @@ class KeyboardManager:
         return markup
     
     @staticmethod
+    @static_keyboard
     def get_admin_panel_keyboard() -> types.ReplyKeyboardMarkup:
         """Get comprehensive admin panel keyboard"""
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False)
@@ -158,21 +189,21 @@ class KeyboardManager:
         markup.row(types.KeyboardButton("📁 مدیریت محتوا"))
         
         # Top Tracks Content
-        markup.row(types.KeyboardButton("🔥 پر بازدید ترین ترک ها"))
+        markup.row(types.KeyboardButton(MenuButtons.TOP_TRACKS))
         markup.row(
             types.KeyboardButton("🎵 افزودن موزیک"),
             types.KeyboardButton("📝 افزودن متن")
         )
         
         # Economic Package Content
-        markup.row(types.KeyboardButton("💰 پکیج اقتصادی"))
+        markup.row(types.KeyboardButton(MenuButtons.ECONOMIC_PACKAGE))
         markup.row(
             types.KeyboardButton("🎵 افزودن موزیک"),
             types.KeyboardButton("📝 افزودن متن")
         )
         
         # VIP Package Content
-        markup.row(types.KeyboardButton("👑 پکیج مگاهیت VIP"))
+        markup.row(types.KeyboardButton(MenuButtons.VIP_PACKAGE))
         markup.row(
             types.KeyboardButton("🎵 افزودن موزیک"),
             types.KeyboardButton("📝 افزودن متن")
@@ -191,6 +222,7 @@ class KeyboardManager:
         return markup
     
     @staticmethod
+    @static_keyboard
     def get_user_panel_keyboard() -> types.ReplyKeyboardMarkup:
         """Get comprehensive user panel keyboard"""
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False)
@@ -200,10 +232,10 @@ class KeyboardManager:
         
         # Music Content Section
         markup.row(
-            types.KeyboardButton("🔥 پر بازدید ترین ترک ها"),
-            types.KeyboardButton("💰 پکیج اقتصادی")
+            types.KeyboardButton(MenuButtons.TOP_TRACKS),
+            types.KeyboardButton(MenuButtons.ECONOMIC_PACKAGE)
         )
-        markup.row(types.KeyboardButton("👑 پکیج مگاهیت VIP"))
+        markup.row(types.KeyboardButton(MenuButtons.VIP_PACKAGE))
         
         # User Services
         markup.row(
@@ -224,6 +256,7 @@ class KeyboardManager:
         return markup
     
     @staticmethod
+    @static_keyboard
     def get_content_management_keyboard() -> types.ReplyKeyboardMarkup:
         """Get content management keyboard"""
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False)
@@ -234,10 +267,10 @@ class KeyboardManager:
         # Content Categories
         markup.row(types.KeyboardButton("📁 دسته‌بندی محتوا"))
         markup.row(
-            types.KeyboardButton("🔥 پر بازدید ترین ترک ها"),
-            types.KeyboardButton("💰 پکیج اقتصادی")
+            types.KeyboardButton(MenuButtons.TOP_TRACKS),
+            types.KeyboardButton(MenuButtons.ECONOMIC_PACKAGE)
         )
-        markup.row(types.KeyboardButton("👑 پکیج مگاهیت VIP"))
+        markup.row(types.KeyboardButton(MenuButtons.VIP_PACKAGE))
         
         # Content Actions
         markup.row(types.KeyboardButton("➕ افزودن محتوا"))
@@ -263,6 +296,7 @@ class KeyboardManager:
         return markup
     
     @staticmethod
+    @static_keyboard
     def get_system_settings_keyboard() -> types.ReplyKeyboardMarkup:
         """Get system settings keyboard"""
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False)
@@ -313,9 +347,10 @@ class KeyboardManager:
         return markup
     
     @staticmethod
-    def get_user_list_keyboard(users: List[Dict[str, Any]], page: int = 1, total_pages: int = 1, search: str = None) -> types.InlineKeyboardMarkup:
+    def get_user_list_keyboard(users: List[Dict[str, Any]], page: int = 1, total_pages: int = 1, state_token: str = None) -> types.InlineKeyboardMarkup:
         """Get professional user list keyboard with glass buttons"""
         markup = types.InlineKeyboardMarkup()
+        token = state_token or ''
         
         # Add user buttons (glass effect simulation with emojis)
         for user in users:
@@ -328,24 +363,24 @@ class KeyboardManager:
             button_text = f"🔮 {role_emoji} {name} | {province}"
             markup.row(types.InlineKeyboardButton(button_text, callback_data=f"user_detail_{user_id}"))
         
-        # Add pagination controls
+        # Add pagination controls; search state lives server-side behind the token
         if total_pages > 1:
             nav_buttons = []
             
             if page > 1:
-                nav_buttons.append(types.InlineKeyboardButton("⬅️ قبلی", callback_data=f"user_list_{page-1}_{search or ''}"))
+                nav_buttons.append(types.InlineKeyboardButton("⬅️ قبلی", callback_data=f"user_list_{page-1}_{token}"))
             
             nav_buttons.append(types.InlineKeyboardButton(f"📄 {page}/{total_pages}", callback_data="user_list_info"))
             
             if page < total_pages:
-                nav_buttons.append(types.InlineKeyboardButton("بعدی ➡️", callback_data=f"user_list_{page+1}_{search or ''}"))
+                nav_buttons.append(types.InlineKeyboardButton("بعدی ➡️", callback_data=f"user_list_{page+1}_{token}"))
             
             markup.row(*nav_buttons)
         
         # Add search and refresh buttons
         markup.row(
             types.InlineKeyboardButton("🔍 جستجو", callback_data="user_search"),
-            types.InlineKeyboardButton("🔄 بروزرسانی", callback_data=f"user_list_{page}_{search or ''}")
+            types.InlineKeyboardButton("🔄 بروزرسانی", callback_data=f"user_list_{page}_{token}")
         )
         
         return markup
@@ -380,6 +415,7 @@ class KeyboardManager:
         return markup
     
     @staticmethod
+    @static_keyboard
     def get_user_search_keyboard() -> types.InlineKeyboardMarkup:
         """Get user search keyboard"""
         markup = types.InlineKeyboardMarkup()
@@ -396,6 +432,55 @@ class KeyboardManager:
         
         return markup
 
+    @staticmethod
+    @static_keyboard
+    def get_tools_keyboard() -> types.InlineKeyboardMarkup:
+        """Get system tools keyboard"""
+        markup = types.InlineKeyboardMarkup()
+        
+        markup.row(
+            types.InlineKeyboardButton("👥 خروجی کاربران", callback_data="export_users"),
+            types.InlineKeyboardButton("🎵 خروجی محتوا", callback_data="export_contents")
+        )
+        markup.row(types.InlineKeyboardButton("📥 ورود کاربران از CSV", callback_data="import_users"))
+        
+        return markup
+
+    @staticmethod
+    def get_bulk_confirm_keyboard(token: str) -> types.InlineKeyboardMarkup:
+        """Get confirm/cancel buttons for a previewed bulk action"""
+        markup = types.InlineKeyboardMarkup()
+        markup.row(
+            types.InlineKeyboardButton("✅ تایید", callback_data=f"bulk_confirm_{token}"),
+            types.InlineKeyboardButton("❌ لغو", callback_data=f"bulk_cancel_{token}")
+        )
+        return markup
+
+    @staticmethod
+    def get_inline_search_results(contents: List[Dict[str, Any]]) -> List[types.InlineQueryResultBase]:
+        """Build inline query results for catalog search"""
+        results = []
+        
+        for content in contents:
+            result_id = str(content['id'])
+            title = content.get('title') or content['content'][:64]
+            description = content.get('category_display_name') or ''
+            
+            if content.get('file_id') and content.get('file_type') == 'audio':
+                results.append(types.InlineQueryResultCachedAudio(
+                    result_id, content['file_id'], caption=title))
+            elif content.get('file_id'):
+                # Legacy uploads without file_type were always sent as documents
+                results.append(types.InlineQueryResultCachedDocument(
+                    result_id, content['file_id'], title, description=description))
+            else:
+                results.append(types.InlineQueryResultArticle(
+                    result_id, title,
+                    types.InputTextMessageContent(content['content']),
+                    description=description))
+        
+        return results
+
 class MessageFormatter:
     """Handles message formatting and templates"""
     
@@ -463,7 +548,6 @@ class MessageFormatter:
         created_at = user.get('created_at', 'نامشخص')
         if created_at != 'نامشخص':
             try:
-                from datetime import datetime
                 if isinstance(created_at, str):
                     created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
                 created_at = created_at.strftime('%Y/%m/%d %H:%M')
@@ -525,6 +609,162 @@ class MessageFormatter:
         
         return result.strip()
     
+    @staticmethod
+    def format_query_stats(rows: List[Dict[str, Any]], order_by: str) -> str:
+        """Format SQL profiler statistics (plain text, SQL is not Markdown safe)"""
+        if not rows:
+            return "📊 هنوز کوئری‌ای ثبت نشده است."
+        
+        result = f"📊 پرهزینه‌ترین کوئری‌ها (بر اساس {order_by}):\n\n"
+        for index, row in enumerate(rows, 1):
+            sql = row['sql'] if len(row['sql']) <= 160 else row['sql'][:157] + '...'
+            result += (
+                f"{index}. {sql}\n"
+                f"   تعداد: {row['count']} | کل: {row['total'] * 1000:.1f}ms | "
+                f"میانگین: {row['avg'] * 1000:.2f}ms | بیشینه: {row['max'] * 1000:.1f}ms | "
+                f"ردیف‌ها: {row['rows']}\n\n"
+            )
+        return result.strip()
+    
+    @staticmethod
+    def format_segment_list(segments: List[Dict[str, Any]]) -> str:
+        """Format saved audience segments (plain text, definitions are not Markdown safe)"""
+        if not segments:
+            return "👥 هنوز بخشی ذخیره نشده است.\n\nبرای ساخت: /segment save <نام> <تعریف>"
+        
+        result = "👥 بخش‌های ذخیره شده:\n\n"
+        for segment in segments:
+            member_count = segment['member_count']
+            count_text = f"{member_count:,}" if member_count is not None else "نامشخص"
+            result += f"• {segment['name']} ({count_text} کاربر)\n  {segment['definition']}\n\n"
+        return result.strip()
+    
+    BULK_ACTION_LABELS = {
+        'ban': '🚫 بن',
+        'unban': '✅ آزادسازی',
+        'promote': '🛡️ ارتقا به ادمین',
+        'demote': '👤 تبدیل به کاربر',
+    }
+    
+    @staticmethod
+    def format_bulk_preview(action: str, target: str, count: int, sample: List[Dict[str, Any]]) -> str:
+        """Format the dry run of a bulk action (plain text, names are not Markdown safe)"""
+        result = (
+            f"⚡ عملیات گروهی: {MessageFormatter.BULK_ACTION_LABELS[action]}\n"
+            f"🎯 {target}\n\n"
+            f"👥 {count:,} کاربر تغییر خواهند کرد."
+        )
+        if sample:
+            result += "\n\nنمونه:\n" + "\n".join(
+                f"• {user.get('first_name') or ''} {user.get('last_name') or ''} ({user['user_id']})"
+                for user in sample)
+        return result
+    
+    @staticmethod
+    def format_admin_actions(actions: List[Dict[str, Any]]) -> str:
+        """Format the bulk action audit log (plain text, targets are not Markdown safe)"""
+        if not actions:
+            return "⚡ هنوز عملیات گروهی انجام نشده است."
+        
+        result = "⚡ آخرین عملیات‌های گروهی:\n\n"
+        for action in actions:
+            label = MessageFormatter.BULK_ACTION_LABELS.get(action['action'], action['action'])
+            created_at = datetime.fromisoformat(action['created_at']).strftime('%Y/%m/%d %H:%M')
+            result += (
+                f"#{action['id']} {label} | {action['affected_count']:,} کاربر\n"
+                f"   🎯 {action['target']}\n"
+                f"   👤 {action['admin_id']} | 📅 {created_at}\n\n"
+            )
+        return result.strip()
+    
+    @staticmethod
+    def format_upload_summary(category_display: str, titles: List[str]) -> str:
+        """Format the confirmation of a batch upload (plain text, titles are not Markdown safe)"""
+        result = f"✅ {len(titles)} فایل به «{category_display}» اضافه شد:\n\n"
+        result += "\n".join(f"{index}. {title}" for index, title in enumerate(titles[:50], start=1))
+        if len(titles) > 50:
+            result += f"\n... و {len(titles) - 50} فایل دیگر"
+        return result
+    
+    @staticmethod
+    def format_job_list(jobs: List[Dict[str, Any]]) -> str:
+        """Format scheduled messages (plain text, message text is not Markdown safe)"""
+        if not jobs:
+            return "⏰ پیام زمان‌بندی شده‌ای وجود ندارد."
+        
+        status_labels = {
+            'pending': '⏳ در انتظار',
+            'running': '📤 در حال ارسال',
+            'done': '✅ ارسال شده',
+            'failed': '❌ ناموفق',
+            'missed': '⚠️ از دست رفته',
+            'cancelled': '🚫 لغو شده',
+        }
+        result = "⏰ پیام‌های زمان‌بندی شده:\n\n"
+        for job in jobs:
+            run_at = datetime.fromtimestamp(job['run_at']).strftime('%Y/%m/%d %H:%M')
+            preview = job['message'] if len(job['message']) <= 40 else job['message'][:37] + '...'
+            result += (
+                f"#{job['id']} {status_labels.get(job['status'], job['status'])} | {run_at}\n"
+                f"   🎯 {job['target']} | 📤 {job['sent_count'] or 0} | ❌ {job['failed_count'] or 0}\n"
+                f"   💬 {preview}\n\n"
+            )
+        return result.strip()
+    
+    @staticmethod
+    def format_rollup_report(totals: Dict[tuple, int], start_day: str, end_day: str,
+                             category_names: Dict[str, str]) -> str:
+        """Format a daily rollups report for a range of days"""
+        def metric_rows(metric: str) -> List[tuple]:
+            rows = [(dimension, value) for (name, dimension), value in totals.items() if name == metric]
+            return sorted(rows, key=lambda row: row[1], reverse=True)
+        
+        registrations = metric_rows('registrations')
+        views = dict(metric_rows('views'))
+        plays = dict(metric_rows('plays'))
+        admin_messages = dict(metric_rows('admin_messages'))
+        errors = metric_rows('errors')
+        
+        result = f"📋 گزارش {start_day} تا {end_day}\n\n"
+        result += f"👥 ثبت‌نام‌ها: {sum(value for _, value in registrations):,} نفر\n"
+        for province, value in registrations[:5]:
+            result += f"• {province or 'نامشخص'}: {value:,}\n"
+        
+        result += "\n👁️ بازدید / پخش محتوا:\n"
+        for category in sorted(set(views) | set(plays)):
+            result += (f"• {category_names.get(category, category)}: "
+                       f"{views.get(category, 0):,} / {plays.get(category, 0):,}\n")
+        if not views and not plays:
+            result += "• بدون بازدید\n"
+        
+        result += (f"\n📨 پیام‌های ادمین: {sum(admin_messages.values()):,} "
+                   f"(مستقیم {admin_messages.get('direct', 0):,}، "
+                   f"زمان‌بندی شده {admin_messages.get('scheduled', 0):,})\n")
+        result += f"❌ خطاها: {sum(value for _, value in errors):,}\n"
+        for handler, value in errors[:3]:
+            result += f"• {handler}: {value:,}\n"
+        return result.strip()
+    
+    @staticmethod
+    def format_import_report(report: Dict[str, Any]) -> str:
+        """Format the result of a bulk user import"""
+        if report.get('fatal'):
+            return f"❌ ورود کاربران انجام نشد.\n\n{report['fatal']}"
+        
+        result = (
+            f"📥 ورود کاربران انجام شد\n\n"
+            f"📄 ردیف‌ها: {report['rows']:,}\n"
+            f"➕ کاربران جدید: {report['inserted']:,}\n"
+            f"🔄 به‌روزرسانی شده: {report['updated']:,}\n"
+            f"❌ خطاها: {report['errors']:,}\n"
+            f"⏱️ زمان: {report['elapsed']:.1f} ثانیه ({report['rows_per_second']:,.0f} ردیف در ثانیه)"
+        )
+        if report['error_samples']:
+            result += "\n\nنمونه خطاها:\n"
+            for line_number, user_id, error in report['error_samples']:
+                result += f"• سطر {line_number} ({user_id or '-'}): {error}\n"
+        return result.strip()
+    
     @staticmethod
     def format_error_message(error_type: str = "general") -> str:
         """Format error messages"""
@@ -614,3 +854,436 @@ class SessionManager:
     def clear_admin_session(self, user_id: int) -> bool:
         """Clear admin session"""
         return self.db.clear_session(user_id)
+
+class TTLCache:
+    """Small thread-safe cache whose entries expire after a fixed time"""
+    
+    def __init__(self, ttl_seconds: float, max_size: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        """Get a cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+    
+    def set(self, key, value):
+        """Cache a value, evicting the oldest entry when full"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def delete(self, key):
+        """Drop one cached value"""
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        """Drop all cached values"""
+        with self._lock:
+            self._data.clear()
+
+class RecentIdSet:
+    """Bounded set that remembers only the most recently added ids"""
+    
+    def __init__(self, max_size: int):
+        self._order = deque()
+        self._ids = set()
+        self.max_size = max_size
+        self._lock = threading.Lock()
+    
+    def add(self, item) -> bool:
+        """Add an id; return False if it was already present"""
+        with self._lock:
+            if item in self._ids:
+                return False
+            self._ids.add(item)
+            self._order.append(item)
+            if len(self._order) > self.max_size:
+                self._ids.discard(self._order.popleft())
+            return True
+
+class CallbackStateStore:
+    """Maps short callback tokens to server-side state (search query, results)"""
+    
+    PURGE_EVERY = 100
+    
+    def __init__(self, db_manager: DatabaseManager, ttl_seconds: int):
+        self.db = db_manager
+        self.ttl_seconds = ttl_seconds
+        self._cache = TTLCache(ttl_seconds)
+        self._created = 0
+    
+    def create(self, state: Dict[str, Any]) -> str:
+        """Store state and return the token to put in callback_data"""
+        token = secrets.token_hex(5)
+        self._cache.set(token, state)
+        self.db.save_callback_state(token, state, self.ttl_seconds)
+        
+        self._created += 1
+        if self._created % self.PURGE_EVERY == 0:
+            self.db.purge_callback_states()
+        return token
+    
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Get the state behind a token, or None if unknown or expired"""
+        if not token:
+            return None
+        state = self._cache.get(token)
+        if state is None:
+            state = self.db.get_callback_state(token)
+            if state is not None:
+                self._cache.set(token, state)
+        return state
+    
+    def consume(self, token: str) -> Optional[Dict[str, Any]]:
+        """Get the state behind a one-shot token and invalidate it; only one caller wins"""
+        state = self.get(token)
+        if state is None:
+            return None
+        self._cache.delete(token)
+        return state if self.db.delete_callback_state(token) else None
+
+class RateLimiter:
+    """Per-user token buckets for each action class, with coalescing of repeated requests"""
+    
+    ALLOW = 'allow'
+    DUPLICATE = 'duplicate'
+    THROTTLED = 'throttled'
+    PRUNE_EVERY = 1000
+    
+    def __init__(self, limits: Dict[str, tuple], coalesce_window: float, notice_interval: float):
+        self.limits = limits
+        self.coalesce_window = coalesce_window
+        self.notice_interval = notice_interval
+        self._buckets = {}
+        self._last_requests = {}
+        self._last_notices = {}
+        self._checks = 0
+        self._lock = threading.Lock()
+    
+    def check(self, user_id: int, action: str, fingerprint: Optional[str] = None) -> str:
+        """Spend a token for this user and action; returns ALLOW, DUPLICATE or THROTTLED"""
+        now = time.monotonic()
+        key = (user_id, action)
+        with self._lock:
+            self._checks += 1
+            if self._checks % self.PRUNE_EVERY == 0:
+                self._prune(now)
+            
+            # The same button or text again within the window is one request
+            if fingerprint is not None:
+                last = self._last_requests.get(key)
+                self._last_requests[key] = (fingerprint, now)
+                if last and last[0] == fingerprint and now - last[1] < self.coalesce_window:
+                    return self.DUPLICATE
+            
+            capacity, refill_rate = self.limits.get(action, self.limits['default'])
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return self.THROTTLED
+            self._buckets[key] = (tokens - 1, now)
+            return self.ALLOW
+    
+    def should_notify(self, user_id: int) -> bool:
+        """True at most once per notice interval for each user"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_notices.get(user_id)
+            if last is not None and now - last < self.notice_interval:
+                return False
+            self._last_notices[user_id] = now
+            return True
+    
+    def _prune(self, now: float):
+        """Forget users whose buckets have refilled and whose windows have passed"""
+        for key, (tokens, updated_at) in list(self._buckets.items()):
+            capacity, refill_rate = self.limits.get(key[1], self.limits['default'])
+            if tokens + (now - updated_at) * refill_rate >= capacity:
+                del self._buckets[key]
+        for key, (_, seen_at) in list(self._last_requests.items()):
+            if now - seen_at >= self.coalesce_window:
+                del self._last_requests[key]
+        for user_id, noticed_at in list(self._last_notices.items()):
+            if now - noticed_at >= self.notice_interval:
+                del self._last_notices[user_id]
+
+class StartupTimer:
+    """Records how long each startup phase took, up to the first handled update"""
+    
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at or time.perf_counter()
+        self.phases = []
+        self.finished = False
+        self._last = self.started_at
+        self._lock = threading.Lock()
+    
+    def mark(self, phase: str):
+        """Close the current phase under the given name"""
+        with self._lock:
+            now = time.perf_counter()
+            self.phases.append((phase, now - self._last))
+            self._last = now
+    
+    def finish(self, phase: str = 'first update') -> Optional[str]:
+        """Close the last phase once and return the report; None if already finished"""
+        with self._lock:
+            if self.finished:
+                return None
+            self.finished = True
+        self.mark(phase)
+        return self.report()
+    
+    def report(self) -> str:
+        """One-line summary, e.g. 'imports 180ms, database 2ms ... total 1.2s'"""
+        phases = ', '.join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases)
+        return f"{phases}; total {self._last - self.started_at:.2f}s"
+
+class PeriodicFlusher:
+    """Base for in-memory buffers that a daemon thread writes out every flush_interval seconds"""
+    
+    THREAD_NAME = 'PeriodicFlush'
+    # Run the first flush as soon as the thread starts instead of after one interval
+    FLUSH_ON_START = False
+    
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Flush on a background thread every flush_interval seconds"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.THREAD_NAME, daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Stop the flush thread and write out whatever is buffered"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval)
+            self._thread = None
+        self.flush()
+    
+    def flush(self) -> bool:
+        """Write out buffered data; False keeps it for the next flush"""
+        raise NotImplementedError
+    
+    def _tick(self):
+        """Periodic work of the background thread"""
+        self.flush()
+    
+    def _run(self):
+        timeout = 0 if self.FLUSH_ON_START else self.flush_interval
+        while not self._stop_event.wait(timeout):
+            try:
+                self._tick()
+            except Exception as e:
+                logger.error(f"Error in {self.THREAD_NAME} thread: {e}")
+            timeout = self.flush_interval
+
+class ViewCounter(PeriodicFlusher):
+    """Buffers content views/plays in memory and keeps a live most-played ranking"""
+    
+    THREAD_NAME = 'ViewCounterFlush'
+    
+    def __init__(self, db_manager: DatabaseManager, flush_interval: float, flush_batch: int, top_n: int):
+        super().__init__(flush_interval)
+        self.db = db_manager
+        self.flush_batch = flush_batch
+        # Keep spare entries so deactivated tracks can be skipped without a reload
+        self.top_size = top_n * 2
+        self._pending = {}
+        self._pending_events = 0
+        self._plays = {}
+        self._top = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._reload_ranking()
+    
+    def record(self, content: Dict[str, Any], played: bool = False):
+        """Count one delivery of a content row; plays of tracks also move the ranking"""
+        content_id = content['id']
+        with self._lock:
+            counts = self._pending.setdefault(content_id, [0, 0])
+            counts[0] += 1
+            if played:
+                counts[1] += 1
+                # The row's play_count is what the database had when it was read
+                plays = max(self._plays.get(content_id, 0) + 1,
+                            (content.get('play_count') or 0) + counts[1])
+                self._plays[content_id] = plays
+                self._promote(content_id, plays)
+            self._pending_events += 1
+            flush_now = self._pending_events >= self.flush_batch
+        if flush_now:
+            self.flush()
+    
+    def _promote(self, content_id: int, plays: int):
+        """Move a track up the ranking; counts only grow, so only it can change places"""
+        if content_id not in self._top:
+            if len(self._top) >= self.top_size:
+                if plays <= self._plays.get(self._top[-1], 0):
+                    return
+                self._top.pop()
+            self._top.append(content_id)
+        index = self._top.index(content_id)
+        while index > 0 and self._plays.get(self._top[index - 1], 0) < plays:
+            self._top[index - 1], self._top[index] = self._top[index], self._top[index - 1]
+            index -= 1
+    
+    def top(self, limit: int) -> List[int]:
+        """Content ids of the most played tracks, best first"""
+        with self._lock:
+            return self._top[:limit]
+    
+    def flush(self) -> bool:
+        """Write buffered counts in one batch; keeps them buffered if the write fails"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._pending_events = 0
+            if not pending:
+                return True
+            if not self.db.record_content_views(pending):
+                with self._lock:
+                    for content_id, (views, plays) in pending.items():
+                        counts = self._pending.setdefault(content_id, [0, 0])
+                        counts[0] += views
+                        counts[1] += plays
+                return False
+            # Other worker processes count plays too; pick theirs up from the index
+            self._reload_ranking()
+            return True
+    
+    def _reload_ranking(self):
+        """Rebuild the ranking from the play_count index (no event scan)"""
+        rows = self.db.get_most_played(self.top_size, exclude_categories=RESTRICTED_CATEGORIES)
+        with self._lock:
+            # Only ranked tracks are remembered; others re-enter from their row's play_count
+            self._plays = {
+                row['id']: row['play_count'] + self._pending.get(row['id'], [0, 0])[1] for row in rows
+            }
+            self._top = sorted(self._plays, key=self._plays.get, reverse=True)
+
+class ActivityTracker(PeriodicFlusher):
+    """Coalesces per-user last_seen and interaction counts between periodic flushes"""
+    
+    THREAD_NAME = 'ActivityFlush'
+    
+    def __init__(self, db_manager: DatabaseManager, flush_interval: float, flush_batch: int):
+        super().__init__(flush_interval)
+        self.db = db_manager
+        self.flush_batch = flush_batch
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+    
+    def record(self, user_id: int):
+        """Note one interaction; repeated updates from a user only bump a counter"""
+        now = time.time()
+        with self._lock:
+            entry = self._pending.get(user_id)
+            if entry is None:
+                self._pending[user_id] = [1, now]
+            else:
+                entry[0] += 1
+                entry[1] = now
+            flush_now = len(self._pending) >= self.flush_batch
+        if flush_now:
+            self.flush()
+    
+    def flush(self) -> bool:
+        """Write buffered activity in one transaction; keeps it buffered if the write fails"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return True
+            if not self.db.record_user_activity(pending):
+                with self._lock:
+                    for user_id, (count, last_seen) in pending.items():
+                        entry = self._pending.setdefault(user_id, [0, last_seen])
+                        entry[0] += count
+                        entry[1] = max(entry[1], last_seen)
+                return False
+            return True
+
+
+class UploadBatcher:
+    """Collects files an admin sends in quick succession, such as the parts of an album, into one batch"""
+    
+    def __init__(self, on_batch: Callable[[Any, List[Dict[str, Any]]], None], delay: float):
+        self.on_batch = on_batch
+        self.delay = delay
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+    
+    def start(self):
+        """Deliver batches on one background thread once they have been quiet for delay seconds"""
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='UploadBatcher', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Stop the thread and hand over every open batch right away"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._condition:
+            pending, self._pending = self._pending, {}
+        for key, (_, items) in pending.items():
+            self._deliver(key, items)
+    
+    def add(self, key, item: Dict[str, Any]):
+        """Add a file to key's batch and restart its quiet period"""
+        with self._condition:
+            _, items = self._pending.get(key, (None, []))
+            items.append(item)
+            self._pending[key] = (time.monotonic() + self.delay, items)
+            self._condition.notify()
+    
+    def _next_batch(self) -> Optional[tuple]:
+        """Block until a batch has been quiet for delay seconds or the batcher stops"""
+        with self._condition:
+            while not self._stopping:
+                now = time.monotonic()
+                for key, (deadline, items) in self._pending.items():
+                    if deadline <= now:
+                        del self._pending[key]
+                        return key, items
+                deadlines = [deadline for deadline, _ in self._pending.values()]
+                self._condition.wait(min(deadlines) - now if deadlines else None)
+        return None
+    
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._deliver(*batch)
+    
+    def _deliver(self, key, items: List[Dict[str, Any]]):
+        try:
+            self.on_batch(key, items)
+        except Exception as e:
+            logger.error(f"Error handling upload batch: {e}")
@@ -0,0 +1,57 @@
+"""
+Input normalization and validation
+Patterns are compiled once at import. Phones are stored in E.164
+(+989121234567) and Persian text with Persian digits and letters folded
+to one form, so equal values compare and index equal.
+"""
+
+import re
+from typing import Optional
+
+# Persian (U+06F0..) and Arabic-Indic (U+0660..) digits to ASCII
+_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+# Arabic letter forms Persian keyboards often produce, plus tatweel
+_LETTERS = str.maketrans({'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ـ': None})
+
+_NON_DIGITS = re.compile(r'\D')
+_WHITESPACE = re.compile(r'\s+')
+_NAME = re.compile(r'^[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFFa-zA-Z\s\u200C\u200D]+$')
+# Iranian mobile numbers: 9 followed by nine digits once prefixes are removed
+_MOBILE = re.compile(r'^(?:0098|98|0)?(9\d{9})$')
+
+
+def normalize_digits(text: str) -> str:
+    """Replace Persian and Arabic-Indic digits with ASCII digits"""
+    return text.translate(_DIGITS) if text else text
+
+
+def normalize_persian(text: str) -> str:
+    """Fold digits and Arabic letter variants, trim and collapse whitespace"""
+    if not text:
+        return text
+    return _WHITESPACE.sub(' ', text.translate(_DIGITS).translate(_LETTERS)).strip()
+
+
+def normalize_phone(phone: str) -> Optional[str]:
+    """E.164 form of an Iranian mobile number, or None if it is not one"""
+    if not phone:
+        return None
+    match = _MOBILE.match(_NON_DIGITS.sub('', normalize_digits(phone)))
+    return f"+98{match.group(1)}" if match else None
+
+
+def is_valid_phone(phone: str) -> bool:
+    return normalize_phone(phone) is not None
+
+
+def is_valid_name(name: str) -> bool:
+    """At least two Persian or English letters, spaces and joiners only"""
+    name = normalize_persian(name or '')
+    return len(name) >= 2 and bool(_NAME.match(name))
+
+
+def sanitize_text(text: str) -> str:
+    """Trim and collapse whitespace"""
+    if not text:
+        return ""
+    return _WHITESPACE.sub(' ', text.strip())
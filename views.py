@@ -0,0 +1,89 @@
+import hashlib
+import logging
+from typing import Optional
+
+from telebot import TeleBot, types
+from telebot.apihelper import ApiTelegramException
+
+from utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Bots can edit their messages for 48 hours; stop tracking panels a bit earlier
+PANEL_TTL_SECONDS = 47 * 3600
+
+
+class Panel:
+    """The bot's current editable message in one chat"""
+
+    __slots__ = ('message_id', 'text_digest', 'markup_digest')
+
+    def __init__(self, message_id: int, text_digest: str, markup_digest: str):
+        self.message_id = message_id
+        self.text_digest = text_digest
+        self.markup_digest = markup_digest
+
+
+class PanelManager:
+    """Updates panel messages in place when their inline buttons are pressed"""
+
+    def __init__(self, bot: TeleBot, max_chats: int = 10000):
+        self.bot = bot
+        self._panels = TTLCache(PANEL_TTL_SECONDS, max_chats)
+
+    @staticmethod
+    def _digest(value: Optional[str]) -> str:
+        return hashlib.sha1((value or '').encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _is_editable_markup(reply_markup) -> bool:
+        # Telegram only allows inline keyboards on edited messages
+        markup = getattr(reply_markup, 'markup', reply_markup)
+        return markup is None or isinstance(markup, types.InlineKeyboardMarkup)
+
+    def show(self, chat_id: int, text: str, reply_markup=None,
+             parse_mode: Optional[str] = None, message_id: Optional[int] = None) -> Optional[int]:
+        """Render a panel: edit message_id when given, otherwise send a new panel"""
+        if not self._is_editable_markup(reply_markup):
+            sent = self.bot.send_message(
+                chat_id, text, reply_markup=reply_markup, parse_mode=parse_mode)
+            self.forget(chat_id)
+            return sent.message_id
+
+        text_digest = self._digest(f"{parse_mode}:{text}")
+        markup_digest = self._digest(reply_markup.to_json() if reply_markup else None)
+        panel = self._panels.get(chat_id)
+        # Only a pressed inline button edits, and only its own message; reply-keyboard
+        # buttons and commands get a new panel at the bottom of the chat
+        if message_id:
+            known = panel if panel and panel.message_id == message_id else None
+            try:
+                if known and known.text_digest == text_digest:
+                    if known.markup_digest != markup_digest:
+                        self.bot.edit_message_reply_markup(
+                            chat_id, message_id, reply_markup=reply_markup)
+                    # Otherwise the panel already shows exactly this content
+                else:
+                    self.bot.edit_message_text(
+                        text, chat_id, message_id,
+                        reply_markup=reply_markup, parse_mode=parse_mode)
+                self._remember(chat_id, message_id, text_digest, markup_digest)
+                return message_id
+            except ApiTelegramException as e:
+                if 'message is not modified' in str(e):
+                    self._remember(chat_id, message_id, text_digest, markup_digest)
+                    return message_id
+                # Too old, deleted or otherwise not editable: start a new panel
+                logger.info(f"Panel {message_id} in chat {chat_id} not editable: {e}")
+
+        sent = self.bot.send_message(
+            chat_id, text, reply_markup=reply_markup, parse_mode=parse_mode)
+        self._remember(chat_id, sent.message_id, text_digest, markup_digest)
+        return sent.message_id
+
+    def _remember(self, chat_id: int, message_id: int, text_digest: str, markup_digest: str):
+        self._panels.set(chat_id, Panel(message_id, text_digest, markup_digest))
+
+    def forget(self, chat_id: int):
+        """Stop editing the chat's current panel; the next one is sent fresh"""
+        self._panels.delete(chat_id)